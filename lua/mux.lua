@@ -23,8 +23,64 @@ function M.setup()
         local augroup = vim.api.nvim_create_augroup("MuxApi", {})
         local api = require("mux.api")
         local internal_reg_api = require("mux.api.internal.reg")
+        local internal_vars_api = require("mux.api.internal.vars")
         local types = require("mux.types")
 
+        vim.api.nvim_create_autocmd({ "WinEnter", "BufWinEnter" }, {
+            group = augroup,
+            callback = function()
+                internal_vars_api.publish_invalidation("focus-changed")
+            end,
+        })
+        local defaults_events = { "BufModifiedSet", "BufFilePost", "FileType" }
+        if vim.fn.exists("##TermRequest") == 1 then
+            table.insert(defaults_events, "TermRequest")
+        end
+        vim.api.nvim_create_autocmd(defaults_events, {
+            group = augroup,
+            callback = function(args)
+                internal_vars_api.publish_invalidation(
+                    "defaults-changed",
+                    types.make_location_str("b", args.buf)
+                )
+            end,
+        })
+        require("mux.defaults").on_term_title_changed(function(buffer)
+            internal_vars_api.publish_invalidation(
+                "defaults-changed",
+                types.make_location_str("b", buffer)
+            )
+            -- The session title follows the current buffer
+            if buffer == vim.api.nvim_get_current_buf() then
+                api.publish()
+            end
+        end)
+        vim.api.nvim_create_autocmd("BufWipeout", {
+            group = augroup,
+            callback = function(args)
+                internal_vars_api.publish_invalidation(
+                    "buffer-wiped",
+                    types.make_location_str("b", args.buf)
+                )
+            end,
+        })
+        vim.api.nvim_create_autocmd("WinClosed", {
+            group = augroup,
+            callback = function(args)
+                internal_vars_api.publish_invalidation(
+                    "window-closed",
+                    types.make_location_str("w", tonumber(args.match))
+                )
+            end,
+        })
+        vim.api.nvim_create_autocmd("TabClosed", {
+            group = augroup,
+            callback = function()
+                internal_vars_api.publish_invalidation("tab-closed")
+            end,
+        })
+
+        -- Registered after the invalidations so they reach the server before the publish
         vim.api.nvim_create_autocmd("WinEnter", {
             group = augroup,
             callback = api.publish,
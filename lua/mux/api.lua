@@ -4,6 +4,7 @@ local coproc = require("mux.coproc")
 local types = require("mux.types")
 local api_internal = require("mux.api.internal")
 local notify_api = require("mux.api.internal.notify")
+local internal_vars_api = require("mux.api.internal.vars")
 
 ---Gets the values at the specified locations for a namespace
 ---@param location string
@@ -70,6 +71,11 @@ function M.set(location, namespace, values)
     if result.result == nil then
         error(string.format("Location %s does not exist", location))
     end
+    internal_vars_api.publish_invalidation(
+        "vars-changed",
+        types.make_location_str(scope, id),
+        namespace
+    )
 
     if namespace == "INFO" then
         M.publish()
@@ -98,6 +104,11 @@ function M.merge(location, namespace, values)
     if result.result == nil then
         error(string.format("Location %s does not exist", location))
     end
+    internal_vars_api.publish_invalidation(
+        "vars-changed",
+        types.make_location_str(scope, id),
+        namespace
+    )
 end
 
 ---Merges info into the specified location
@@ -1,17 +1,28 @@
 local vars_api = require("mux.api.internal.vars")
 local reg_api = require("mux.api.internal.reg")
 local notify_api = require("mux.api.internal.notify")
+local tree_api = require("mux.api.internal.tree")
 
 return {
     get_all_vars = vars_api.get_all_vars,
     resolve_all_vars = vars_api.resolve_all_vars,
+    get_multiple_vars = vars_api.get_multiple_vars,
+    resolve_multiple_vars = vars_api.resolve_multiple_vars,
+    resolve_batch = vars_api.resolve_batch,
     set_multiple_vars = vars_api.set_multiple_vars,
     clear_and_replace_vars = vars_api.clear_and_replace_vars,
     get_location_info = vars_api.get_location_info,
+    get_defaults_stats = vars_api.get_defaults_stats,
+    tree_snapshot = tree_api.snapshot,
+    tree_changes_since = tree_api.changes_since,
     register_user_callback = vars_api.register_user_callback,
     get_all_registers = reg_api.get_all_registers,
+    get_multiple_registers = reg_api.get_multiple_registers,
+    get_register_metadata = reg_api.get_register_metadata,
     set_multiple_registers = reg_api.set_multiple_registers,
     clear_and_replace_registers = reg_api.clear_and_replace_registers,
+    stage_register_chunk = reg_api.stage_register_chunk,
+    discard_staged = reg_api.discard_staged,
     add_reg_link = reg_api.add_reg_link,
     remove_reg_link = reg_api.remove_reg_link,
     list_reg_links = reg_api.list_reg_links,
@@ -0,0 +1,48 @@
+local M = {}
+
+---Compiled chunks by source. The server only ever sends a handful of distinct chunks.
+---@type table<string, function>
+local compiled_chunks = {}
+
+---Compiles a lua chunk, reusing a previous compilation if there is one
+---@param lua string
+---@return function
+local function compile(lua)
+    local chunk = compiled_chunks[lua]
+    if chunk == nil then
+        local load_error
+        chunk, load_error = loadstring(lua)
+        if chunk == nil then
+            error(load_error)
+        end
+        compiled_chunks[lua] = chunk
+    end
+    return chunk
+end
+
+---A single queued lua execution
+---@class BatchItem
+---@field lua string
+---@field args any[]
+---@field nargs integer
+
+---Executes a batch of lua chunks in order. A failure only affects its own item.
+---Each output is { true, value } on success or { false, error_message } on failure.
+---@param items BatchItem[]
+---@return [boolean, any][]
+function M.exec_batch(items)
+    local outputs = {}
+    for i, item in ipairs(items) do
+        local success, value = pcall(function()
+            return compile(item.lua)(unpack(item.args, 1, item.nargs))
+        end)
+        if success then
+            outputs[i] = { true, value }
+        else
+            outputs[i] = { false, tostring(value) }
+        end
+    end
+    return outputs
+end
+
+return M
@@ -10,25 +10,116 @@ local internal_types = require("mux.api.internal.types")
 
 local ok, empty_ok = internal_types.ok, internal_types.empty_ok
 
+---Reads a register, with nil for an empty one. The type is checked first, so the contents
+---are only copied out of nvim once.
+---@param vim_name string
+---@return string?
+---@return string?
+local function read_register(vim_name)
+    local regtype = vim.fn.getregtype(vim_name)
+    if regtype == "" then
+        return nil, nil
+    end
+    local value = vim.fn.getreg(vim_name)
+    if value == "" then
+        return nil, nil
+    end
+    return value, regtype
+end
+
 ---Get all register values
 ---@return { result: VariableValues }
 function M.get_all_registers()
     local values = {}
     for _, regname in pairs(types.Regname) do
+        values[regname] = read_register(types.regname_to_vim_name(regname))
+    end
+
+    return ok({ values = values })
+end
+
+---Get the values of only the requested registers
+---@param regnames Regname[]
+---@return { result: VariableValues }
+function M.get_multiple_registers(regnames)
+    local values = {}
+    for _, regname in ipairs(regnames) do
         local vim_name = types.regname_to_vim_name(regname)
-        local lines = vim.fn.getreg(vim_name, 1, 1)
-        if #lines > 0 then
-            values[regname] = vim.fn.getreg(vim_name)
+        if vim_name ~= nil then
+            values[regname] = read_register(vim_name)
         end
     end
 
     return ok({ values = values })
 end
 
+---@class RegisterMetadata
+---@field type string as returned by getregtype
+---@field size integer in bytes
+---@field sha256 string
+
+---Get the type, size and hash of registers without their contents
+---@param regnames Regname[]? all registers when nil
+---@return { result: { registers: table<Regname, RegisterMetadata> } }
+function M.get_register_metadata(regnames)
+    local registers = {}
+    for _, regname in ipairs(regnames or vim.tbl_values(types.Regname)) do
+        local vim_name = types.regname_to_vim_name(regname)
+        if vim_name ~= nil then
+            local value, regtype = read_register(vim_name)
+            if value ~= nil then
+                registers[regname] = {
+                    type = regtype,
+                    size = #value,
+                    sha256 = vim.fn.sha256(value),
+                }
+            end
+        end
+    end
+
+    return ok({ registers = registers })
+end
+
+---Chunks of large register values, sent ahead of the set that uses them
+---@type table<integer, string[]>
+M.staged = {}
+
+---Appends a chunk to a staged register value
+---@param transfer integer
+---@param chunk string
+---@return { result: Empty }
+function M.stage_register_chunk(transfer, chunk)
+    if M.staged[transfer] == nil then
+        M.staged[transfer] = {}
+    end
+    table.insert(M.staged[transfer], chunk)
+    return empty_ok()
+end
+
+---Drops a staged register value that will not be used
+---@param transfer integer
+---@return { result: Empty }
+function M.discard_staged(transfer)
+    M.staged[transfer] = nil
+    return empty_ok()
+end
+
+---Moves staged values into values, joining their chunks
+---@param values table<Regname, string | table>
+---@param staged table<Regname, integer>?
+local function take_staged(values, staged)
+    for regname, transfer in pairs(staged or {}) do
+        values[regname] = table.concat(M.staged[transfer] or {})
+        M.staged[transfer] = nil
+    end
+end
+
 ---Clear and replace this registry
 ---@param values table<Regname, string>
+---@param staged table<Regname, integer>? transfers holding values too large to send whole
 ---@return { result: Empty }
-function M.clear_and_replace_registers(values)
+function M.clear_and_replace_registers(values, staged)
+    take_staged(values, staged)
     local with_deletions = {}
     for _, regname in pairs(types.Regname) do
         if values[regname] == nil then
@@ -43,8 +134,10 @@ end
 
 ---Set multiple register values. A table indicates deletion.
 ---@param values table<Regname, string | table>
+---@param staged table<Regname, integer>? transfers holding values too large to send whole
 ---@return { result: Empty }
-function M.set_multiple_registers(values)
+function M.set_multiple_registers(values, staged)
+    take_staged(values, staged)
     -- Need to hold onto unnamed because deleting a reg implicitly deletes unnamed
     local unnamed_value
     if values["unnamed"] ~= nil then
@@ -85,7 +178,7 @@ function M.remove_reg_link(instance, registry)
         M.links[instance][registry] = M.links[instance][registry] - 1
         if M.links[instance][registry] <= 0 then
             M.links[instance][registry] = nil
-            if #M.links[instance] == 0 then
+            if next(M.links[instance]) == nil then
                 M.links[instance] = nil
             end
         end
@@ -0,0 +1,329 @@
+local M = {}
+
+local defaults = require("mux.defaults")
+local types = require("mux.types")
+local internal_types = require("mux.api.internal.types")
+
+local ok = internal_types.ok
+
+---Removals older than this many are forgotten, and clients that far behind get a full snapshot
+local MAX_REMOVED = 1000
+
+---@class TreeNode
+---@field id string
+---@field parent string?
+---@field info table<string, string>
+---@field user table<string, string>
+---@field current string? the current tab of the session, or current window of a tab
+---@field buffer string? the buffer shown in a window
+---@field defaults table<string, string>? INFO defaults of a buffer
+---@field pid integer? job pid of a terminal buffer
+
+---@class TreeDelta
+---@field version integer
+---@field reset boolean
+---@field changed TreeNode[]
+---@field removed string[]
+
+---Nothing is tracked until the first snapshot, so the tree costs nothing when unused
+local tracking = false
+
+---@type integer
+local version = 0
+
+---Version at which each node last changed
+---@type table<string, integer>
+local changed_at = {}
+
+---@type { id: string, version: integer }[]
+local removed = {}
+
+---Versions at or before this one may have lost removals
+---@type integer
+local forgotten_before = 0
+
+---Canonical id of a location, with 0 meaning the current tab, window or buffer
+---@param scope StandardizedScope
+---@param id integer
+---@return string?
+local function node_id(scope, id)
+    if scope == "s" then
+        return "s:0"
+    end
+    if id == 0 then
+        if scope == "t" then
+            id = vim.api.nvim_get_current_tabpage()
+        elseif scope == "w" then
+            id = vim.api.nvim_get_current_win()
+        elseif scope == "b" then
+            id = vim.api.nvim_get_current_buf()
+        end
+    end
+    return types.make_location_str(scope, id)
+end
+
+---Only listed and terminal buffers are part of the tree
+---@param buffer integer
+---@return boolean
+local function in_tree(buffer)
+    return vim.bo[buffer].buflisted or vim.b[buffer].terminal_job_pid ~= nil
+end
+
+---@param dict LocationDict
+---@param namespace string
+---@return table<string, string>
+local function values_in(dict, namespace)
+    local mux = dict.mux or {}
+    return mux[namespace] or {}
+end
+
+---Builds the node for a location, or nil if it no longer exists
+---@param id string
+---@return TreeNode?
+local function build_node(id)
+    local scope, handle = types.parse_location(id)
+    if scope == "s" then
+        return {
+            id = id,
+            info = values_in(vim.g, "INFO"),
+            user = values_in(vim.g, "USER"),
+            current = node_id("t", vim.api.nvim_get_current_tabpage()),
+        }
+    elseif scope == "t" then
+        if not vim.api.nvim_tabpage_is_valid(handle) then
+            return nil
+        end
+        return {
+            id = id,
+            parent = "s:0",
+            info = values_in(vim.t[handle], "INFO"),
+            user = values_in(vim.t[handle], "USER"),
+            current = node_id("w", vim.api.nvim_tabpage_get_win(handle)),
+        }
+    elseif scope == "w" then
+        if not vim.api.nvim_win_is_valid(handle) then
+            return nil
+        end
+        return {
+            id = id,
+            parent = node_id("t", vim.api.nvim_win_get_tabpage(handle)),
+            info = values_in(vim.w[handle], "INFO"),
+            user = values_in(vim.w[handle], "USER"),
+            buffer = node_id("b", vim.api.nvim_win_get_buf(handle)),
+        }
+    elseif scope == "b" then
+        if not vim.api.nvim_buf_is_valid(handle) or not in_tree(handle) then
+            return nil
+        end
+        return {
+            id = id,
+            info = values_in(vim.b[handle], "INFO"),
+            user = values_in(vim.b[handle], "USER"),
+            defaults = values_in(defaults.get_buffer_defaults(handle), "INFO"),
+            pid = vim.b[handle].terminal_job_pid,
+        }
+    end
+    return nil
+end
+
+---Marks a node as changed
+---@param id string?
+function M.touch(id)
+    if not tracking or id == nil then
+        return
+    end
+    version = version + 1
+    changed_at[id] = version
+end
+
+---Marks a location as changed
+---@param scope StandardizedScope
+---@param id integer
+function M.touch_location(scope, id)
+    if not tracking then
+        return
+    end
+    local location = node_id(scope, id)
+    if scope == "b" and location ~= nil and changed_at[location] == nil then
+        -- Buffers outside the tree are skipped, unless they were in it and have to be removed
+        local buffer = id == 0 and vim.api.nvim_get_current_buf() or id
+        if not vim.api.nvim_buf_is_valid(buffer) or not in_tree(buffer) then
+            return
+        end
+    end
+    M.touch(location)
+end
+
+---Marks a node as removed
+---@param id string
+function M.remove(id)
+    if not tracking then
+        return
+    end
+    version = version + 1
+    changed_at[id] = nil
+    table.insert(removed, { id = id, version = version })
+    if #removed > MAX_REMOVED then
+        forgotten_before = table.remove(removed, 1).version
+    end
+end
+
+---Removes tracked tabs that are no longer valid, since TabClosed doesn't say which one closed
+local function sweep_tabs()
+    for id, _ in pairs(changed_at) do
+        local scope, handle = types.parse_location(id)
+        if scope == "t" and not vim.api.nvim_tabpage_is_valid(handle) then
+            M.remove(id)
+        end
+    end
+end
+
+local function touch_focus()
+    M.touch("s:0")
+    M.touch_location("t", 0)
+    M.touch_location("w", 0)
+end
+
+local function start_tracking()
+    tracking = true
+    local augroup = vim.api.nvim_create_augroup("MuxTree", {})
+    vim.api.nvim_create_autocmd({ "TabNew", "TabEnter", "WinNew", "WinEnter" }, {
+        group = augroup,
+        callback = touch_focus,
+    })
+    vim.api.nvim_create_autocmd("TabClosed", {
+        group = augroup,
+        callback = function()
+            sweep_tabs()
+            M.touch("s:0")
+        end,
+    })
+    vim.api.nvim_create_autocmd("WinClosed", {
+        group = augroup,
+        callback = function(args)
+            local window = tonumber(args.match)
+            if window == nil then
+                return
+            end
+            if vim.api.nvim_win_is_valid(window) then
+                M.touch_location("t", vim.api.nvim_win_get_tabpage(window))
+            end
+            M.remove(types.make_location_str("w", window))
+        end,
+    })
+    vim.api.nvim_create_autocmd("BufWinEnter", {
+        group = augroup,
+        callback = function()
+            M.touch_location("w", 0)
+        end,
+    })
+    -- BufDelete unlists the buffer, which changes_since then reports as removed
+    local buffer_events = {
+        "BufAdd",
+        "BufDelete",
+        "TermOpen",
+        "BufModifiedSet",
+        "BufFilePost",
+        "FileType",
+    }
+    if vim.fn.exists("##TermRequest") == 1 then
+        table.insert(buffer_events, "TermRequest")
+    end
+    vim.api.nvim_create_autocmd(buffer_events, {
+        group = augroup,
+        callback = function(args)
+            M.touch_location("b", args.buf)
+        end,
+    })
+    -- Terminal titles are part of the buffer defaults, but changing one fires no event
+    defaults.on_term_title_changed(function(buffer)
+        M.touch_location("b", buffer)
+    end)
+    vim.api.nvim_create_autocmd("BufWipeout", {
+        group = augroup,
+        callback = function(args)
+            local id = types.make_location_str("b", args.buf)
+            if changed_at[id] ~= nil then
+                M.remove(id)
+            end
+        end,
+    })
+end
+
+---@return string[]
+local function all_node_ids()
+    local ids = { "s:0" }
+    for _, tab in ipairs(vim.api.nvim_list_tabpages()) do
+        table.insert(ids, node_id("t", tab))
+        for _, window in ipairs(vim.api.nvim_tabpage_list_wins(tab)) do
+            table.insert(ids, node_id("w", window))
+        end
+    end
+    for _, buffer in ipairs(vim.api.nvim_list_bufs()) do
+        if in_tree(buffer) then
+            table.insert(ids, node_id("b", buffer))
+        end
+    end
+    return ids
+end
+
+---Returns every node in the tree, along with the version it is current as of
+---@return { result: TreeDelta }
+function M.snapshot()
+    if not tracking then
+        start_tracking()
+    end
+
+    local nodes = {}
+    for _, id in ipairs(all_node_ids()) do
+        local node = build_node(id)
+        if node ~= nil then
+            table.insert(nodes, node)
+            if changed_at[id] == nil then
+                changed_at[id] = version
+            end
+        end
+    end
+    return ok({ version = version, reset = true, changed = nodes, removed = {} })
+end
+
+---Returns the nodes added, modified or removed after a version. Clients that are too far behind
+---for the removals to be known get a full snapshot instead, marked with reset.
+---@param since integer
+---@return { result: TreeDelta }
+function M.changes_since(since)
+    if not tracking or since < forgotten_before or since > version then
+        return M.snapshot()
+    end
+
+    local changed = {}
+    -- Touched nodes that have gone away without a removal event
+    local vanished = {}
+    for id, changed_version in pairs(changed_at) do
+        if changed_version > since then
+            local node = build_node(id)
+            if node ~= nil then
+                table.insert(changed, node)
+            else
+                table.insert(vanished, id)
+            end
+        end
+    end
+
+    local removed_ids = {}
+    for i = #removed, 1, -1 do
+        local removal = removed[i]
+        if removal.version <= since then
+            break
+        end
+        table.insert(removed_ids, removal.id)
+    end
+    for _, id in ipairs(vanished) do
+        M.remove(id)
+        table.insert(removed_ids, id)
+    end
+
+    return ok({ version = version, reset = false, changed = changed, removed = removed_ids })
+end
+
+return M
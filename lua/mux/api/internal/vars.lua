@@ -3,6 +3,8 @@ local M = {}
 local defaults = require("mux.defaults")
 local types = require("mux.types")
 local internal_types = require("mux.api.internal.types")
+local notify_api = require("mux.api.internal.notify")
+local tree = require("mux.api.internal.tree")
 
 local ok, err, location_dne, empty_ok =
     internal_types.ok, internal_types.err, internal_types.location_dne, internal_types.empty_ok
@@ -37,10 +39,12 @@ local function dict_at(scope, id)
     end
 end
 
----Return the variable accessors for a location and it's children
+---Return the variable accessors for a location and it's children, along with the buffer
+---whose defaults apply beneath them
 ---@param scope StandardizedScope
 ---@param id integer
----@return LocationDict?
+---@return LocationDict[]?
+---@return integer?
 local function dicts_under(scope, id)
     if scope == "s" then
         return {
@@ -48,8 +52,7 @@ local function dicts_under(scope, id)
             vim.t[0],
             vim.w[0],
             vim.b[0],
-            defaults.get_buffer_defaults(0),
-        }
+        }, 0
     elseif scope == "t" then
         if not vim.api.nvim_tabpage_is_valid(id) then
             return nil
@@ -60,8 +63,7 @@ local function dicts_under(scope, id)
             vim.t[id],
             vim.w[window],
             vim.b[buffer],
-            defaults.get_buffer_defaults(buffer),
-        }
+        }, buffer
     elseif scope == "w" then
         if not vim.api.nvim_win_is_valid(id) then
             return nil
@@ -70,16 +72,14 @@ local function dicts_under(scope, id)
         return {
             vim.w[id],
             vim.b[buffer],
-            defaults.get_buffer_defaults(buffer),
-        }
+        }, buffer
     elseif scope == "b" then
         if not vim.api.nvim_buf_is_valid(id) then
             return nil
         end
         return {
             vim.b[id],
-            defaults.get_buffer_defaults(id),
-        }
+        }, id
     else
         return nil
     end
@@ -129,10 +129,11 @@ function M.resolve_all_vars(scope, id, namespace)
         return err(location_dne(scope, id))
     end
 
-    local dicts = dicts_under(std_scope, std_id)
-    if dicts == nil then
+    local dicts, buffer = dicts_under(std_scope, std_id)
+    if dicts == nil or buffer == nil then
         return err(location_dne(std_scope, std_id))
     end
+    table.insert(dicts, defaults.get_buffer_defaults(buffer))
 
     local resolved_values = {}
     for _, dict in ipairs(dicts) do
@@ -147,6 +148,95 @@ function M.resolve_all_vars(scope, id, namespace)
     return ok({ values = resolved_values })
 end
 
+---@class ResolveBatchRequest
+---@field scope Scope
+---@field id integer
+---@field namespace string
+
+---Resolves the values of variables at many locations and namespaces in one call
+---@param requests ResolveBatchRequest[]
+---@return { result: { results: ({ result: VariableValues } | { error: NvimError })[] } }
+function M.resolve_batch(requests)
+    local results = {}
+    for i, request in ipairs(requests) do
+        results[i] = M.resolve_all_vars(request.scope, request.id, request.namespace)
+    end
+    return ok({ results = results })
+end
+
+---Gets the values of only the requested variables at the specified location
+---@param scope Scope
+---@param id integer
+---@param namespace string
+---@param keys string[]
+---@return { result: VariableValues } | { error: NvimError }
+function M.get_multiple_vars(scope, id, namespace, keys)
+    local std_scope, std_id = types.standardize_scope(scope, id)
+    if std_scope == nil or std_id == nil then
+        return err(location_dne(scope, id))
+    end
+
+    local dict = dict_at(std_scope, std_id)
+    if dict == nil then
+        return err(location_dne(scope, id))
+    end
+
+    local local_values = coalesce(dict, "mux", namespace)
+    local values = {}
+    for _, key in ipairs(keys) do
+        values[key] = local_values[key]
+    end
+
+    return ok({ values = values })
+end
+
+---Resolves only the requested variables at the specified location. Defaults are only
+---computed if some key is not set explicitly.
+---@param scope Scope
+---@param id integer
+---@param namespace string
+---@param keys string[]
+---@return { result: VariableValues } | { error: NvimError }
+function M.resolve_multiple_vars(scope, id, namespace, keys)
+    local std_scope, std_id = types.standardize_scope(scope, id)
+    if std_scope == nil or std_id == nil then
+        return err(location_dne(scope, id))
+    end
+
+    local dicts, buffer = dicts_under(std_scope, std_id)
+    if dicts == nil or buffer == nil then
+        return err(location_dne(std_scope, std_id))
+    end
+
+    local all_local_values = {}
+    for _, dict in ipairs(dicts) do
+        table.insert(all_local_values, coalesce(dict, "mux", namespace))
+    end
+
+    local resolved_values = {}
+    local unresolved = {}
+    for _, key in ipairs(keys) do
+        for _, local_values in ipairs(all_local_values) do
+            if local_values[key] ~= nil then
+                resolved_values[key] = local_values[key]
+                break
+            end
+        end
+        if resolved_values[key] == nil then
+            table.insert(unresolved, key)
+        end
+    end
+
+    if #unresolved > 0 then
+        local default_values = coalesce(defaults.get_buffer_defaults(buffer), "mux", namespace)
+        for _, key in ipairs(unresolved) do
+            resolved_values[key] = default_values[key]
+        end
+    end
+
+    return ok({ values = resolved_values })
+end
+
 ---Clears out the existing values and replaces them
 ---@param scope Scope
 ---@param id integer
@@ -168,6 +258,7 @@ function M.clear_and_replace_vars(scope, id, namespace, values)
     local mux = coalesce(dict.mux)
     mux[namespace] = values
     dict.mux = mux
+    tree.touch_location(std_scope, std_id)
     vim.cmd.redrawtabline()
     return empty_ok()
 end
@@ -202,6 +293,7 @@ function M.set_multiple_vars(scope, id, namespace, values)
         end
     end
     dict.mux = mux
+    tree.touch_location(std_scope, std_id)
     vim.cmd.redrawtabline()
     return empty_ok()
 end
@@ -230,6 +322,12 @@ function M.get_location_info(scope, id)
     })
 end
 
+---Counts of buffer defaults served from the cache and recomputed
+---@return { result: { hits: integer, recomputes: integer } }
+function M.get_defaults_stats()
+    return ok({ hits = defaults.stats.hits, recomputes = defaults.stats.recomputes })
+end
+
 ---Register a callback for whenever a USER value is changed
 ---@param key string
 ---@param callback CustomCallback
@@ -240,4 +338,19 @@ function M.register_user_callback(key, callback)
     custom_callbacks["USER"][key] = callback_list
 end
 
+---Tell the server to drop cached variables affected by a change in nvim
+---@param event "focus-changed" | "defaults-changed" | "vars-changed" | "buffer-wiped" | "window-closed" | "tab-closed"
+---@param location string?
+---@param namespace string?
+function M.publish_invalidation(event, location, namespace)
+    if require("mux.coproc").coproc_handle == nil then
+        return
+    end
+
+    notify_api.queue_notification(
+        "nvim.invalidate-vars",
+        vim.json.encode({ event = event, location = location, namespace = namespace })
+    )
+end
+
 return M
@@ -60,33 +60,143 @@ function M.start_coproc(mux_socket, log_file)
     return M.coproc_handle
 end
 
----Sends JSON RPC notifications to the mux server
----@param notifications { method: string, params_json: string }[]
-function M.notify(notifications)
-    local pipe = vim.uv.new_pipe()
-    pipe:connect(M.socket, function(err)
-        if err then
-            vim.print("Failed to connect to mux server: " .. err)
+---Maximum number of notifications held while the server is unreachable
+local MAX_BUFFERED_NOTIFICATIONS = 1000
+
+---Long-lived connection to the mux server, opened on first use
+---@type uv_pipe_t?
+local pipe = nil
+local connected = false
+local flush_scheduled = false
+
+---Reconnects back off from this up to the max while the server is unreachable
+local RETRY_MIN_MS = 100
+local RETRY_MAX_MS = 5000
+
+---Delay of the next reconnect, or nil while connecting works
+---@type integer?
+local retry_ms = nil
+local retry_scheduled = false
+
+---Encoded notifications waiting to be written
+---@type string[]
+local write_buffer = {}
+
+---Drops the connection so the next notification reconnects
+local function disconnect()
+    if pipe ~= nil and not pipe:is_closing() then
+        pipe:close()
+    end
+    pipe = nil
+    connected = false
+end
+
+local flush
+
+---Reports a problem through vim.notify, scheduled since libuv callbacks cannot call it
+---@param message string
+local function warn(message)
+    vim.schedule(function()
+        vim.notify(message, vim.log.levels.WARN)
+    end)
+end
+
+---Tries flushing again later, so buffered notifications go out even if nothing else is sent
+local function schedule_retry()
+    if retry_ms == nil then
+        retry_ms = RETRY_MIN_MS
+    else
+        retry_ms = math.min(retry_ms * 2, RETRY_MAX_MS)
+    end
+    if retry_scheduled then
+        return
+    end
+    retry_scheduled = true
+    vim.defer_fn(function()
+        retry_scheduled = false
+        flush()
+    end, retry_ms)
+end
+
+---Opens the connection to the mux server, flushing anything buffered once connected
+local function connect()
+    pipe = vim.uv.new_pipe()
+    local this_pipe = pipe
+    this_pipe:connect(M.socket, function(err)
+        if this_pipe ~= pipe then
             return
         end
-
-        local text = ""
-        for _, notification in pairs(notifications) do
-            text = text
-                .. string.format(
-                    '{ "jsonrpc": "2.0", "method": "%s", "params": %s }\n',
-                    notification.method,
-                    notification.params_json
-                )
+        if err then
+            -- Only the first failure is reported, retries keep failing the same way
+            if retry_ms == nil then
+                warn("Failed to connect to mux server: " .. err)
+            end
+            disconnect()
+            schedule_retry()
+            return
         end
 
-        pipe:write(text, function(write_error)
-            if write_error then
-                vim.print("Failed to send notifications to mux server: " .. err)
+        connected = true
+        retry_ms = nil
+        -- The server never writes to us, so a read only completes when it goes away
+        this_pipe:read_start(function(read_error, data)
+            if this_pipe == pipe and (read_error or data == nil) then
+                disconnect()
             end
-            pipe:close()
         end)
+        flush()
     end)
 end
 
+---Writes all buffered notifications in a single write
+flush = function()
+    flush_scheduled = false
+    if #write_buffer == 0 then
+        return
+    end
+    if pipe == nil then
+        connect()
+        return
+    end
+    if not connected then
+        return
+    end
+
+    local text = table.concat(write_buffer)
+    write_buffer = {}
+    local this_pipe = pipe
+    this_pipe:write(text, function(write_error)
+        if write_error then
+            warn("Failed to send notifications to mux server: " .. write_error)
+            if this_pipe == pipe then
+                disconnect()
+            end
+        end
+    end)
+end
+
+---Sends JSON RPC notifications to the mux server
+---@param notifications { method: string, params_json: string }[]
+function M.notify(notifications)
+    for _, notification in pairs(notifications) do
+        table.insert(
+            write_buffer,
+            string.format(
+                '{ "jsonrpc": "2.0", "method": "%s", "params": %s }\n',
+                notification.method,
+                notification.params_json
+            )
+        )
+    end
+    while #write_buffer > MAX_BUFFERED_NOTIFICATIONS do
+        table.remove(write_buffer, 1)
+    end
+
+    -- Notifications sent in the same tick go out in one write
+    if not flush_scheduled then
+        flush_scheduled = true
+        vim.schedule(flush)
+    end
+end
+
 return M
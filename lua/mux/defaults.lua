@@ -1,5 +1,31 @@
 local M = {}
 
+---@class DefaultsCacheEntry
+---@field defaults LocationDict
+---@field term_title string? the terminal title the defaults were computed with
+
+---Computed defaults by buffer handle, dropped by the events that can change them
+---@type table<integer, DefaultsCacheEntry>
+local cache = {}
+
+---@type { hits: integer, recomputes: integer }
+M.stats = { hits = 0, recomputes = 0 }
+
+local tracking = false
+
+---How often terminal titles are checked, since changing one fires no event
+local TERM_TITLE_POLL_MS = 200
+
+---Last seen title of each terminal buffer
+---@type table<integer, string>
+local term_titles = {}
+
+---@type fun(buffer: integer)[]
+local term_title_listeners = {}
+
+---@type uv_timer_t?
+local term_title_timer = nil
+
 ---Gets the default icon and color for a buffer
 ---@param buffer integer
 ---@return string
@@ -49,10 +75,66 @@ local function get_default_title_style(buffer)
     end
 end
 
----Gets the default variable values for a buffer
+---Drops the cached defaults of a buffer
+---@param buffer integer
+function M.invalidate(buffer)
+    cache[buffer] = nil
+end
+
+local function start_tracking()
+    tracking = true
+    local augroup = vim.api.nvim_create_augroup("MuxDefaults", {})
+    vim.api.nvim_create_autocmd(
+        { "BufFilePost", "FileType", "BufModifiedSet", "TermOpen", "BufWipeout" },
+        {
+            group = augroup,
+            callback = function(args)
+                M.invalidate(args.buf)
+            end,
+        }
+    )
+end
+
+---Calls the listeners for every terminal whose title changed since the last check
+---@param notify boolean false to only record the current titles
+local function check_term_titles(notify)
+    local titles = {}
+    for _, buffer in ipairs(vim.api.nvim_list_bufs()) do
+        if vim.bo[buffer].buftype == "terminal" then
+            titles[buffer] = vim.b[buffer].term_title or ""
+            if notify and term_titles[buffer] ~= titles[buffer] then
+                for _, listener in ipairs(term_title_listeners) do
+                    listener(buffer)
+                end
+            end
+        end
+    end
+    term_titles = titles
+end
+
+---Calls a listener with the buffer whenever a terminal's title changes
+---@param listener fun(buffer: integer)
+function M.on_term_title_changed(listener)
+    table.insert(term_title_listeners, listener)
+    if term_title_timer ~= nil then
+        return
+    end
+
+    check_term_titles(false)
+    term_title_timer = vim.uv.new_timer()
+    term_title_timer:start(
+        TERM_TITLE_POLL_MS,
+        TERM_TITLE_POLL_MS,
+        vim.schedule_wrap(function()
+            check_term_titles(true)
+        end)
+    )
+end
+
+---Computes the default variable values for a buffer
 ---@param buffer integer
 ---@return LocationDict
-function M.get_buffer_defaults(buffer)
+local function compute_buffer_defaults(buffer)
     local icon, icon_color = get_default_icon_color(buffer)
     local title = get_default_title(buffer)
     local title_style = get_default_title_style(buffer)
@@ -69,4 +151,33 @@ function M.get_buffer_defaults(buffer)
     }
 end
 
+---Gets the default variable values for a buffer. The result is shared, so must not be modified.
+---@param buffer integer
+---@return LocationDict
+function M.get_buffer_defaults(buffer)
+    if not tracking then
+        start_tracking()
+    end
+    if buffer == 0 then
+        buffer = vim.api.nvim_get_current_buf()
+    end
+
+    -- Terminal titles change without an event, so they are checked on every hit
+    local term_title = nil
+    if vim.bo[buffer].buftype == "terminal" then
+        term_title = vim.b[buffer].term_title
+    end
+
+    local entry = cache[buffer]
+    if entry ~= nil and entry.term_title == term_title then
+        M.stats.hits = M.stats.hits + 1
+        return entry.defaults
+    end
+
+    M.stats.recomputes = M.stats.recomputes + 1
+    local defaults = compute_buffer_defaults(buffer)
+    cache[buffer] = { defaults = defaults, term_title = term_title }
+    return defaults
+end
+
 return M
@@ -38,16 +38,68 @@ local regname_by_vim_name = {
 }
 -- stylua: ignore end
 
+---Terminal buffers indexed by the pid of their job
+---@type table<integer, integer>?
+local buffer_by_pid = nil
+
+---Adds a terminal buffer to the pid index
+---@param buffer integer
+local function index_terminal(buffer)
+    local pid = vim.b[buffer].terminal_job_pid
+    if pid ~= nil and buffer_by_pid ~= nil then
+        buffer_by_pid[pid] = buffer
+    end
+end
+
+---Removes a buffer from the pid index
+---@param buffer integer
+local function unindex_buffer(buffer)
+    local pid = vim.b[buffer].terminal_job_pid
+    if pid ~= nil and buffer_by_pid ~= nil and buffer_by_pid[pid] == buffer then
+        buffer_by_pid[pid] = nil
+    end
+end
+
+---Builds the pid index from the current buffers and keeps it up to date from then on
+---@return table<integer, integer>
+local function ensure_pid_index()
+    if buffer_by_pid ~= nil then
+        return buffer_by_pid
+    end
+
+    buffer_by_pid = {}
+    for _, buf in pairs(vim.api.nvim_list_bufs()) do
+        index_terminal(buf)
+    end
+
+    local augroup = vim.api.nvim_create_augroup("MuxPidIndex", {})
+    vim.api.nvim_create_autocmd("TermOpen", {
+        group = augroup,
+        callback = function(args)
+            index_terminal(args.buf)
+        end,
+    })
+    vim.api.nvim_create_autocmd("BufWipeout", {
+        group = augroup,
+        callback = function(args)
+            unindex_buffer(args.buf)
+        end,
+    })
+
+    return buffer_by_pid
+end
+
 ---Gets the buffer corresponding to a process ID
 ---@param pid integer
 ---@return integer | nil
 local function pid_to_buffer(pid)
-    for _, buf in pairs(vim.api.nvim_list_bufs()) do
-        if vim.b[buf].terminal_job_pid == pid then
-            return buf
-        end
+    local index = ensure_pid_index()
+    local buf = index[pid]
+    if buf ~= nil and not vim.api.nvim_buf_is_valid(buf) then
+        index[pid] = nil
+        return nil
     end
-    return nil
+    return buf
 end
 
 ---Parses a location string into scope, id tuple
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from collections.abc import Coroutine
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+_LOGGER = logging.getLogger("background")
+
+T = TypeVar("T")
+
+
+# Keeps a handle on fire-and-forget tasks, so their failures are logged and shutdown can wait
+# for them instead of dropping them
+@dataclass
+class BackgroundTasks:
+    name: str
+    tasks: set[asyncio.Task[Any]] = field(default_factory=set)
+
+    def spawn(self, coro: Coroutine[Any, Any, T]) -> asyncio.Task[T]:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task: asyncio.Task[Any]) -> None:
+        self.tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            _LOGGER.error(f"Background {self.name} failed: {error!r}", exc_info=error)
+
+    async def drain(self, timeout_seconds: float) -> None:
+        if not self.tasks:
+            return
+
+        _, pending = await asyncio.wait(list(self.tasks), timeout=timeout_seconds)
+        if pending:
+            _LOGGER.warning(f"Cancelling {len(pending)} unfinished {self.name} tasks")
+            for task in pending:
+                task.cancel()
+            await asyncio.wait(pending)
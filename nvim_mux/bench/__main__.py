@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+
+from nvim_mux.bench.decode import format_decode_results, run_decode_bench
+from nvim_mux.bench.registers import format_register_results, run_register_bench
+from nvim_mux.bench.replay import ReplayConfig, format_report, replay
+from nvim_mux.bench.suite import (
+    SuiteConfig,
+    compare_results,
+    format_results,
+    run_suite,
+    save_results,
+)
+from nvim_mux.data import DEFAULT_REG_CHUNK_SIZE
+
+
+def _add_suite_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser("suite", help="time the API impls against a fake nvim")
+    defaults = SuiteConfig()
+    parser.add_argument("--calls", type=int, default=defaults.calls)
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency)
+    parser.add_argument("--round-trip-ms", type=float, default=defaults.round_trip_ms)
+    parser.add_argument("--per-call-ms", type=float, default=defaults.per_call_ms)
+    parser.add_argument("--no-batching", action="store_true")
+    parser.add_argument("--only", action="append", help="only time this method")
+    parser.add_argument("--output", type=pathlib.Path, help="save results as JSON")
+    parser.add_argument("--compare", type=pathlib.Path, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression")
+
+
+def _run_suite(args: argparse.Namespace) -> int:
+    config = SuiteConfig(
+        calls=args.calls,
+        concurrency=args.concurrency,
+        round_trip_ms=args.round_trip_ms,
+        per_call_ms=args.per_call_ms,
+        batching=not args.no_batching,
+    )
+    results = asyncio.run(run_suite(config, args.only))
+    print(format_results(results))
+
+    if args.output:
+        save_results(args.output, config, results)
+
+    if args.compare:
+        regressions = compare_results(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+def _add_replay_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser(
+        "replay", help="replay a recording made with NVIM_MUX_RECORD and report latency drift"
+    )
+    defaults = ReplayConfig()
+    parser.add_argument("recording", type=pathlib.Path)
+    parser.add_argument(
+        "--speed", type=float, default=defaults.speed, help="speedup factor, 0 for no waits"
+    )
+    parser.add_argument("--backend", choices=["fake", "headless"], default=defaults.backend)
+    parser.add_argument("--round-trip-ms", type=float, default=defaults.round_trip_ms)
+    parser.add_argument("--per-call-ms", type=float, default=defaults.per_call_ms)
+    parser.add_argument("--nvim", default=defaults.nvim_executable)
+
+
+def _run_replay(args: argparse.Namespace) -> int:
+    config = ReplayConfig(
+        speed=args.speed,
+        backend=args.backend,
+        round_trip_ms=args.round_trip_ms,
+        per_call_ms=args.per_call_ms,
+        nvim_executable=args.nvim,
+    )
+    report = asyncio.run(replay(args.recording, config))
+    print(format_report(report))
+    return 0
+
+
+def _add_decode_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser(
+        "decode", help="compare try_load with the hand written lua response decoders"
+    )
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=20)
+
+
+def _run_decode(args: argparse.Namespace) -> int:
+    print(format_decode_results(run_decode_bench(args.keys, args.iterations)))
+    return 0
+
+
+def _add_registers_parser(subparsers: argparse._SubParsersAction) -> None:
+    parser = subparsers.add_parser(
+        "registers", help="compare whole and chunked transfers of large registers to nvim"
+    )
+    parser.add_argument("--size-mb", type=int, action="append", help="default 1, 10 and 100")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_REG_CHUNK_SIZE)
+    parser.add_argument("--round-trip-ms", type=float, default=0.2)
+
+
+def _run_registers(args: argparse.Namespace) -> int:
+    results = asyncio.run(
+        run_register_bench(args.size_mb or [1, 10, 100], args.chunk_size, args.round_trip_ms)
+    )
+    print(format_register_results(results))
+    return 0
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m nvim_mux.bench")
+    parser.add_argument("--log-level", default="WARNING")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _add_suite_parser(subparsers)
+    _add_replay_parser(subparsers)
+    _add_decode_parser(subparsers)
+    _add_registers_parser(subparsers)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+
+    match args.command:
+        case "suite":
+            return _run_suite(args)
+        case "replay":
+            return _run_replay(args)
+        case "decode":
+            return _run_decode(args)
+        case "registers":
+            return _run_registers(args)
+    return 2
+
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,64 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+from nvim_mux.nvim_api import LinkCounts, VariableValues, decode
+
+
+@dataclass
+class DecodeResult:
+    name: str
+    iterations: int
+    try_load_us: float
+    decode_us: float
+
+    @property
+    def speedup(self) -> float:
+        return self.try_load_us / self.decode_us if self.decode_us > 0 else 0.0
+
+
+def _time_per_call(func: Callable[[], Any], iterations: int) -> float:
+    start = perf_counter()
+    for _ in range(iterations):
+        func()
+    return (perf_counter() - start) / iterations * 1_000_000
+
+
+def variable_values_payload(keys: int) -> dict[str, Any]:
+    return {"values": {f"key{i}": f"value {i} " * 4 for i in range(keys)}}
+
+
+def link_counts_payload(instances: int) -> dict[str, Any]:
+    return {"links": {f"reg@nvim.{i}@host": {"0": 1, "1": 2} for i in range(instances)}}
+
+
+def run_decode_bench(keys: int, iterations: int) -> list[DecodeResult]:
+    cases: list[tuple[str, type[Any], dict[str, Any]]] = [
+        (f"VariableValues ({keys} keys)", VariableValues, variable_values_payload(keys)),
+        (f"LinkCounts ({keys} links)", LinkCounts, link_counts_payload(keys)),
+    ]
+
+    results: list[DecodeResult] = []
+    for name, output_type, payload in cases:
+        # Both must agree on the outcome for the comparison to mean anything
+        assert output_type.try_load(payload).is_ok() == decode(output_type, payload).is_ok()
+        results.append(
+            DecodeResult(
+                name=name,
+                iterations=iterations,
+                try_load_us=_time_per_call(lambda: output_type.try_load(payload), iterations),
+                decode_us=_time_per_call(lambda: decode(output_type, payload), iterations),
+            )
+        )
+    return results
+
+
+def format_decode_results(results: list[DecodeResult]) -> str:
+    lines = [f"{'payload':<32} {'try_load us':>12} {'decode us':>10} {'speedup':>8}"]
+    for result in results:
+        lines.append(
+            f"{result.name:<32} {result.try_load_us:>12.1f} {result.decode_us:>10.1f} "
+            f"{result.speedup:>7.0f}x"
+        )
+    return "\n".join(lines)
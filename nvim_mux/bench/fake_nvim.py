@@ -0,0 +1,537 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import msgpack
+from result import Err, Ok, Result
+
+from nvim_mux.nvim_client import NvimClient
+from nvim_mux.nvim_worker import NvimWorker
+
+_LOGGER = logging.getLogger("fake-nvim")
+
+_API_CALL = re.compile(r"^return require\('mux\.api\.internal'\)\.(\w+)\(\.\.\.\)$")
+_BATCH_CALL = "return require('mux.api.internal.batch').exec_batch(...)"
+_LOAD_CALL = "require('mux.api.internal')"
+
+_LOCATION_DNE = 10003
+
+REGNAMES = ["unnamed", *"abcdefghijklmnopqrstuvwxyz"]
+
+LocationDict = dict[str, dict[str, dict[str, str]]]
+
+
+class FakeNvimError(Exception):
+    pass
+
+
+def _lua_shape(value: Any) -> Any:
+    # nvim can't tell an empty lua table from an empty list, and sends it as a list
+    if isinstance(value, dict):
+        if not value:
+            return []
+        return {k: _lua_shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_lua_shape(v) for v in value]
+    return value
+
+
+def _ok(value: Any) -> dict[str, Any]:
+    return {"result": value}
+
+
+def _empty_ok() -> dict[str, Any]:
+    return {"result": {"unused": True}}
+
+
+def _location_dne(scope: str, id: int) -> dict[str, Any]:
+    return {"error": {"code": _LOCATION_DNE, "data": {"scope": scope, "id": id}}}
+
+
+def _coalesce(root: LocationDict, namespace: str) -> dict[str, str]:
+    return root.get("mux", {}).get(namespace, {})
+
+
+@dataclass
+class FakeBuffer:
+    name: str = ""
+    filetype: str = ""
+    modified: bool = False
+    terminal_pid: int | None = None
+    term_title: str = ""
+    vars: LocationDict = field(default_factory=dict)
+
+
+@dataclass
+class FakeWindow:
+    buffer: int
+    vars: LocationDict = field(default_factory=dict)
+
+
+@dataclass
+class FakeTab:
+    windows: list[int]
+    current_window: int
+    vars: LocationDict = field(default_factory=dict)
+
+
+# Pure python stand-in for the mux.api.internal lua contract
+@dataclass
+class FakeNvim:
+    session_vars: LocationDict = field(default_factory=dict)
+    buffers: dict[int, FakeBuffer] = field(default_factory=dict)
+    windows: dict[int, FakeWindow] = field(default_factory=dict)
+    tabs: dict[int, FakeTab] = field(default_factory=dict)
+    current_tab: int = 0
+    registers: dict[str, str] = field(default_factory=dict)
+    links: dict[str, dict[str, int]] = field(default_factory=dict)
+    api_calls: int = 0
+    staged: dict[int, list[str]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.functions: dict[str, Callable[..., Any]] = {
+            "get_all_vars": self.get_all_vars,
+            "resolve_all_vars": self.resolve_all_vars,
+            "get_multiple_vars": self.get_multiple_vars,
+            "resolve_multiple_vars": self.resolve_multiple_vars,
+            "resolve_batch": self.resolve_batch,
+            "set_multiple_vars": self.set_multiple_vars,
+            "clear_and_replace_vars": self.clear_and_replace_vars,
+            "get_location_info": self.get_location_info,
+            "get_defaults_stats": self.get_defaults_stats,
+            "get_all_registers": self.get_all_registers,
+            "get_multiple_registers": self.get_multiple_registers,
+            "get_register_metadata": self.get_register_metadata,
+            "set_multiple_registers": self.set_multiple_registers,
+            "clear_and_replace_registers": self.clear_and_replace_registers,
+            "stage_register_chunk": self.stage_register_chunk,
+            "discard_staged": self.discard_staged,
+            "add_reg_link": self.add_reg_link,
+            "remove_reg_link": self.remove_reg_link,
+            "list_reg_links": self.list_reg_links,
+            "mark_loaded": self.mark_loaded,
+            "tree_snapshot": self.tree_snapshot,
+            "tree_changes_since": self.tree_changes_since,
+        }
+
+    @staticmethod
+    def with_layout(tabs: int, windows_per_tab: int, terminals: int = 0) -> "FakeNvim":
+        nvim = FakeNvim()
+        next_handle = 1000
+        for tab_num in range(tabs):
+            tab_id = tab_num + 1
+            window_ids: list[int] = []
+            for _ in range(windows_per_tab):
+                buffer_id = len(nvim.buffers) + 1
+                nvim.buffers[buffer_id] = FakeBuffer(name=f"/src/file{buffer_id}.py", filetype="py")
+                nvim.windows[next_handle] = FakeWindow(buffer_id)
+                window_ids.append(next_handle)
+                next_handle += 1
+            nvim.tabs[tab_id] = FakeTab(window_ids, window_ids[0])
+        nvim.current_tab = 1
+
+        for terminal_num in range(terminals):
+            buffer_id = len(nvim.buffers) + 1
+            nvim.buffers[buffer_id] = FakeBuffer(
+                name=f"term://{terminal_num}",
+                terminal_pid=10000 + terminal_num,
+                term_title=f"shell {terminal_num}",
+            )
+        return nvim
+
+    def add_terminal(self, pid: int) -> int:
+        buffer_id = max(self.buffers.keys(), default=0) + 1
+        self.buffers[buffer_id] = FakeBuffer(
+            name=f"term://{pid}", terminal_pid=pid, term_title=f"shell {pid}"
+        )
+        return buffer_id
+
+    def handle_request(self, method: str, args: list[Any]) -> tuple[Result[Any, Exception], int]:
+        if method != "nvim_exec_lua":
+            return Err(FakeNvimError(f"Unsupported method {method}")), 0
+
+        lua, lua_args = args
+        if lua == _BATCH_CALL:
+            outputs: list[list[Any]] = []
+            for item in lua_args[0]:
+                match self.exec_lua(item["lua"], item["args"][: item["nargs"]]):
+                    case Ok(None):
+                        outputs.append([True])
+                    case Ok(value):
+                        outputs.append([True, value])
+                    case Err(e):
+                        outputs.append([False, str(e)])
+            return Ok(outputs), len(outputs)
+
+        return self.exec_lua(lua, lua_args), 1
+
+    def exec_lua(self, lua: str, args: list[Any]) -> Result[Any, Exception]:
+        if lua == _LOAD_CALL:
+            return Ok(None)
+
+        api_call = _API_CALL.match(lua)
+        if api_call is None or api_call.group(1) not in self.functions:
+            return Err(FakeNvimError(f"Unsupported lua: {lua}"))
+
+        self.api_calls += 1
+        try:
+            return Ok(_lua_shape(self.functions[api_call.group(1)](*args)))
+        except Exception as e:
+            return Err(FakeNvimError(repr(e)))
+
+    def current_window(self) -> int:
+        return self.tabs[self.current_tab].current_window
+
+    def current_buffer(self) -> int:
+        return self.windows[self.current_window()].buffer
+
+    def standardize_scope(self, scope: str, id: int) -> tuple[str, int] | None:
+        if scope != "pid":
+            return scope, id
+        for buffer_id, buffer in self.buffers.items():
+            if buffer.terminal_pid == id:
+                return "b", buffer_id
+        return None
+
+    def dict_at(self, scope: str, id: int) -> LocationDict | None:
+        match scope:
+            case "s":
+                return self.session_vars
+            case "t":
+                tab = self.tabs.get(id if id != 0 else self.current_tab)
+                return tab.vars if tab else None
+            case "w":
+                window = self.windows.get(id if id != 0 else self.current_window())
+                return window.vars if window else None
+            case "b":
+                buffer = self.buffers.get(id if id != 0 else self.current_buffer())
+                return buffer.vars if buffer else None
+        return None
+
+    def dicts_under(self, scope: str, id: int) -> tuple[list[LocationDict], int] | None:
+        match scope:
+            case "s":
+                tab = self.tabs[self.current_tab]
+                window = self.windows[tab.current_window]
+                return [
+                    self.session_vars,
+                    tab.vars,
+                    window.vars,
+                    self.buffers[window.buffer].vars,
+                ], window.buffer
+            case "t":
+                tab_or_none = self.tabs.get(id if id != 0 else self.current_tab)
+                if tab_or_none is None:
+                    return None
+                window = self.windows[tab_or_none.current_window]
+                return [
+                    tab_or_none.vars,
+                    window.vars,
+                    self.buffers[window.buffer].vars,
+                ], window.buffer
+            case "w":
+                window_or_none = self.windows.get(id if id != 0 else self.current_window())
+                if window_or_none is None:
+                    return None
+                return [window_or_none.vars, self.buffers[window_or_none.buffer].vars], (
+                    window_or_none.buffer
+                )
+            case "b":
+                buffer_id = id if id != 0 else self.current_buffer()
+                if buffer_id not in self.buffers:
+                    return None
+                return [self.buffers[buffer_id].vars], buffer_id
+        return None
+
+    def buffer_defaults(self, buffer_id: int) -> LocationDict:
+        buffer = self.buffers[buffer_id]
+        if buffer.terminal_pid is not None:
+            icon, icon_color, title, title_style = "", "lightgreen", buffer.term_title, "default"
+        else:
+            icon, icon_color = "", "#6d8086"
+            title = os.path.basename(buffer.name) or "[No Name]"
+            title_style = "italic" if buffer.modified else "default"
+        return {
+            "mux": {
+                "USER": {},
+                "INFO": {
+                    "icon": icon,
+                    "icon_color": icon_color,
+                    "title": title,
+                    "title_style": title_style,
+                },
+            }
+        }
+
+    def get_all_vars(self, scope: str, id: int, namespace: str) -> dict[str, Any]:
+        std = self.standardize_scope(scope, id)
+        location = self.dict_at(*std) if std else None
+        if location is None:
+            return _location_dne(scope, id)
+        return _ok({"values": dict(_coalesce(location, namespace))})
+
+    def resolve_all_vars(self, scope: str, id: int, namespace: str) -> dict[str, Any]:
+        std = self.standardize_scope(scope, id)
+        under = self.dicts_under(*std) if std else None
+        if under is None:
+            return _location_dne(scope, id)
+
+        dicts, buffer_id = under
+        values: dict[str, str] = {}
+        for location in [*dicts, self.buffer_defaults(buffer_id)]:
+            for key, value in _coalesce(location, namespace).items():
+                values.setdefault(key, value)
+        return _ok({"values": values})
+
+    def get_multiple_vars(
+        self, scope: str, id: int, namespace: str, keys: list[str]
+    ) -> dict[str, Any]:
+        response = self.get_all_vars(scope, id, namespace)
+        if "result" in response:
+            values = response["result"]["values"]
+            response["result"]["values"] = {k: values[k] for k in keys if k in values}
+        return response
+
+    def resolve_multiple_vars(
+        self, scope: str, id: int, namespace: str, keys: list[str]
+    ) -> dict[str, Any]:
+        response = self.resolve_all_vars(scope, id, namespace)
+        if "result" in response:
+            values = response["result"]["values"]
+            response["result"]["values"] = {k: values[k] for k in keys if k in values}
+        return response
+
+    def resolve_batch(self, requests: list[dict[str, Any]]) -> dict[str, Any]:
+        return _ok(
+            {
+                "results": [
+                    self.resolve_all_vars(request["scope"], request["id"], request["namespace"])
+                    for request in requests
+                ]
+            }
+        )
+
+    def set_multiple_vars(
+        self, scope: str, id: int, namespace: str, values: dict[str, str | None]
+    ) -> dict[str, Any]:
+        std = self.standardize_scope(scope, id)
+        location = self.dict_at(*std) if std else None
+        if location is None:
+            return _location_dne(scope, id)
+
+        current = location.setdefault("mux", {}).setdefault(namespace, {})
+        for key, value in values.items():
+            if value is None:
+                current.pop(key, None)
+            else:
+                current[key] = value
+        return _empty_ok()
+
+    def clear_and_replace_vars(
+        self, scope: str, id: int, namespace: str, values: dict[str, str]
+    ) -> dict[str, Any]:
+        std = self.standardize_scope(scope, id)
+        location = self.dict_at(*std) if std else None
+        if location is None:
+            return _location_dne(scope, id)
+
+        location.setdefault("mux", {})[namespace] = dict(values)
+        return _empty_ok()
+
+    def get_location_info(self, scope: str, id: int) -> dict[str, Any]:
+        std = self.standardize_scope(scope, id)
+        if std is None or self.dict_at(*std) is None:
+            return _ok({"exists": False})
+        return _ok({"exists": True, "id": f"{std[0]}:{std[1]}"})
+
+    def tree_nodes(self) -> list[dict[str, Any]]:
+        nodes: list[dict[str, Any]] = [
+            {
+                "id": "s:0",
+                "info": _coalesce(self.session_vars, "INFO"),
+                "user": _coalesce(self.session_vars, "USER"),
+                "current": f"t:{self.current_tab}",
+            }
+        ]
+        for tab_id, tab in self.tabs.items():
+            nodes.append(
+                {
+                    "id": f"t:{tab_id}",
+                    "parent": "s:0",
+                    "info": _coalesce(tab.vars, "INFO"),
+                    "user": _coalesce(tab.vars, "USER"),
+                    "current": f"w:{tab.current_window}",
+                }
+            )
+            for window_id in tab.windows:
+                window = self.windows[window_id]
+                nodes.append(
+                    {
+                        "id": f"w:{window_id}",
+                        "parent": f"t:{tab_id}",
+                        "info": _coalesce(window.vars, "INFO"),
+                        "user": _coalesce(window.vars, "USER"),
+                        "buffer": f"b:{window.buffer}",
+                    }
+                )
+        for buffer_id, buffer in self.buffers.items():
+            node: dict[str, Any] = {
+                "id": f"b:{buffer_id}",
+                "info": _coalesce(buffer.vars, "INFO"),
+                "user": _coalesce(buffer.vars, "USER"),
+                "defaults": _coalesce(self.buffer_defaults(buffer_id), "INFO"),
+            }
+            if buffer.terminal_pid is not None:
+                node["pid"] = buffer.terminal_pid
+            nodes.append(node)
+        return nodes
+
+    def tree_snapshot(self) -> dict[str, Any]:
+        return _ok({"version": 0, "reset": True, "changed": self.tree_nodes(), "removed": []})
+
+    def tree_changes_since(self, since: int) -> dict[str, Any]:
+        # Changes aren't tracked, so every delta is the worst case of a full reset
+        return self.tree_snapshot()
+
+    def get_defaults_stats(self) -> dict[str, Any]:
+        # Defaults are recomputed on every call here
+        return _ok({"hits": 0, "recomputes": 0})
+
+    def get_all_registers(self) -> dict[str, Any]:
+        return _ok({"values": dict(self.registers)})
+
+    def get_multiple_registers(self, regnames: list[str]) -> dict[str, Any]:
+        return _ok({"values": {k: self.registers[k] for k in regnames if k in self.registers}})
+
+    def get_register_metadata(self, regnames: list[str] | None = None) -> dict[str, Any]:
+        return _ok(
+            {
+                "registers": {
+                    regname: {
+                        "type": "v",
+                        "size": len(value.encode()),
+                        "sha256": hashlib.sha256(value.encode()).hexdigest(),
+                    }
+                    for regname, value in self.registers.items()
+                    if value and (regnames is None or regname in regnames)
+                }
+            }
+        )
+
+    def stage_register_chunk(self, transfer: int, chunk: str) -> dict[str, Any]:
+        self.staged.setdefault(transfer, []).append(chunk)
+        return _empty_ok()
+
+    def discard_staged(self, transfer: int) -> dict[str, Any]:
+        self.staged.pop(transfer, None)
+        return _empty_ok()
+
+    def take_staged(self, values: dict[str, Any], staged: dict[str, int] | None) -> None:
+        for regname, transfer in (staged or {}).items():
+            values[regname] = "".join(self.staged.pop(transfer, []))
+
+    def set_multiple_registers(
+        self, values: dict[str, str | list[Any]], staged: dict[str, int] | None = None
+    ) -> dict[str, Any]:
+        self.take_staged(values, staged)
+        for regname, value in values.items():
+            if isinstance(value, str):
+                self.registers[regname] = value
+            else:
+                self.registers.pop(regname, None)
+        return _empty_ok()
+
+    def clear_and_replace_registers(
+        self, values: dict[str, str], staged: dict[str, int] | None = None
+    ) -> dict[str, Any]:
+        self.take_staged(values, staged)
+        self.registers = {k: v for k, v in values.items() if k in REGNAMES}
+        return _empty_ok()
+
+    def add_reg_link(self, instance: str, registry: str) -> dict[str, Any]:
+        registries = self.links.setdefault(instance, {})
+        registries[registry] = registries.get(registry, 0) + 1
+        return _empty_ok()
+
+    def remove_reg_link(self, instance: str, registry: str) -> dict[str, Any]:
+        registries = self.links.get(instance, {})
+        if registry in registries:
+            registries[registry] -= 1
+            if registries[registry] <= 0:
+                del registries[registry]
+            if not registries:
+                del self.links[instance]
+        return _empty_ok()
+
+    def list_reg_links(self) -> dict[str, Any]:
+        return _ok({"links": {k: dict(v) for k, v in self.links.items()}})
+
+    def mark_loaded(self) -> dict[str, Any]:
+        return _ok({})
+
+
+@dataclass
+class FakeNvimSession:
+    nvim: FakeNvim
+    # One way transport latency is half of this, and overlaps between pipelined requests
+    round_trip_seconds: float = 0.0
+    # nvim runs lua on its single main thread, so this is serialized across requests
+    per_call_seconds: float = 0.0
+    # Round trips arguments and results through msgpack, for the copies a real socket makes
+    wire_format: bool = False
+    requests: int = 0
+
+    def __post_init__(self) -> None:
+        self.busy_until = 0.0
+
+    def send_request(self, method: str, *args: Any) -> asyncio.Future[Result[Any, Exception]]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Result[Any, Exception]] = loop.create_future()
+        self.requests += 1
+
+        if self.wire_format:
+            args = tuple(msgpack.unpackb(msgpack.packb(list(args)), raw=False))
+        result, calls = self.nvim.handle_request(method, list(args))
+        if self.wire_format:
+            result = result.map(lambda value: msgpack.unpackb(msgpack.packb(value), raw=False))
+
+        now = loop.time()
+        start = max(now + self.round_trip_seconds / 2, self.busy_until)
+        self.busy_until = start + self.per_call_seconds * calls
+        done_at = self.busy_until + self.round_trip_seconds / 2
+        if done_at <= now:
+            future.set_result(result)
+        else:
+            loop.call_at(done_at, _set_if_pending, future, result)
+        return future
+
+    async def drain(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def _set_if_pending(
+    future: asyncio.Future[Result[Any, Exception]], result: Result[Any, Exception]
+) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def connect_to_fake_nvim(
+    nvim: FakeNvim,
+    round_trip_seconds: float = 0.0,
+    per_call_seconds: float = 0.0,
+    batching: bool = True,
+    wire_format: bool = False,
+) -> tuple[NvimClient, FakeNvimSession]:
+    session = FakeNvimSession(nvim, round_trip_seconds, per_call_seconds, wire_format)
+    worker = NvimWorker(session, batching)
+    worker.start()
+    return NvimClient(worker, logging.DEBUG), session
@@ -0,0 +1,87 @@
+import asyncio
+import tracemalloc
+from dataclasses import dataclass
+from time import perf_counter
+
+from reg.api import Regname
+from result import Err
+
+from nvim_mux.bench.fake_nvim import FakeNvim, connect_to_fake_nvim
+from nvim_mux.data import DEFAULT_REG_CHUNK_SIZE
+from nvim_mux.reg.reg_client import RegClient
+
+MEGABYTE = 1 << 20
+
+
+@dataclass
+class RegisterTransferResult:
+    size_mb: int
+    chunk_size: int | None
+    seconds: float
+    peak_mb: float
+    # Longest the event loop went without running other tasks
+    max_stall_ms: float
+
+
+async def _watch_stalls(interval_seconds: float, stalls: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        before = loop.time()
+        await asyncio.sleep(interval_seconds)
+        stalls.append(loop.time() - before - interval_seconds)
+
+
+async def time_register_transfer(
+    size_mb: int, chunk_size: int | None, round_trip_ms: float
+) -> RegisterTransferResult:
+    nvim = FakeNvim()
+    vim, _ = connect_to_fake_nvim(nvim, round_trip_seconds=round_trip_ms / 1000, wire_format=True)
+    # No chunking is the same as a chunk size larger than any value
+    registers = RegClient(vim, chunk_size or size_mb * MEGABYTE + 1)
+    value = "x" * (size_mb * MEGABYTE)
+
+    stalls: list[float] = []
+    watcher = asyncio.create_task(_watch_stalls(0.001, stalls))
+    await asyncio.sleep(0.01)
+
+    tracemalloc.start()
+    start = perf_counter()
+    result = await registers.set_multiple_registers({Regname.A: value})
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    watcher.cancel()
+
+    if isinstance(result, Err):
+        raise RuntimeError(f"Register transfer failed: {result.err_value}")
+    if nvim.registers.get(Regname.A.value) != value:
+        raise RuntimeError("Register arrived corrupted")
+
+    return RegisterTransferResult(
+        size_mb=size_mb,
+        chunk_size=chunk_size,
+        seconds=seconds,
+        peak_mb=peak / MEGABYTE,
+        max_stall_ms=max(stalls, default=0.0) * 1000,
+    )
+
+
+async def run_register_bench(
+    sizes_mb: list[int], chunk_size: int = DEFAULT_REG_CHUNK_SIZE, round_trip_ms: float = 0.2
+) -> list[RegisterTransferResult]:
+    results: list[RegisterTransferResult] = []
+    for size_mb in sizes_mb:
+        for size in (None, chunk_size):
+            results.append(await time_register_transfer(size_mb, size, round_trip_ms))
+    return results
+
+
+def format_register_results(results: list[RegisterTransferResult]) -> str:
+    lines = [f"{'size':>7} {'chunks':>10} {'seconds':>9} {'peak MB':>9} {'max stall ms':>13}"]
+    for result in results:
+        chunks = "whole" if result.chunk_size is None else f"{result.chunk_size // 1024}KiB"
+        lines.append(
+            f"{result.size_mb:>5}MB {chunks:>10} {result.seconds:>9.3f} {result.peak_mb:>9.1f} "
+            f"{result.max_stall_ms:>13.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+import pathlib
+import tempfile
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+
+import jrpc
+from jrpc.client import ClientManager
+from result import Err, Ok
+
+from nvim_mux.bench.fake_nvim import FakeNvim, connect_to_fake_nvim
+from nvim_mux.bench.suite import percentile
+from nvim_mux.data import ParentInfo
+from nvim_mux.nvim_client import NvimClient, connect_to_nvim
+from nvim_mux.recording import RecordedEvent, RecordKind, read_recording
+from nvim_mux.server_impls import make_impls
+
+_LOGGER = logging.getLogger("bench-replay")
+
+_REPO_ROOT = pathlib.Path(__file__).resolve().parents[2]
+
+ConnectionKey = tuple[int, int]
+
+
+@dataclass
+class ReplayConfig:
+    # 2.0 replays twice as fast as recorded, 0 sends everything as fast as possible
+    speed: float = 1.0
+    backend: str = "fake"
+    round_trip_ms: float = 0.2
+    per_call_ms: float = 0.02
+    nvim_executable: str = "nvim"
+    response_timeout_seconds: float = 5.0
+
+
+@dataclass
+class RecordedMessage:
+    connection: ConnectionKey
+    sent_at: float
+    line: str
+    method: str
+    id: Any
+    recorded_latency: float | None = None
+
+
+@dataclass
+class MethodDrift:
+    calls: int = 0
+    recorded: list[float] = field(default_factory=list)
+    replayed: list[float] = field(default_factory=list)
+    timeouts: int = 0
+
+
+@dataclass
+class ReplayReport:
+    messages: int
+    notifications: int
+    max_send_lag_ms: float
+    recorded_lua_items: int
+    replayed_lua_items: int
+    methods: dict[str, MethodDrift]
+
+
+def load_messages(events: list[RecordedEvent]) -> list[RecordedMessage]:
+    messages: list[RecordedMessage] = []
+    by_id: dict[tuple[ConnectionKey, Any], RecordedMessage] = {}
+    for event in events:
+        connection = (event.run, event.connection)
+        try:
+            message = json.loads(event.line)
+        except ValueError:
+            continue
+        if not isinstance(message, dict):
+            continue
+
+        match event.kind:
+            case RecordKind.REQUEST_IN if "method" in message:
+                recorded = RecordedMessage(
+                    connection=connection,
+                    sent_at=event.seconds,
+                    line=event.line,
+                    method=message["method"],
+                    id=message.get("id"),
+                )
+                messages.append(recorded)
+                if recorded.id is not None:
+                    by_id[(connection, recorded.id)] = recorded
+            case RecordKind.RESPONSE_OUT if "id" in message:
+                request = by_id.pop((connection, message["id"]), None)
+                if request is not None:
+                    request.recorded_latency = event.seconds - request.sent_at
+    return messages
+
+
+def _seed_fake_nvim(messages: list[RecordedMessage]) -> FakeNvim:
+    nvim = FakeNvim.with_layout(tabs=2, windows_per_tab=2)
+    # Shells address their own terminal by pid, so those need to exist to behave as recorded
+    pids: set[int] = set()
+    for message in messages:
+        params = json.loads(message.line).get("params")
+        if not isinstance(params, dict):
+            continue
+        for key in ("location", "ref"):
+            value = params.get(key)
+            if isinstance(value, str) and value.startswith("pid:") and value[4:].isdigit():
+                pids.add(int(value[4:]))
+    for pid in sorted(pids):
+        nvim.add_terminal(pid)
+    return nvim
+
+
+@asynccontextmanager
+async def headless_nvim(config: ReplayConfig) -> AsyncIterator[NvimClient]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = pathlib.Path(tmp_dir) / "nvim.sock"
+        process = await asyncio.create_subprocess_exec(
+            config.nvim_executable,
+            "--headless",
+            "--clean",
+            "--cmd",
+            f"set rtp^={_REPO_ROOT}",
+            "--listen",
+            str(socket_path),
+        )
+        try:
+            for _ in range(100):
+                if socket_path.exists():
+                    break
+                await asyncio.sleep(0.05)
+
+            match await connect_to_nvim(str(socket_path)):
+                case Ok(vim):
+                    yield vim
+                case Err(e):
+                    raise RuntimeError(f"Failed to connect to headless nvim: {e}")
+        finally:
+            process.terminate()
+            await process.wait()
+
+
+@asynccontextmanager
+async def replay_backend(
+    config: ReplayConfig, messages: list[RecordedMessage]
+) -> AsyncIterator[NvimClient]:
+    match config.backend:
+        case "fake":
+            vim, _ = connect_to_fake_nvim(
+                _seed_fake_nvim(messages),
+                round_trip_seconds=config.round_trip_ms / 1000,
+                per_call_seconds=config.per_call_ms / 1000,
+            )
+            yield vim
+        case "headless":
+            async with headless_nvim(config) as vim:
+                yield vim
+        case _:
+            raise ValueError(f"Unknown replay backend {config.backend}")
+
+
+def _no_peers(*_: Any, **__: Any) -> Any:
+    raise RuntimeError("Replays have no peer muxes or registries")
+
+
+async def replay_connection(
+    socket_path: pathlib.Path,
+    messages: list[RecordedMessage],
+    config: ReplayConfig,
+    replay_start: float,
+    record_start: float,
+    drift: dict[str, MethodDrift],
+) -> float:
+    reader, writer = await asyncio.open_unix_connection(str(socket_path))
+    waiting: dict[Any, tuple[RecordedMessage, float]] = {}
+    all_answered = asyncio.Event()
+    all_answered.set()
+    max_lag = 0.0
+
+    async def read_responses() -> None:
+        while line := await reader.readline():
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(response, dict) or response.get("id") not in waiting:
+                continue
+            message, sent_at = waiting.pop(response["id"])
+            drift[message.method].replayed.append(perf_counter() - sent_at)
+            if not waiting:
+                all_answered.set()
+
+    read_task = asyncio.create_task(read_responses())
+    try:
+        for message in messages:
+            if config.speed > 0:
+                due = replay_start + (message.sent_at - record_start) / config.speed
+                delay = due - perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                max_lag = max(max_lag, perf_counter() - due)
+
+            drift[message.method].calls += 1
+            if message.recorded_latency is not None:
+                drift[message.method].recorded.append(message.recorded_latency)
+            if message.id is not None:
+                waiting[message.id] = (message, perf_counter())
+                all_answered.clear()
+            writer.write(message.line.encode() + b"\n")
+            await writer.drain()
+
+        try:
+            await asyncio.wait_for(all_answered.wait(), config.response_timeout_seconds)
+        except TimeoutError:
+            for message, _ in waiting.values():
+                drift[message.method].timeouts += 1
+    finally:
+        read_task.cancel()
+        writer.close()
+    return max_lag
+
+
+async def replay(recording: pathlib.Path, config: ReplayConfig) -> ReplayReport:
+    events = list(read_recording(recording))
+    messages = load_messages(events)
+    if not messages:
+        raise ValueError(f"No requests or notifications recorded in {recording}")
+
+    by_connection: dict[ConnectionKey, list[RecordedMessage]] = defaultdict(list)
+    for message in messages:
+        by_connection[message.connection].append(message)
+
+    drift: dict[str, MethodDrift] = defaultdict(MethodDrift)
+    async with replay_backend(config, messages) as vim:
+        impls = make_impls(
+            vim=vim,
+            mux_clients=ClientManager(_no_peers),
+            reg_clients=ClientManager(_no_peers),
+            reg_service_name="reg@replay",
+            parent_info=ParentInfo(parent_mux=None, parent_reg=None),
+        )
+        lua_items_before = vim.worker.batch_stats.items
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = pathlib.Path(tmp_dir) / "mux.sock"
+            server = await asyncio.start_unix_server(
+                jrpc.connection.client_connected_callback(*impls.method_sets()),
+                path=str(socket_path),
+            )
+            try:
+                record_start = messages[0].sent_at
+                replay_start = perf_counter()
+                _LOGGER.info(
+                    f"Replaying {len(messages)} messages on {len(by_connection)} connections"
+                )
+                async with asyncio.TaskGroup() as tg:
+                    lag_tasks = [
+                        tg.create_task(
+                            replay_connection(
+                                socket_path,
+                                connection_messages,
+                                config,
+                                replay_start,
+                                record_start,
+                                drift,
+                            )
+                        )
+                        for connection_messages in by_connection.values()
+                    ]
+            finally:
+                server.close()
+
+        replayed_lua_items = vim.worker.batch_stats.items - lua_items_before
+
+    return ReplayReport(
+        messages=len(messages),
+        notifications=sum(1 for message in messages if message.id is None),
+        max_send_lag_ms=max(task.result() for task in lag_tasks) * 1000,
+        recorded_lua_items=sum(1 for event in events if event.kind == RecordKind.LUA),
+        replayed_lua_items=replayed_lua_items,
+        methods=dict(drift),
+    )
+
+
+def format_report(report: ReplayReport) -> str:
+    lines = [
+        f"{report.messages} messages ({report.notifications} notifications), "
+        f"max send lag {report.max_send_lag_ms:.3f}ms, "
+        f"lua items recorded {report.recorded_lua_items} replayed {report.replayed_lua_items}",
+        f"{'method':<28} {'calls':>7} {'rec p50':>9} {'rep p50':>9} {'rec p99':>9} "
+        f"{'rep p99':>9} {'drift p50':>10} {'timeouts':>9}",
+    ]
+    for method, drift in sorted(report.methods.items()):
+        recorded = sorted(drift.recorded)
+        replayed = sorted(drift.replayed)
+        recorded_p50 = percentile(recorded, 0.5) * 1000
+        replayed_p50 = percentile(replayed, 0.5) * 1000
+        drift_p50 = f"{replayed_p50 - recorded_p50:+.3f}" if recorded else "n/a"
+        lines.append(
+            f"{method:<28} {drift.calls:>7} {recorded_p50:>9.3f} {replayed_p50:>9.3f} "
+            f"{percentile(recorded, 0.99) * 1000:>9.3f} {percentile(replayed, 0.99) * 1000:>9.3f} "
+            f"{drift_p50:>10} {drift.timeouts:>9}"
+        )
+    return "\n".join(lines)
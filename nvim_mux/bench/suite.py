@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import pathlib
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Any
+
+from jrpc.client import ClientManager
+from mux import api as mux_api
+from reg import api as reg_api
+from result import Err
+
+from nvim_mux.bench.fake_nvim import FakeNvim, connect_to_fake_nvim
+from nvim_mux.data import ParentInfo
+from nvim_mux.ext.api import (
+    ChangesSinceParams,
+    InvalidateVarsParams,
+    PublishRegistersParams,
+    RegisterMetadataParams,
+    ResolveBatchParams,
+    SnapshotParams,
+    StatsParams,
+)
+from nvim_mux.server_impls import MuxServerImpls, make_impls
+
+_LOGGER = logging.getLogger("bench-suite")
+
+BenchCall = Callable[[int], Awaitable[Any]]
+
+
+@dataclass
+class SuiteConfig:
+    calls: int = 2000
+    concurrency: int = 8
+    round_trip_ms: float = 0.2
+    per_call_ms: float = 0.02
+    batching: bool = True
+    tabs: int = 4
+    windows_per_tab: int = 3
+    terminals: int = 8
+
+
+@dataclass
+class MethodResult:
+    calls: int
+    errors: int
+    seconds: float
+    throughput: float
+    p50_ms: float
+    p99_ms: float
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def time_method(call: BenchCall, calls: int, concurrency: int) -> MethodResult:
+    latencies: list[float] = []
+    errors = 0
+    call_numbers = iter(range(calls))
+
+    async def run_calls() -> None:
+        nonlocal errors
+        for call_number in call_numbers:
+            start = perf_counter()
+            result = await call(call_number)
+            latencies.append(perf_counter() - start)
+            if isinstance(result, Err):
+                errors += 1
+
+    start = perf_counter()
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(concurrency):
+            tg.create_task(run_calls())
+    seconds = perf_counter() - start
+
+    latencies.sort()
+    return MethodResult(
+        calls=calls,
+        errors=errors,
+        seconds=seconds,
+        throughput=calls / seconds if seconds > 0 else 0.0,
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+    )
+
+
+def _no_peers(*_: Any, **__: Any) -> Any:
+    raise RuntimeError("The benchmark has no peer muxes or registries")
+
+
+def make_bench_impls(nvim: FakeNvim, config: SuiteConfig) -> MuxServerImpls:
+    vim, _ = connect_to_fake_nvim(
+        nvim,
+        round_trip_seconds=config.round_trip_ms / 1000,
+        per_call_seconds=config.per_call_ms / 1000,
+        batching=config.batching,
+    )
+    return make_impls(
+        vim=vim,
+        mux_clients=ClientManager(_no_peers),
+        reg_clients=ClientManager(_no_peers),
+        reg_service_name="reg@bench",
+        parent_info=ParentInfo(parent_mux=None, parent_reg=None),
+    )
+
+
+def bench_calls(nvim: FakeNvim, impls: MuxServerImpls) -> dict[str, BenchCall]:
+    windows = [f"w:{window}" for window in nvim.windows.keys()]
+    pids = [f"pid:{buffer.terminal_pid}" for buffer in nvim.buffers.values() if buffer.terminal_pid]
+    locations = windows + pids
+    regnames = list(reg_api.Regname)
+
+    def location(call_number: int) -> str:
+        return locations[call_number % len(locations)]
+
+    async def publish_registers(call_number: int) -> Any:
+        result = await impls.ext.publish_registers(
+            PublishRegistersParams(regnames[call_number % len(regnames)])
+        )
+        # publishing happens in the background, so wait for it to be end to end
+        pending = impls.ext.reg_publisher.pending
+        if pending is not None:
+            await pending
+        return result
+
+    return {
+        "mux.get_all": lambda n: impls.mux.get_all(
+            mux_api.GetAllParams(location=location(n), namespace="USER")
+        ),
+        "mux.get_multiple": lambda n: impls.mux.get_multiple(
+            mux_api.GetMultipleParams(location=location(n), namespace="INFO", keys=["title"])
+        ),
+        "mux.resolve_all": lambda n: impls.mux.resolve_all(
+            mux_api.ResolveAllParams(location=location(n), namespace="INFO")
+        ),
+        "mux.resolve_multiple": lambda n: impls.mux.resolve_multiple(
+            mux_api.ResolveMultipleParams(
+                location=location(n), namespace="INFO", keys=["title", "icon"]
+            )
+        ),
+        "mux.set_multiple": lambda n: impls.mux.set_multiple(
+            mux_api.SetMultipleParams(
+                location=location(n), namespace="USER", values={"counter": str(n)}
+            )
+        ),
+        "mux.clear_and_replace": lambda n: impls.mux.clear_and_replace(
+            mux_api.ClearAndReplaceParams(
+                location=location(n), namespace="INFO", values={"title": f"title {n}"}
+            )
+        ),
+        "mux.get_location_info": lambda n: impls.mux.get_location_info(
+            mux_api.LocationInfoParams(ref=location(n))
+        ),
+        "reg.get_all": lambda n: impls.reg.get_all(reg_api.GetAllParams(registry="0")),
+        "reg.get_multiple": lambda n: impls.reg.get_multiple(
+            reg_api.GetMultipleParams(registry="0", keys=[regnames[n % len(regnames)]])
+        ),
+        "reg.set_multiple": lambda n: impls.reg.set_multiple(
+            reg_api.SetMultipleParams(
+                registry="0", values={regnames[n % len(regnames)]: f"yank {n}"}
+            )
+        ),
+        "reg.clear_and_replace": lambda n: impls.reg.clear_and_replace(
+            reg_api.ClearAndReplaceParams(
+                registry="0", values={regname: f"value {n}" for regname in regnames}
+            )
+        ),
+        "ext.invalidate_vars": lambda n: impls.ext.invalidate_vars(
+            InvalidateVarsParams(event="focus-changed")
+        ),
+        "ext.publish_registers": publish_registers,
+        "ext.stats": lambda n: impls.ext.stats(StatsParams()),
+        "ext.resolve_batch": lambda n: impls.ext.resolve_batch(
+            ResolveBatchParams(locations=locations, namespaces=["INFO", "USER"])
+        ),
+        "ext.register_metadata": lambda n: impls.ext.register_metadata(RegisterMetadataParams()),
+        "ext.snapshot": lambda n: impls.ext.snapshot(SnapshotParams()),
+        "ext.changes_since": lambda n: impls.ext.changes_since(ChangesSinceParams(version=0)),
+    }
+
+
+async def run_suite(config: SuiteConfig, only: list[str] | None = None) -> dict[str, MethodResult]:
+    nvim = FakeNvim.with_layout(config.tabs, config.windows_per_tab, config.terminals)
+    nvim.registers = {regname.value: f"initial {regname.value}" for regname in reg_api.Regname}
+    impls = make_bench_impls(nvim, config)
+
+    results: dict[str, MethodResult] = {}
+    for name, call in bench_calls(nvim, impls).items():
+        if only and name not in only:
+            continue
+        _LOGGER.info(f"Timing {name}")
+        results[name] = await time_method(call, config.calls, config.concurrency)
+    return results
+
+
+def save_results(path: pathlib.Path, config: SuiteConfig, results: dict[str, MethodResult]) -> None:
+    path.write_text(
+        json.dumps(
+            {
+                "config": asdict(config),
+                "results": {name: asdict(result) for name, result in results.items()},
+            },
+            indent=2,
+        )
+    )
+
+
+def compare_results(
+    results: dict[str, MethodResult], baseline_path: pathlib.Path, threshold: float
+) -> list[str]:
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions: list[str] = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result.p50_ms > before["p50_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {before['p50_ms']:.3f}ms -> {result.p50_ms:.3f}ms")
+        if result.p99_ms > before["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {before['p99_ms']:.3f}ms -> {result.p99_ms:.3f}ms")
+        if result.throughput < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput']:.0f}/s -> {result.throughput:.0f}/s"
+            )
+    return regressions
+
+
+def format_results(results: dict[str, MethodResult]) -> str:
+    lines = [f"{'method':<26} {'calls/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}"]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<26} {result.throughput:>10.0f} {result.p50_ms:>9.3f} "
+            f"{result.p99_ms:>9.3f} {result.errors:>7}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+
+from jrpc.client import ClientManager
+from mux.errors import MuxApiError
+from reg.errors import RegApiError
+from result import Err, Result
+
+_LOGGER = logging.getLogger("client-pool")
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class PooledConnection:
+    client: Any
+    exit_stack: AsyncExitStack
+    opened_at: float
+    last_used: float
+    in_use: int = 0
+    # Set when a call fails in a way the peer didn't answer, so it is closed once released
+    broken: bool = False
+
+
+class PooledClient:
+    def __init__(self, connection: PooledConnection) -> None:
+        self.connection = connection
+
+    async def request(self, *args: Any, **kwargs: Any) -> Result[Any, Any]:
+        return self.check(await self.connection.client.request(*args, **kwargs))
+
+    async def notify(self, *args: Any, **kwargs: Any) -> Result[Any, Any]:
+        return self.check(await self.connection.client.notify(*args, **kwargs))
+
+    def check(self, result: Result[Any, Any]) -> Result[Any, Any]:
+        match result:
+            case Err(e) if not isinstance(e, (MuxApiError, RegApiError)):
+                # Not an answer from the peer, so the connection may be dead
+                self.connection.broken = True
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection.client, name)
+
+
+class PooledClientManager(ClientManager):
+    def __init__(
+        self,
+        factory: Any,
+        max_connections: int = 32,
+        max_idle_seconds: float = 300.0,
+        # Connections that are used regularly are kept for good unless this is set
+        max_age_seconds: float | None = None,
+    ) -> None:
+        super().__init__(factory)
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.stats = PoolStats()
+        self.connections: OrderedDict[str, PooledConnection] = OrderedDict()
+        self.connect_locks: dict[str, asyncio.Lock] = {}
+
+    @asynccontextmanager
+    async def client(self, instance: str) -> AsyncIterator[Any]:
+        connection = await self.checkout(instance)
+        try:
+            yield PooledClient(connection)
+        except Exception:
+            connection.broken = True
+            raise
+        finally:
+            connection.in_use -= 1
+            if connection.broken:
+                # The next caller gets a fresh connection
+                await self.retire(instance, connection)
+
+    async def checkout(self, instance: str) -> PooledConnection:
+        while True:
+            lock = self.connect_locks.setdefault(instance, asyncio.Lock())
+            async with lock:
+                # Locks of idle instances are pruned, possibly while this was waiting
+                if self.connect_locks.get(instance) is lock:
+                    return await self.checkout_locked(instance)
+
+    async def checkout_locked(self, instance: str) -> PooledConnection:
+        now = time.monotonic()
+        connection = self.connections.get(instance)
+        if (
+            connection is not None
+            and connection.in_use == 0
+            and (
+                now - connection.last_used > self.max_idle_seconds
+                or (
+                    self.max_age_seconds is not None
+                    and now - connection.opened_at > self.max_age_seconds
+                )
+            )
+        ):
+            # Peers may have dropped idle connections without us noticing, so they are recycled
+            await self.discard(instance)
+            connection = None
+
+        if connection is None:
+            self.stats.misses += 1
+            connection = await self.connect(instance)
+            self.connections[instance] = connection
+            await self.evict_overflow()
+        else:
+            self.stats.hits += 1
+
+        connection.last_used = now
+        connection.in_use += 1
+        self.connections.move_to_end(instance)
+        return connection
+
+    async def connect(self, instance: str) -> PooledConnection:
+        _LOGGER.debug(f"Opening pooled connection to {instance}")
+        exit_stack = AsyncExitStack()
+        try:
+            client = await exit_stack.enter_async_context(super().client(instance))
+        except BaseException:
+            await exit_stack.aclose()
+            raise
+        now = time.monotonic()
+        return PooledConnection(client, exit_stack, opened_at=now, last_used=now)
+
+    async def retire(self, instance: str, connection: PooledConnection) -> None:
+        if self.connections.get(instance) is connection:
+            del self.connections[instance]
+            self.stats.evictions += 1
+        # Other callers still using it close it when they are done
+        if connection.in_use == 0:
+            await self.close(instance, connection)
+
+    async def discard(self, instance: str) -> None:
+        connection = self.connections.pop(instance, None)
+        if connection is None:
+            return
+
+        self.stats.evictions += 1
+        await self.close(instance, connection)
+
+    async def close(self, instance: str, connection: PooledConnection) -> None:
+        _LOGGER.debug(f"Closing pooled connection to {instance}")
+        try:
+            await connection.exit_stack.aclose()
+        except Exception as e:
+            _LOGGER.warning(f"Failed to close pooled connection to {instance}: {e!r}")
+
+    async def evict_overflow(self) -> None:
+        # Least recently used first, skipping connections that are in the middle of a call
+        idle = [instance for instance, c in self.connections.items() if c.in_use == 0]
+        for instance in idle[: max(0, len(self.connections) - self.max_connections)]:
+            await self.discard(instance)
+        # Otherwise there would be a lock for every instance ever contacted
+        for instance, lock in list(self.connect_locks.items()):
+            if instance not in self.connections and not lock.locked():
+                del self.connect_locks[instance]
+
+    async def close_all(self) -> None:
+        for instance in list(self.connections.keys()):
+            await self.discard(instance)
+
+    async def __aexit__(self, *exc_info: Any) -> Any:
+        _LOGGER.info(f"Closing connection pool: {self.stats}")
+        await self.close_all()
+        return await super().__aexit__(*exc_info)
@@ -1,5 +1,8 @@
 from dataclasses import dataclass
 
+# Register values longer than this many characters are sent to nvim in chunks of this size
+DEFAULT_REG_CHUNK_SIZE = 1 << 20
+
 
 @dataclass
 class ParentMux:
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-from jrpc.data import JsonTryLoadMixin
+from jrpc.data import JsonTryLoadMixin, ParsedJson
 from jrpc.service import JsonTryConverter, MethodDescriptor
 from mux.errors import ERROR_CONVERTER as MUX_ERROR_CONVERTER
 from reg.api import Regname
@@ -37,6 +37,171 @@ class PublishRegistersResult(JsonTryLoadMixin):
     pass
 
 
+@dataclass
+class InvalidateVarsParams(JsonTryLoadMixin):
+    event: str
+    location: str | None = None
+    namespace: str | None = None
+
+
+@dataclass
+class InvalidateVarsResult(JsonTryLoadMixin):
+    pass
+
+
+@dataclass
+class StatsParams(JsonTryLoadMixin):
+    pass
+
+
+@dataclass
+class StatsResult(JsonTryLoadMixin):
+    queue: dict[str, ParsedJson]
+    api_calls: dict[str, ParsedJson]
+    errors: dict[str, int]
+    deduplicated: dict[str, int]
+    publishes: dict[str, ParsedJson]
+    syncs: dict[str, int]
+    batches: dict[str, ParsedJson]
+    var_cache: dict[str, int]
+    pools: dict[str, ParsedJson]
+    connections: dict[str, ParsedJson]
+    subscriptions: dict[str, ParsedJson]
+    buffer_defaults: dict[str, ParsedJson]
+
+
+@dataclass
+class ResolveBatchParams(JsonTryLoadMixin):
+    locations: list[str]
+    namespaces: list[str]
+
+
+@dataclass
+class ResolveBatchError(JsonTryLoadMixin):
+    code: int
+    data: dict[str, ParsedJson]
+
+
+@dataclass
+class ResolvedLocation(JsonTryLoadMixin):
+    location: str
+    namespace: str
+    values: dict[str, str] | None = None
+    error: ResolveBatchError | None = None
+
+
+@dataclass
+class ResolveBatchResult(JsonTryLoadMixin):
+    results: list[ResolvedLocation]
+
+
+@dataclass
+class TreeNode(JsonTryLoadMixin):
+    id: str
+    info: dict[str, str]
+    user: dict[str, str]
+    parent: str | None = None
+    # The current tab of the session, or the current window of a tab
+    current: str | None = None
+    # The buffer shown in a window
+    buffer: str | None = None
+    # INFO defaults of a buffer
+    defaults: dict[str, str] | None = None
+    pid: int | None = None
+
+
+@dataclass
+class SnapshotParams(JsonTryLoadMixin):
+    pass
+
+
+@dataclass
+class SnapshotResult(JsonTryLoadMixin):
+    version: int
+    nodes: list[TreeNode]
+
+
+@dataclass
+class ChangesSinceParams(JsonTryLoadMixin):
+    version: int
+
+
+@dataclass
+class ChangesSinceResult(JsonTryLoadMixin):
+    version: int
+    # The client was too far behind, so changed holds every node and it should start over
+    reset: bool
+    changed: list[TreeNode]
+    removed: list[str]
+
+
+@dataclass
+class SubscribeParams(JsonTryLoadMixin):
+    # The service that gets nvim.subscription-changed notifications, reached through the router
+    instance: str
+    location: str
+    namespace: str
+    # Every key in the namespace when not given
+    keys: list[str] | None = None
+
+
+@dataclass
+class SubscribeResult(JsonTryLoadMixin):
+    subscription: int
+    values: dict[str, str]
+
+
+@dataclass
+class UnsubscribeParams(JsonTryLoadMixin):
+    subscription: int
+
+
+@dataclass
+class UnsubscribeResult(JsonTryLoadMixin):
+    pass
+
+
+@dataclass
+class SubscriptionChange(JsonTryLoadMixin):
+    subscription: int
+    location: str
+    namespace: str
+    # Resolved values that changed, with None for ones that were removed
+    values: dict[str, str | None]
+    # The location no longer exists, so the subscription has been dropped
+    closed: bool = False
+
+
+@dataclass
+class SubscriptionChangedParams(JsonTryLoadMixin):
+    changes: list[SubscriptionChange]
+
+
+@dataclass
+class SubscriptionChangedResult(JsonTryLoadMixin):
+    pass
+
+
+@dataclass
+class RegisterMetadataParams(JsonTryLoadMixin):
+    # Every register when not given
+    keys: list[Regname] | None = None
+
+
+@dataclass
+class RegisterInfo(JsonTryLoadMixin):
+    # As returned by getregtype, e.g. "v", "V" or "^V5"
+    type: str
+    size: int
+    sha256: str
+
+
+@dataclass
+class RegisterMetadataResult(JsonTryLoadMixin):
+    # Empty registers are left out
+    registers: dict[Regname, RegisterInfo]
+
+
 class NvimExtensionMethod:
     PUBLISH_TO_PARENT = MethodDescriptor(
         name="nvim.publish-to-parent",
@@ -56,3 +221,58 @@ class NvimExtensionMethod:
         result_converter=JsonTryConverter(PublishRegistersResult),
         error_converter=REG_ERROR_CONVERTER,
     )
+    INVALIDATE_VARS = MethodDescriptor(
+        name="nvim.invalidate-vars",
+        params_converter=JsonTryConverter(InvalidateVarsParams),
+        result_converter=JsonTryConverter(InvalidateVarsResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    STATS = MethodDescriptor(
+        name="nvim.stats",
+        params_converter=JsonTryConverter(StatsParams),
+        result_converter=JsonTryConverter(StatsResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    RESOLVE_BATCH = MethodDescriptor(
+        name="nvim.resolve-batch",
+        params_converter=JsonTryConverter(ResolveBatchParams),
+        result_converter=JsonTryConverter(ResolveBatchResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    SNAPSHOT = MethodDescriptor(
+        name="nvim.snapshot",
+        params_converter=JsonTryConverter(SnapshotParams),
+        result_converter=JsonTryConverter(SnapshotResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    CHANGES_SINCE = MethodDescriptor(
+        name="nvim.changes-since",
+        params_converter=JsonTryConverter(ChangesSinceParams),
+        result_converter=JsonTryConverter(ChangesSinceResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    SUBSCRIBE = MethodDescriptor(
+        name="nvim.subscribe",
+        params_converter=JsonTryConverter(SubscribeParams),
+        result_converter=JsonTryConverter(SubscribeResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    UNSUBSCRIBE = MethodDescriptor(
+        name="nvim.unsubscribe",
+        params_converter=JsonTryConverter(UnsubscribeParams),
+        result_converter=JsonTryConverter(UnsubscribeResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    # Sent to subscribers, not served here
+    SUBSCRIPTION_CHANGED = MethodDescriptor(
+        name="nvim.subscription-changed",
+        params_converter=JsonTryConverter(SubscriptionChangedParams),
+        result_converter=JsonTryConverter(SubscriptionChangedResult),
+        error_converter=MUX_ERROR_CONVERTER,
+    )
+    REGISTER_METADATA = MethodDescriptor(
+        name="nvim.register-metadata",
+        params_converter=JsonTryConverter(RegisterMetadataParams),
+        result_converter=JsonTryConverter(RegisterMetadataResult),
+        error_converter=REG_ERROR_CONVERTER,
+    )
@@ -1,35 +1,90 @@
 import asyncio
 import logging
-from dataclasses import dataclass
+import time
+from dataclasses import asdict, dataclass
 
 from jrpc.client import ClientManager
+from jrpc.data import ParsedJson
 from jrpc.service import MethodSet, implements, make_method_set
-from mux.api import ClearAndReplaceParams, MuxMethod
-from mux.errors import MuxApiError
-from reg.api import GetAllParams, GetAllResult, RegMethod
+from mux.errors import LocationDoesNotExist, MuxApiError, MuxErrorCode
+from reg.api import GetAllParams, GetAllResult, RegMethod, Regname
 from reg.errors import RegApiError
 from reg.syncer import RegSyncer
 from result import Err, Ok, Result
 
-from nvim_mux.data import ParentInfo
-from nvim_mux.errors import OtherMuxServerError
-from nvim_mux.mux.mux_client import MuxClient, Reference, Scope
+from nvim_mux.client_pool import PooledClientManager
+from nvim_mux.data import DEFAULT_REG_CHUNK_SIZE, ParentInfo
+from nvim_mux.errors import InvalidNvimLocation, NvimErrorCode
+from nvim_mux.metrics import ConnectionStats, SyncStats, stats_to_json
+from nvim_mux.mux.mux_client import MuxClient, Reference, parse_reference
+from nvim_mux.mux.publisher import MuxPublisher
+from nvim_mux.mux.var_cache import InvalidationEvent, VarCache
 from nvim_mux.nvim_client import NvimClient
+from nvim_mux.reg.link_table import RegLinkTable
+from nvim_mux.reg.publisher import RegPublisher
+from nvim_mux.reg.recent import RecentRegisters
 from nvim_mux.reg.reg_client import RegClient
 
 from .api import (
+    ChangesSinceParams,
+    ChangesSinceResult,
+    InvalidateVarsParams,
+    InvalidateVarsResult,
     NvimExtensionMethod,
     PublishRegistersParams,
     PublishRegistersResult,
     PublishToParentParams,
     PublishToParentResult,
+    RegisterInfo,
+    RegisterMetadataParams,
+    RegisterMetadataResult,
+    ResolveBatchError,
+    ResolveBatchParams,
+    ResolveBatchResult,
+    ResolvedLocation,
+    SnapshotParams,
+    SnapshotResult,
+    StatsParams,
+    StatsResult,
+    SubscribeParams,
+    SubscribeResult,
     SyncRegistersDownParams,
     SyncRegistersDownResult,
+    TreeNode,
+    UnsubscribeParams,
+    UnsubscribeResult,
 )
+from .subscriptions import SubscriptionManager
 
 _LOGGER = logging.getLogger("ext-impl")
 
 
+def _string_dict(value: ParsedJson) -> dict[str, str]:
+    # lua sends empty tables as lists
+    return dict(value) if isinstance(value, dict) else dict()
+
+
+def _tree_nodes(raw_nodes: list[ParsedJson]) -> list[TreeNode]:
+    nodes: list[TreeNode] = []
+    for raw in raw_nodes:
+        if not isinstance(raw, dict) or not isinstance(raw.get("id"), str):
+            _LOGGER.warning(f"Dropping invalid tree node from lua: {raw!r}")
+            continue
+        nodes.append(
+            TreeNode(
+                id=raw["id"],
+                info=_string_dict(raw.get("info")),
+                user=_string_dict(raw.get("user")),
+                parent=raw.get("parent"),
+                current=raw.get("current"),
+                buffer=raw.get("buffer"),
+                defaults=_string_dict(raw["defaults"]) if "defaults" in raw else None,
+                pid=raw.get("pid"),
+            )
+        )
+    return nodes
+
+
 @dataclass
 class NvimExtensionApiImpl:
     vim: NvimClient
@@ -37,53 +92,36 @@ class NvimExtensionApiImpl:
     parent_info: ParentInfo
     mux_clients: ClientManager
     reg_clients: ClientManager
+    var_cache: VarCache
+    mux_publisher: MuxPublisher
+    connection_stats: ConnectionStats
+    sync_stats: SyncStats
+    recent_registers: RecentRegisters
+    link_table: RegLinkTable
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE
 
     def __post_init__(self) -> None:
-        self.vars = MuxClient(self.vim)
-        self.registers = RegClient(self.vim)
+        self.registers = RegClient(self.vim, self.reg_chunk_size)
+        self.vim_mux = MuxClient(self.vim)
         self.reg_syncer = RegSyncer(self.reg_clients, self.this_reg_instance)
+        self.reg_publisher = RegPublisher(
+            self.registers, self.link_table, self.reg_syncer, self.recent_registers
+        )
+        self.subscriptions = SubscriptionManager(self.vim_mux, self.mux_clients)
+        # Writes through the mux API and invalidations from nvim both pass through the cache
+        self.var_cache.listeners.append(self.subscriptions.mark_changed)
+        # Buffer defaults stats live in nvim, so stats reports the last ones fetched
+        self.defaults_stats: tuple[float, dict[str, ParsedJson]] | None = None
+        self.defaults_stats_refresh: asyncio.Task[None] | None = None
 
     @implements(NvimExtensionMethod.PUBLISH_TO_PARENT)
     async def publish_to_parent(
         self, _: PublishToParentParams
     ) -> Result[PublishToParentResult, MuxApiError]:
-        if self.parent_info.parent_mux is None:
-            return Ok(PublishToParentResult())
-        parent_mux = self.parent_info.parent_mux
-
-        ref = Reference(
-            scope=Scope.SESSION,
-            target_id=0,
-            raw_value="s:0",
-        )
-
-        match await self.vars.resolve_all_vars(ref, "INFO"):
-            case Ok(values):
-                pass
-            case Err() as err:
-                return err
-
-        _LOGGER.info(f"Syncing {values} to parent mux {parent_mux}")
-
-        async with self.mux_clients.client(parent_mux.instance) as client:
-            match (
-                await client.request(
-                    MuxMethod.CLEAR_AND_REPLACE,
-                    ClearAndReplaceParams(
-                        location=parent_mux.location,
-                        namespace="INFO",
-                        values=values,
-                    ),
-                )
-            ):
-                case Ok():
-                    return Ok(PublishToParentResult())
-                case Err(e):
-                    match e:
-                        case MuxApiError():
-                            return Err(e)
-                        case _:
-                            return Err(MuxApiError.from_data(OtherMuxServerError(repr(e))))
+        self.connection_stats.record_notification(NvimExtensionMethod.PUBLISH_TO_PARENT.name)
+        # The publisher debounces, diffs against what the parent has and sends in the background
+        self.mux_publisher.request_publish()
+        return Ok(PublishToParentResult())
 
     @implements(NvimExtensionMethod.SYNC_REGISTERS_DOWN)
     async def sync_registers_down(
@@ -94,6 +132,7 @@ class NvimExtensionApiImpl:
         parent_reg = self.parent_info.parent_reg
 
         _LOGGER.info(f"Syncing down from parent reg {parent_reg}")
+        self.sync_stats.synced_down += 1
 
         async with self.reg_clients.client(parent_reg.instance) as client:
             match await client.request(
@@ -108,6 +147,7 @@ class NvimExtensionApiImpl:
 
         match await self.registers.clear_and_replace_registers(values):
             case Ok():
+                self.recent_registers.record({regname: values.get(regname) for regname in Regname})
                 return Ok(SyncRegistersDownResult())
             case Err(e):
                 _LOGGER.error(f"Failed to write parent's registers: {e}")
@@ -117,29 +157,214 @@ class NvimExtensionApiImpl:
     async def publish_registers(
         self, params: PublishRegistersParams
     ) -> Result[PublishRegistersResult, RegApiError]:
-        async with asyncio.TaskGroup() as tg:
-            links_task = tg.create_task(self.registers.list_links())
-            values_task = tg.create_task(self.registers.get_all_registers())
+        self.connection_stats.record_notification(NvimExtensionMethod.PUBLISH_REGISTERS.name)
+        # Bursts of yanks (e.g. macro playback) are merged into a single forward
+        self.reg_publisher.request_publish(params.key)
+        return Ok(PublishRegistersResult())
 
-        match links_task.result():
-            case Ok(links):
+    @implements(NvimExtensionMethod.REGISTER_METADATA)
+    async def register_metadata(
+        self, params: RegisterMetadataParams
+    ) -> Result[RegisterMetadataResult, RegApiError]:
+        # Hashed in nvim, so peers can decide what to fetch without the contents moving
+        match await self.registers.get_register_metadata(params.keys):
+            case Ok(metadata):
                 pass
             case Err(e):
                 return Err(e.to_reg_error())
-        match values_task.result():
-            case Ok(values):
+
+        registers: dict[Regname, RegisterInfo] = {}
+        for regname in Regname:
+            found = metadata.get(regname.value)
+            if found is not None:
+                registers[regname] = RegisterInfo(found.type, found.size, found.sha256)
+        return Ok(RegisterMetadataResult(registers))
+
+    @implements(NvimExtensionMethod.INVALIDATE_VARS)
+    async def invalidate_vars(
+        self, params: InvalidateVarsParams
+    ) -> Result[InvalidateVarsResult, MuxApiError]:
+        self.connection_stats.record_notification(NvimExtensionMethod.INVALIDATE_VARS.name)
+        try:
+            event = InvalidationEvent(params.event)
+        except ValueError:
+            _LOGGER.warning(f"Unknown invalidation event {params.event}, dropping all vars")
+            event = InvalidationEvent.VARS_CHANGED
+
+        self.var_cache.invalidate(event, params.location, params.namespace)
+        self.vim.forget_in_flight_reads()
+        return Ok(InvalidateVarsResult())
+
+    @implements(NvimExtensionMethod.RESOLVE_BATCH)
+    async def resolve_batch(
+        self, params: ResolveBatchParams
+    ) -> Result[ResolveBatchResult, MuxApiError]:
+        results = [
+            ResolvedLocation(location, namespace)
+            for location in params.locations
+            for namespace in params.namespaces
+        ]
+
+        # Cached locations are answered here, everything else goes to nvim in a single call
+        misses: list[tuple[ResolvedLocation, Reference]] = []
+        for resolved in results:
+            match parse_reference(resolved.location):
+                case Ok(ref):
+                    pass
+                case Err():
+                    self.vim.api_stats.record_error(NvimErrorCode.INVALID_NVIM_LOCATION.name)
+                    resolved.error = ResolveBatchError(
+                        code=NvimErrorCode.INVALID_NVIM_LOCATION.value,
+                        data=asdict(InvalidNvimLocation(resolved.location)),
+                    )
+                    continue
+
+            cached = self.var_cache.get_resolved(ref, resolved.namespace)
+            if cached is not None:
+                resolved.values = cached
+            else:
+                misses.append((resolved, ref))
+
+        if misses:
+            generation = self.var_cache.generation
+            match await self.vim_mux.resolve_batch(
+                [(ref, resolved.namespace) for resolved, ref in misses]
+            ):
+                case Ok(fetched):
+                    pass
+                case Err() as err:
+                    return err
+
+            for (resolved, ref), result in zip(misses, fetched):
+                match result:
+                    case Ok(values):
+                        resolved.values = values
+                        self.var_cache.put_resolved(ref, resolved.namespace, values, generation)
+                    case Err(location_dne):
+                        resolved.error = ResolveBatchError(
+                            code=MuxErrorCode.LOCATION_DOES_NOT_EXIST.value,
+                            data=asdict(
+                                LocationDoesNotExist(f"{location_dne.scope}:{location_dne.id}")
+                            ),
+                        )
+
+        return Ok(ResolveBatchResult(results))
+
+    @implements(NvimExtensionMethod.SNAPSHOT)
+    async def snapshot(self, _: SnapshotParams) -> Result[SnapshotResult, MuxApiError]:
+        match await self.vim_mux.tree_snapshot():
+            case Ok(delta):
+                return Ok(SnapshotResult(version=delta.version, nodes=_tree_nodes(delta.changed)))
+            case Err() as err:
+                return err
+
+    @implements(NvimExtensionMethod.CHANGES_SINCE)
+    async def changes_since(
+        self, params: ChangesSinceParams
+    ) -> Result[ChangesSinceResult, MuxApiError]:
+        match await self.vim_mux.tree_changes_since(params.version):
+            case Ok(delta):
+                return Ok(
+                    ChangesSinceResult(
+                        version=delta.version,
+                        reset=delta.reset,
+                        changed=_tree_nodes(delta.changed),
+                        removed=[id for id in delta.removed if isinstance(id, str)],
+                    )
+                )
+            case Err() as err:
+                return err
+
+    @implements(NvimExtensionMethod.SUBSCRIBE)
+    async def subscribe(self, params: SubscribeParams) -> Result[SubscribeResult, MuxApiError]:
+        match parse_reference(params.location):
+            case Ok(ref):
                 pass
+            case Err() as err:
+                self.vim.api_stats.record_error(NvimErrorCode.INVALID_NVIM_LOCATION.name)
+                return err
+
+        match await self.subscriptions.subscribe(
+            params.instance, params.location, ref, params.namespace, params.keys
+        ):
+            case Ok(subscription):
+                _LOGGER.info(f"{params.instance} subscribed to {params.location}")
+                return Ok(SubscribeResult(subscription.id, dict(subscription.last_sent)))
+            case Err() as err:
+                return err
+
+    @implements(NvimExtensionMethod.UNSUBSCRIBE)
+    async def unsubscribe(
+        self, params: UnsubscribeParams
+    ) -> Result[UnsubscribeResult, MuxApiError]:
+        if not self.subscriptions.unsubscribe(params.subscription):
+            _LOGGER.debug(f"Unsubscribing unknown subscription {params.subscription}")
+        return Ok(UnsubscribeResult())
+
+    async def refresh_defaults_stats(self) -> None:
+        match await self.vim_mux.get_defaults_stats():
+            case Ok(defaults_stats):
+                self.defaults_stats = (time.monotonic(), stats_to_json(defaults_stats))
             case Err(e):
-                return Err(e.to_reg_error())
+                _LOGGER.warning(f"Failed to get buffer defaults stats: {e}")
 
-        await self.reg_syncer.forward_sync_multiple(
-            registry="0",
-            visited_registries=[],
-            values={params.key: values[params.key] if params.key in values else None},
-            links=links,
+    @implements(NvimExtensionMethod.STATS)
+    async def stats(self, _: StatsParams) -> Result[StatsResult, MuxApiError]:
+        # Everything but the buffer defaults is counted on the hot path, this only snapshots it
+        worker = self.vim.worker
+        depths = worker.work_items.depth_by_priority()
+        # A blocked nvim must not hold up the stats that would explain why it is slow
+        if self.defaults_stats_refresh is None or self.defaults_stats_refresh.done():
+            self.defaults_stats_refresh = asyncio.create_task(self.refresh_defaults_stats())
+        if self.defaults_stats is None:
+            buffer_defaults: dict[str, ParsedJson] = {"available": False}
+        else:
+            fetched_at, defaults_stats = self.defaults_stats
+            buffer_defaults = {
+                "available": True,
+                "age_seconds": time.monotonic() - fetched_at,
+                **defaults_stats,
+            }
+        pools = {
+            name: stats_to_json(clients.stats)
+            for name, clients in (("mux", self.mux_clients), ("reg", self.reg_clients))
+            if isinstance(clients, PooledClientManager)
+        }
+        return Ok(
+            StatsResult(
+                queue={
+                    "depth": worker.queue_depth(),
+                    "oldest_item_age_seconds": worker.oldest_item_age(),
+                    "in_flight_requests": len(worker.in_flight),
+                    **stats_to_json(worker.queue_stats),
+                    "by_priority": {
+                        priority.name: {
+                            "depth": depths[priority.name],
+                            **stats_to_json(wait_stats),
+                        }
+                        for priority, wait_stats in worker.work_items.wait_stats.items()
+                    },
+                },
+                api_calls=stats_to_json(self.vim.api_stats.calls_by_func),
+                errors=dict(self.vim.api_stats.errors_by_code),
+                deduplicated=dict(self.vim.api_stats.deduplicated),
+                publishes={
+                    "mux": stats_to_json(self.mux_publisher.stats),
+                    "reg": stats_to_json(self.reg_publisher.stats),
+                },
+                syncs=stats_to_json(self.sync_stats),
+                batches=stats_to_json(worker.batch_stats),
+                var_cache={"hits": self.var_cache.hits, "misses": self.var_cache.misses},
+                pools=pools,
+                connections=stats_to_json(self.connection_stats),
+                subscriptions={
+                    "subscribers": len(self.subscriptions.subscribers),
+                    "subscriptions": self.subscriptions.subscription_count(),
+                    **stats_to_json(self.subscriptions.stats),
+                },
+                buffer_defaults=buffer_defaults,
+            )
         )
 
-        return Ok(PublishRegistersResult())
-
     def method_set(self) -> MethodSet:
         return make_method_set(NvimExtensionApiImpl, self)
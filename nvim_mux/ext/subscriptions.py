@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from itertools import count
+
+from jrpc.client import ClientManager
+from mux.errors import MuxApiError
+from result import Err, Ok, Result
+
+from nvim_mux.background import BackgroundTasks
+from nvim_mux.mux.mux_client import MuxClient, Reference
+
+from .api import NvimExtensionMethod, SubscriptionChange, SubscriptionChangedParams
+
+_LOGGER = logging.getLogger("subscriptions")
+
+
+@dataclass
+class SubscriptionStats:
+    changes_seen: int = 0
+    pushes: int = 0
+    skipped_unchanged: int = 0
+    resolve_failures: int = 0
+    dropped_subscribers: int = 0
+
+
+@dataclass
+class Subscription:
+    id: int
+    location: str
+    ref: Reference
+    namespace: str
+    keys: list[str] | None
+    # What the subscriber was last told, so only differences are pushed
+    last_sent: dict[str, str] = field(default_factory=dict)
+
+    def select(self, values: dict[str, str]) -> dict[str, str]:
+        if self.keys is None:
+            return dict(values)
+        return {key: values[key] for key in self.keys if key in values}
+
+    def diff(self, values: dict[str, str]) -> dict[str, str | None]:
+        changed: dict[str, str | None] = {
+            key: value for key, value in values.items() if self.last_sent.get(key) != value
+        }
+        for key in self.last_sent.keys() - values.keys():
+            changed[key] = None
+        return changed
+
+
+@dataclass
+class Subscriber:
+    instance: str
+    subscriptions: dict[int, Subscription] = field(default_factory=dict)
+    dirty: set[int] = field(default_factory=set)
+    pending: asyncio.Task[None] | None = None
+
+
+@dataclass
+class SubscriptionManager:
+    vim_mux: MuxClient
+    clients: ClientManager
+    debounce_seconds: float = 0.025
+    stats: SubscriptionStats = field(default_factory=SubscriptionStats)
+
+    def __post_init__(self) -> None:
+        self.subscribers: dict[str, Subscriber] = {}
+        self.ids = count(1)
+        self.background = BackgroundTasks("subscription push")
+
+    def subscription_count(self) -> int:
+        return sum(len(subscriber.subscriptions) for subscriber in self.subscribers.values())
+
+    async def subscribe(
+        self,
+        instance: str,
+        location: str,
+        ref: Reference,
+        namespace: str,
+        keys: list[str] | None,
+    ) -> Result[Subscription, MuxApiError]:
+        subscription = Subscription(next(self.ids), location, ref, namespace, keys)
+        subscriber = self.subscribers.setdefault(instance, Subscriber(instance))
+        # Registered before the first resolve, so changes made while it runs still get pushed
+        subscriber.subscriptions[subscription.id] = subscription
+
+        match await self.vim_mux.resolve_all_vars(ref, namespace):
+            case Ok(values):
+                subscription.last_sent = subscription.select(values)
+                return Ok(subscription)
+            case Err() as err:
+                self.remove(instance, subscription.id)
+                return err
+
+    def unsubscribe(self, subscription_id: int) -> bool:
+        for subscriber in list(self.subscribers.values()):
+            if subscription_id in subscriber.subscriptions:
+                self.remove(subscriber.instance, subscription_id)
+                return True
+        return False
+
+    def remove(self, instance: str, subscription_id: int) -> None:
+        subscriber = self.subscribers.get(instance)
+        if subscriber is None:
+            return
+        subscriber.subscriptions.pop(subscription_id, None)
+        subscriber.dirty.discard(subscription_id)
+        if not subscriber.subscriptions:
+            del self.subscribers[instance]
+            # Nothing is left to push, unless this is the push itself closing subscriptions
+            pending = subscriber.pending
+            if pending is not None and pending is not asyncio.current_task():
+                pending.cancel()
+
+    def mark_changed(self, namespace: str | None) -> None:
+        if not self.subscribers:
+            return
+
+        self.stats.changes_seen += 1
+        # Values are diffed before pushing, so marking too much only costs a resolve
+        for subscriber in self.subscribers.values():
+            for subscription in subscriber.subscriptions.values():
+                if namespace is None or subscription.namespace == namespace:
+                    subscriber.dirty.add(subscription.id)
+            if subscriber.dirty and (subscriber.pending is None or subscriber.pending.done()):
+                subscriber.pending = self.background.spawn(self.push_after_debounce(subscriber))
+
+    async def push_after_debounce(self, subscriber: Subscriber) -> None:
+        # Each subscriber has its own task, so a slow one only delays its own updates
+        while subscriber.dirty:
+            await asyncio.sleep(self.debounce_seconds)
+            dirty = [
+                subscriber.subscriptions[subscription_id]
+                for subscription_id in subscriber.dirty
+                if subscription_id in subscriber.subscriptions
+            ]
+            subscriber.dirty = set()
+            if dirty and not await self.push(subscriber, dirty):
+                _LOGGER.warning(f"Dropping subscriptions of unreachable {subscriber.instance}")
+                self.stats.dropped_subscribers += 1
+                if self.subscribers.get(subscriber.instance) is subscriber:
+                    del self.subscribers[subscriber.instance]
+                return
+
+    async def push(self, subscriber: Subscriber, subscriptions: list[Subscription]) -> bool:
+        match await self.vim_mux.resolve_batch(
+            [(subscription.ref, subscription.namespace) for subscription in subscriptions]
+        ):
+            case Ok(results):
+                pass
+            case Err(e):
+                _LOGGER.error(f"Failed to resolve subscribed vars: {e}")
+                self.stats.resolve_failures += 1
+                return True
+
+        changes: list[SubscriptionChange] = []
+        updates: list[tuple[Subscription, dict[str, str] | None]] = []
+        for subscription, result in zip(subscriptions, results):
+            match result:
+                case Ok(values):
+                    selected = subscription.select(values)
+                    changed = subscription.diff(selected)
+                    if changed:
+                        changes.append(
+                            SubscriptionChange(
+                                subscription=subscription.id,
+                                location=subscription.location,
+                                namespace=subscription.namespace,
+                                values=changed,
+                            )
+                        )
+                        updates.append((subscription, selected))
+                case Err():
+                    changes.append(
+                        SubscriptionChange(
+                            subscription=subscription.id,
+                            location=subscription.location,
+                            namespace=subscription.namespace,
+                            values={key: None for key in subscription.last_sent},
+                            closed=True,
+                        )
+                    )
+                    updates.append((subscription, None))
+
+        if not changes:
+            self.stats.skipped_unchanged += 1
+            return True
+
+        try:
+            async with self.clients.client(subscriber.instance) as client:
+                match await client.notify(
+                    NvimExtensionMethod.SUBSCRIPTION_CHANGED,
+                    SubscriptionChangedParams(changes),
+                ):
+                    case Err(e):
+                        _LOGGER.warning(f"Failed to push to subscriber {subscriber.instance}: {e}")
+                        return False
+        except Exception as e:
+            _LOGGER.warning(f"Failed to push to subscriber {subscriber.instance}: {e!r}")
+            return False
+
+        self.stats.pushes += 1
+        for subscription, selected in updates:
+            if selected is None:
+                # The location is gone, and the subscriber has been told so
+                self.remove(subscriber.instance, subscription.id)
+            else:
+                subscription.last_sent = selected
+        return True
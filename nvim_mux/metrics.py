@@ -0,0 +1,151 @@
+import inspect
+import logging
+from asyncio import StreamReader, StreamWriter
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field, fields, is_dataclass
+from time import perf_counter
+from typing import Any, TypeVar
+
+_LOGGER = logging.getLogger("metrics")
+
+T = TypeVar("T")
+
+ConnectionCallback = Callable[[StreamReader, StreamWriter], Awaitable[None] | None]
+
+# Upper bounds in milliseconds; the last bucket counts everything slower
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0)
+
+
+@dataclass
+class LatencyHistogram:
+    counts: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def buckets(self) -> dict[str, int]:
+        labels = [f"le_{bound:g}ms" for bound in LATENCY_BUCKETS_MS]
+        labels.append(f"gt_{LATENCY_BUCKETS_MS[-1]:g}ms")
+        return dict(zip(labels, self.counts))
+
+
+@dataclass
+class ApiCallStats:
+    calls: int = 0
+    errors: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+@dataclass
+class NvimApiStats:
+    calls_by_func: dict[str, ApiCallStats] = field(default_factory=dict)
+    errors_by_code: Counter[str] = field(default_factory=Counter)
+    # Calls that joined an identical in-flight read instead of making their own
+    deduplicated: Counter[str] = field(default_factory=Counter)
+
+    def record_call(self, api_func: str, seconds: float, error_code: str | None) -> None:
+        stats = self.calls_by_func.get(api_func)
+        if stats is None:
+            stats = self.calls_by_func[api_func] = ApiCallStats()
+        stats.calls += 1
+        stats.latency.record(seconds)
+        if error_code is not None:
+            stats.errors += 1
+            self.errors_by_code[error_code] += 1
+
+    def record_error(self, error_code: str) -> None:
+        self.errors_by_code[error_code] += 1
+
+
+@dataclass
+class SyncStats:
+    synced_down: int = 0
+    received_multiple: int = 0
+    received_all: int = 0
+    rejected_unlinked: int = 0
+    # Syncs where every register already had the value, so nothing was written or forwarded
+    dropped_redundant: int = 0
+    # Registers left out of syncs that were otherwise applied
+    dropped_registers: int = 0
+
+
+@dataclass
+class ConnectionStats:
+    connections_accepted: int = 0
+    connections_open: int = 0
+    notifications_received: int = 0
+    notifications_by_method: Counter[str] = field(default_factory=Counter)
+
+    def record_notification(self, method: str) -> None:
+        self.notifications_received += 1
+        self.notifications_by_method[method] += 1
+
+
+@dataclass
+class StartupTimings:
+    started_at: float = field(default_factory=perf_counter)
+    phases: dict[str, float] = field(default_factory=dict)
+    milestones: dict[str, float] = field(default_factory=dict)
+
+    def mark(self, milestone: str) -> None:
+        self.milestones[milestone] = perf_counter() - self.started_at
+
+    async def timed(self, phase: str, awaitable: Awaitable[T]) -> T:
+        start = perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[phase] = perf_counter() - start
+
+    def summary(self) -> str:
+        phases = ", ".join(
+            f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.phases.items()
+        )
+        milestones = ", ".join(
+            f"{name} at {seconds * 1000:.1f}ms" for name, seconds in self.milestones.items()
+        )
+        return f"phases: {phases}; since start: {milestones}"
+
+
+def stats_to_json(stats: Any) -> Any:
+    if isinstance(stats, LatencyHistogram):
+        return {
+            "buckets": stats.buckets(),
+            "total_seconds": stats.total_seconds,
+            "max_seconds": stats.max_seconds,
+        }
+    if is_dataclass(stats) and not isinstance(stats, type):
+        return {f.name: stats_to_json(getattr(stats, f.name)) for f in fields(stats)}
+    if isinstance(stats, dict):
+        # Counters may be keyed by ints, which json objects can't be
+        return {str(key): stats_to_json(value) for key, value in stats.items()}
+    if isinstance(stats, (list, tuple)):
+        return [stats_to_json(value) for value in stats]
+    return stats
+
+
+def counting_connection_callback(
+    callback: ConnectionCallback, stats: ConnectionStats
+) -> Callable[[StreamReader, StreamWriter], Awaitable[None]]:
+    async def on_connected(reader: StreamReader, writer: StreamWriter) -> None:
+        stats.connections_accepted += 1
+        stats.connections_open += 1
+        _LOGGER.debug(
+            f"Accepted connection {stats.connections_accepted} "
+            f"({stats.notifications_received} notifications received so far)"
+        )
+        try:
+            result: Any = callback(reader, writer)
+            if inspect.isawaitable(result):
+                await result
+        finally:
+            stats.connections_open -= 1
+
+    return on_connected
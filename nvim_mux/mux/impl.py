@@ -11,7 +11,6 @@ from mux.api import (
     GetMultipleResult,
     LocationInfoParams,
     LocationInfoResult,
-    MuxMethod,
     ResolveAllParams,
     ResolveAllResult,
     ResolveMultipleParams,
@@ -25,49 +24,112 @@ from result import Err, Ok, Result
 from typing_extensions import override
 
 from nvim_mux.data import ParentMux
+from nvim_mux.errors import NvimErrorCode
 from nvim_mux.mux.mux_client import MuxClient, Reference, Scope, parse_reference
+from nvim_mux.mux.publisher import MuxPublisher
+from nvim_mux.mux.var_cache import VarCache
 from nvim_mux.nvim_client import NvimClient
 
 _LOGGER = logging.getLogger("nvim-mux-impl")
 
 
+def _select_keys(values: dict[str, str], keys: list[str]) -> dict[str, str | None]:
+    return {key: values.get(key) for key in keys}
+
+
 @dataclass
 class NvimMuxApiImpl(MuxApi):
     clients: ClientManager
     parent_mux: ParentMux | None
     vim: NvimClient
+    var_cache: VarCache
 
     def __post_init__(self) -> None:
         self.vim_mux = MuxClient(self.vim)
-
-    @override
-    async def get_multiple(
-        self, params: GetMultipleParams
-    ) -> Result[GetMultipleResult, MuxApiError]:
-        result = await parse_reference(params.location).and_then_async(
-            lambda ref: self.vim_mux.get_all_vars(ref, params.namespace)
+        self.publisher = MuxPublisher(
+            parent_mux=self.parent_mux,
+            clients=self.clients,
+            resolve_session_info=self.resolve_session_info,
+            api_stats=self.vim.api_stats,
         )
 
+    async def get_all_vars(
+        self, ref: Reference, namespace: str
+    ) -> Result[dict[str, str], MuxApiError]:
+        cached = self.var_cache.get_stored(ref, namespace)
+        if cached is not None:
+            return Ok(cached)
+
+        generation = self.var_cache.generation
+        result = await self.vim_mux.get_all_vars(ref, namespace)
         match result:
-            case Ok(all_values):
-                pass
-            case Err():
-                return result
+            case Ok(values):
+                self.var_cache.put_stored(ref, namespace, values, generation)
+        return result
+
+    async def resolve_all_vars(
+        self, ref: Reference, namespace: str
+    ) -> Result[dict[str, str], MuxApiError]:
+        cached = self.var_cache.get_resolved(ref, namespace)
+        if cached is not None:
+            return Ok(cached)
+
+        generation = self.var_cache.generation
+        result = await self.vim_mux.resolve_all_vars(ref, namespace)
+        match result:
+            case Ok(values):
+                self.var_cache.put_resolved(ref, namespace, values, generation)
+        return result
+
+    async def get_multiple_vars(
+        self, ref: Reference, namespace: str, keys: list[str]
+    ) -> Result[dict[str, str], MuxApiError]:
+        cached = self.var_cache.get_stored(ref, namespace)
+        if cached is not None:
+            return Ok(cached)
+        return await self.vim_mux.get_multiple_vars(ref, namespace, keys)
+
+    async def resolve_multiple_vars(
+        self, ref: Reference, namespace: str, keys: list[str]
+    ) -> Result[dict[str, str], MuxApiError]:
+        cached = self.var_cache.get_resolved(ref, namespace)
+        if cached is not None:
+            return Ok(cached)
+        return await self.vim_mux.resolve_multiple_vars(ref, namespace, keys)
+
+    async def set_multiple_vars(
+        self, ref: Reference, namespace: str, values: dict[str, str | None]
+    ) -> Result[None, MuxApiError]:
+        result = await self.vim_mux.set_multiple_vars(ref, namespace, values)
+        match result:
+            case Ok():
+                self.var_cache.apply_set_multiple(ref, namespace, values)
+        return result
 
-        values: dict[str, str | None] = {}
-        for key in params.keys:
-            if key in all_values:
-                values[key] = all_values[key]
-            else:
-                values[key] = None
+    async def clear_and_replace_vars(
+        self, ref: Reference, namespace: str, values: dict[str, str]
+    ) -> Result[None, MuxApiError]:
+        result = await self.vim_mux.clear_and_replace_vars(ref, namespace, values)
+        match result:
+            case Ok():
+                self.var_cache.apply_clear_and_replace(ref, namespace, values)
+        return result
 
-        return Ok(GetMultipleResult(values))
+    @override
+    async def get_multiple(
+        self, params: GetMultipleParams
+    ) -> Result[GetMultipleResult, MuxApiError]:
+        return (
+            await self.parse_reference(params.location).and_then_async(
+                lambda ref: self.get_multiple_vars(ref, params.namespace, params.keys)
+            )
+        ).map(lambda values: GetMultipleResult(_select_keys(values, params.keys)))
 
     @override
     async def get_all(self, params: GetAllParams) -> Result[GetAllResult, MuxApiError]:
         return (
-            await parse_reference(params.location).and_then_async(
-                lambda ref: self.vim_mux.get_all_vars(ref, params.namespace)
+            await self.parse_reference(params.location).and_then_async(
+                lambda ref: self.get_all_vars(ref, params.namespace)
             )
         ).map(GetAllResult)
 
@@ -75,66 +137,44 @@ class NvimMuxApiImpl(MuxApi):
     async def resolve_multiple(
         self, params: ResolveMultipleParams
     ) -> Result[ResolveMultipleResult, MuxApiError]:
-        result = await parse_reference(params.location).and_then_async(
-            lambda ref: self.vim_mux.resolve_all_vars(ref, params.namespace)
-        )
-
-        match result:
-            case Ok(all_values):
-                pass
-            case Err():
-                return result
-
-        values: dict[str, str | None] = {}
-        for key in params.keys:
-            if key in all_values:
-                values[key] = all_values[key]
-            else:
-                values[key] = None
-
-        return Ok(ResolveMultipleResult(values))
+        return (
+            await self.parse_reference(params.location).and_then_async(
+                lambda ref: self.resolve_multiple_vars(ref, params.namespace, params.keys)
+            )
+        ).map(lambda values: ResolveMultipleResult(_select_keys(values, params.keys)))
 
     @override
     async def resolve_all(self, params: ResolveAllParams) -> Result[ResolveAllResult, MuxApiError]:
         return (
-            await parse_reference(params.location).and_then_async(
-                lambda ref: self.vim_mux.resolve_all_vars(ref, params.namespace)
+            await self.parse_reference(params.location).and_then_async(
+                lambda ref: self.resolve_all_vars(ref, params.namespace)
             )
         ).map(ResolveAllResult)
 
-    async def publish(self) -> None:
-        if self.parent_mux is None:
-            return
+    def parse_reference(self, raw_value: str) -> Result[Reference, MuxApiError]:
+        match parse_reference(raw_value):
+            case Ok() as ok:
+                return ok
+            case Err() as err:
+                self.vim.api_stats.record_error(NvimErrorCode.INVALID_NVIM_LOCATION.name)
+                return err
 
-        async with self.clients.client(self.parent_mux.instance) as client:
-            session_info_result = await self.vim_mux.resolve_all_vars(
-                Reference("s:0", 0, Scope.SESSION), "INFO"
-            )
-            match session_info_result:
-                case Ok(session_info):
-                    pass
-                case Err():
-                    return
-
-            match await client.notify(
-                MuxMethod.CLEAR_AND_REPLACE,
-                ClearAndReplaceParams(
-                    location=self.parent_mux.location, namespace="INFO", values=session_info
-                ),
-            ):
-                case Err(e):
-                    _LOGGER.warning(f"Failed to publish to parent mux: {e}")
+    async def resolve_session_info(self) -> Result[dict[str, str], MuxApiError]:
+        return await self.resolve_all_vars(Reference("s:0", 0, Scope.SESSION), "INFO")
+
+    async def publish(self) -> None:
+        await self.publisher.publish_now()
 
     @override
     async def set_multiple(
         self, params: SetMultipleParams
     ) -> Result[SetMultipleResult, MuxApiError]:
-        match await parse_reference(params.location).and_then_async(
-            lambda ref: self.vim_mux.set_multiple_vars(ref, params.namespace, params.values)
+        match await self.parse_reference(params.location).and_then_async(
+            lambda ref: self.set_multiple_vars(ref, params.namespace, params.values)
         ):
             case Ok():
                 if params.namespace == "INFO":
-                    await self.publish()
+                    self.publisher.request_publish()
                 return Ok(SetMultipleResult())
             case Err() as err:
                 return err
@@ -143,12 +183,12 @@ class NvimMuxApiImpl(MuxApi):
     async def clear_and_replace(
         self, params: ClearAndReplaceParams
     ) -> Result[ClearAndReplaceResult, MuxApiError]:
-        match await parse_reference(params.location).and_then_async(
-            lambda ref: self.vim_mux.clear_and_replace_vars(ref, params.namespace, params.values)
+        match await self.parse_reference(params.location).and_then_async(
+            lambda ref: self.clear_and_replace_vars(ref, params.namespace, params.values)
         ):
             case Ok():
                 if params.namespace == "INFO":
-                    await self.publish()
+                    self.publisher.request_publish()
                 return Ok(ClearAndReplaceResult())
             case Err() as err:
                 return err
@@ -157,6 +197,6 @@ class NvimMuxApiImpl(MuxApi):
     async def get_location_info(
         self, params: LocationInfoParams
     ) -> Result[LocationInfoResult, MuxApiError]:
-        return await parse_reference(params.ref).and_then_async(
+        return await self.parse_reference(params.ref).and_then_async(
             lambda ref: self.vim_mux.get_location_info(ref)
         )
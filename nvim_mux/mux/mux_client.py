@@ -2,12 +2,22 @@ import logging
 from dataclasses import dataclass
 from enum import StrEnum
 
+from jrpc.data import ParsedJson
 from mux.api import LocationInfoResult
 from mux.errors import MuxApiError
 from result import Err, Ok, Result
 
-from nvim_mux.errors import InvalidNvimLocation
-from nvim_mux.nvim_api import Empty, VariableValues
+from nvim_mux.errors import InvalidNvimLocation, NvimLuaInvalidResponse
+from nvim_mux.nvim_api import (
+    ERROR_TYPES_BY_CODE,
+    DefaultsStats,
+    Empty,
+    LocationDne,
+    ResolvedBatch,
+    TreeDelta,
+    VariableValues,
+    decode,
+)
 from nvim_mux.nvim_client import NvimClient
 
 _LOGGER = logging.getLogger("mux-client")
@@ -30,7 +40,7 @@ _SCOPE_BY_REF_PREFIX = {
 }
 
 
-@dataclass
+@dataclass(frozen=True)
 class Reference:
     raw_value: str
     target_id: int
@@ -38,13 +48,9 @@ class Reference:
 
 
 def parse_reference(raw_value: str) -> Result[Reference, MuxApiError]:
-    colon_ind = raw_value.find(":")
-    if colon_ind < 0:
-        return Err(MuxApiError.from_data(InvalidNvimLocation(raw_value)))
-
-    prefix = raw_value[:colon_ind]
-    suffix = raw_value[colon_ind + 1 :]
-    if prefix not in _SCOPE_BY_REF_PREFIX:
+    prefix, colon, suffix = raw_value.partition(":")
+    scope = _SCOPE_BY_REF_PREFIX.get(prefix)
+    if not colon or scope is None:
         return Err(MuxApiError.from_data(InvalidNvimLocation(raw_value)))
 
     target_id: int
@@ -53,9 +59,26 @@ def parse_reference(raw_value: str) -> Result[Reference, MuxApiError]:
     except ValueError:
         return Err(MuxApiError.from_data(InvalidNvimLocation(raw_value)))
 
-    return Ok(
-        Reference(raw_value=raw_value, target_id=target_id, scope=_SCOPE_BY_REF_PREFIX[prefix])
-    )
+    return Ok(Reference(raw_value=raw_value, target_id=target_id, scope=scope))
+
+
+def _resolve_batch_output(output: ParsedJson) -> Result[dict[str, str], LocationDne] | None:
+    if not isinstance(output, dict):
+        return None
+
+    if "result" in output:
+        match decode(VariableValues, output["result"]):
+            case Ok(VariableValues(values)):
+                return Ok(values if isinstance(values, dict) else dict())
+            case Err():
+                return None
+
+    error = output.get("error")
+    if isinstance(error, dict) and error.get("code") in ERROR_TYPES_BY_CODE:
+        match decode(ERROR_TYPES_BY_CODE[error["code"]], error.get("data")):
+            case Ok(location_dne):
+                return Err(location_dne)
+    return None
 
 
 @dataclass
@@ -98,6 +121,42 @@ class MuxClient:
             case Err(e):
                 return Err(e.to_mux_error())
 
+    async def get_multiple_vars(
+        self, ref: Reference, namespace: str, keys: list[str]
+    ) -> Result[dict[str, str], MuxApiError]:
+        match await self.vim.call_api(
+            "get_multiple_vars",
+            VariableValues,
+            ref.scope.value,
+            ref.target_id,
+            namespace,
+            keys,
+        ):
+            case Ok(result):
+                if isinstance(result.values, dict):
+                    return Ok(result.values)
+                return Ok(dict())
+            case Err(e):
+                return Err(e.to_mux_error())
+
+    async def resolve_multiple_vars(
+        self, ref: Reference, namespace: str, keys: list[str]
+    ) -> Result[dict[str, str], MuxApiError]:
+        match await self.vim.call_api(
+            "resolve_multiple_vars",
+            VariableValues,
+            ref.scope.value,
+            ref.target_id,
+            namespace,
+            keys,
+        ):
+            case Ok(result):
+                if isinstance(result.values, dict):
+                    return Ok(result.values)
+                return Ok(dict())
+            case Err(e):
+                return Err(e.to_mux_error())
+
     async def clear_and_replace_vars(
         self, ref: Reference, namespace: str, values: dict[str, str]
     ) -> Result[None, MuxApiError]:
@@ -133,6 +192,42 @@ class MuxClient:
             case Err(e):
                 return Err(e.to_mux_error())
 
+    async def resolve_batch(
+        self, requests: list[tuple[Reference, str]]
+    ) -> Result[list[Result[dict[str, str], LocationDne]], MuxApiError]:
+        match await self.vim.call_api(
+            "resolve_batch",
+            ResolvedBatch,
+            [
+                {"scope": ref.scope.value, "id": ref.target_id, "namespace": namespace}
+                for ref, namespace in requests
+            ],
+        ):
+            case Ok(ResolvedBatch(outputs)):
+                pass
+            case Err(e):
+                return Err(e.to_mux_error())
+
+        results = [_resolve_batch_output(output) for output in outputs]
+        if len(results) != len(requests) or None in results:
+            return Err(NvimLuaInvalidResponse("resolve_batch", repr(outputs)).to_mux_error())
+        return Ok([result for result in results if result is not None])
+
+    async def get_defaults_stats(self) -> Result[DefaultsStats, MuxApiError]:
+        return (await self.vim.call_api("get_defaults_stats", DefaultsStats)).map_err(
+            lambda e: e.to_mux_error()
+        )
+
+    async def tree_snapshot(self) -> Result[TreeDelta, MuxApiError]:
+        return (await self.vim.call_api("tree_snapshot", TreeDelta)).map_err(
+            lambda e: e.to_mux_error()
+        )
+
+    async def tree_changes_since(self, version: int) -> Result[TreeDelta, MuxApiError]:
+        return (await self.vim.call_api("tree_changes_since", TreeDelta, version)).map_err(
+            lambda e: e.to_mux_error()
+        )
+
     async def get_location_info(self, ref: Reference) -> Result[LocationInfoResult, MuxApiError]:
         return (
             await self.vim.call_api(
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from jrpc.client import ClientManager
+from mux.api import ClearAndReplaceParams, MuxMethod, SetMultipleParams
+from mux.errors import MuxApiError
+from result import Err, Ok, Result
+
+from nvim_mux.background import BackgroundTasks
+from nvim_mux.data import ParentMux
+from nvim_mux.errors import NvimErrorCode, OtherMuxServerError
+from nvim_mux.metrics import NvimApiStats
+
+_LOGGER = logging.getLogger("mux-publisher")
+
+
+@dataclass
+class PublisherStats:
+    requested: int = 0
+    sent_full: int = 0
+    sent_partial: int = 0
+    skipped_unchanged: int = 0
+    failed: int = 0
+
+
+@dataclass
+class MuxPublisher:
+    parent_mux: ParentMux | None
+    clients: ClientManager
+    resolve_session_info: Callable[[], Awaitable[Result[dict[str, str], MuxApiError]]]
+    api_stats: NvimApiStats
+    debounce_seconds: float = 0.025
+    stats: PublisherStats = field(default_factory=PublisherStats)
+
+    def __post_init__(self) -> None:
+        self.last_published: dict[str, str] | None = None
+        self.pending: asyncio.Task[Result[None, MuxApiError]] | None = None
+        self.lock = asyncio.Lock()
+        self.background = BackgroundTasks("mux publish")
+
+    def request_publish(self) -> None:
+        if self.parent_mux is None:
+            return
+
+        self.stats.requested += 1
+        if self.pending is None or self.pending.done():
+            self.pending = self.background.spawn(self.publish_after_debounce())
+
+    async def publish_after_debounce(self) -> Result[None, MuxApiError]:
+        await asyncio.sleep(self.debounce_seconds)
+        # Requests from here on need a fresh resolve, so they get their own publish
+        self.pending = None
+        return await self.publish_now()
+
+    async def publish_now(self) -> Result[None, MuxApiError]:
+        if self.parent_mux is None:
+            return Ok(None)
+        parent_mux = self.parent_mux
+
+        # Serialized so each diff is against what the parent actually has
+        async with self.lock:
+            match await self.resolve_session_info():
+                case Ok(values):
+                    pass
+                case Err() as err:
+                    return err
+
+            last_published = self.last_published
+            if values == last_published:
+                self.stats.skipped_unchanged += 1
+                return Ok(None)
+
+            async with self.clients.client(parent_mux.instance) as client:
+                if last_published is None:
+                    _LOGGER.info(f"Publishing {values} to parent mux {parent_mux}")
+                    result = await client.request(
+                        MuxMethod.CLEAR_AND_REPLACE,
+                        ClearAndReplaceParams(
+                            location=parent_mux.location,
+                            namespace="INFO",
+                            values=values,
+                        ),
+                    )
+                else:
+                    changed: dict[str, str | None] = {
+                        key: value
+                        for key, value in values.items()
+                        if last_published.get(key) != value
+                    }
+                    for key in last_published.keys() - values.keys():
+                        changed[key] = None
+
+                    _LOGGER.info(f"Publishing changes {changed} to parent mux {parent_mux}")
+                    result = await client.request(
+                        MuxMethod.SET_MULTIPLE,
+                        SetMultipleParams(
+                            location=parent_mux.location,
+                            namespace="INFO",
+                            values=changed,
+                        ),
+                    )
+
+            match result:
+                case Ok():
+                    if last_published is None:
+                        self.stats.sent_full += 1
+                    else:
+                        self.stats.sent_partial += 1
+                    self.last_published = values
+                    return Ok(None)
+                case Err(e):
+                    _LOGGER.warning(f"Failed to publish to parent mux: {e}")
+                    self.stats.failed += 1
+                    # We no longer know what the parent has, so the next publish is a full one
+                    self.last_published = None
+                    match e:
+                        case MuxApiError():
+                            return Err(e)
+                        case _:
+                            # Not an answer from the parent, so the pool has dropped the connection
+                            self.api_stats.record_error(
+                                NvimErrorCode.NVIM_OTHER_MUX_SERVER_ERROR.name
+                            )
+                            return Err(MuxApiError.from_data(OtherMuxServerError(repr(e))))
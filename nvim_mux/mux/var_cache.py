@@ -0,0 +1,161 @@
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+from nvim_mux.mux.mux_client import Reference, Scope
+
+_LOGGER = logging.getLogger("var-cache")
+
+CacheKey = tuple[str, str]
+
+
+class InvalidationEvent(StrEnum):
+    FOCUS_CHANGED = "focus-changed"
+    DEFAULTS_CHANGED = "defaults-changed"
+    VARS_CHANGED = "vars-changed"
+    BUFFER_WIPED = "buffer-wiped"
+    WINDOW_CLOSED = "window-closed"
+    TAB_CLOSED = "tab-closed"
+
+
+def _location_key(ref: Reference) -> str:
+    if ref.scope == Scope.SESSION:
+        # every session reference points at the same dict
+        return "s:0"
+    return f"{ref.scope.value}:{ref.target_id}"
+
+
+def _is_aliased(location: str) -> bool:
+    # current-location (id 0) and pid references move around as focus and terminals change
+    return location.startswith("pid:") or (location.endswith(":0") and location != "s:0")
+
+
+def _scope_family(location: str) -> str:
+    scope = location.split(":", 1)[0]
+    if scope == Scope.PID.value:
+        return Scope.BUFFER.value
+    return scope
+
+
+@dataclass
+class VarCache:
+    stored: dict[CacheKey, dict[str, str]] = field(default_factory=dict)
+    resolved: dict[CacheKey, dict[str, str]] = field(default_factory=dict)
+    generation: int = 0
+    hits: int = 0
+    misses: int = 0
+    # Called with the namespace that may have changed, or None when it could be any
+    listeners: list[Callable[[str | None], None]] = field(default_factory=list)
+
+    def notify_listeners(self, namespace: str | None) -> None:
+        for listener in self.listeners:
+            listener(namespace)
+
+    def get_stored(self, ref: Reference, namespace: str) -> dict[str, str] | None:
+        return self._lookup(self.stored, (_location_key(ref), namespace))
+
+    def get_resolved(self, ref: Reference, namespace: str) -> dict[str, str] | None:
+        return self._lookup(self.resolved, (_location_key(ref), namespace))
+
+    def _lookup(
+        self, entries: dict[CacheKey, dict[str, str]], key: CacheKey
+    ) -> dict[str, str] | None:
+        if key in entries:
+            self.hits += 1
+            return dict(entries[key])
+        self.misses += 1
+        return None
+
+    def put_stored(
+        self, ref: Reference, namespace: str, values: dict[str, str], generation: int
+    ) -> None:
+        # Anything fetched before an invalidation may already be stale
+        if generation == self.generation:
+            self.stored[(_location_key(ref), namespace)] = dict(values)
+
+    def put_resolved(
+        self, ref: Reference, namespace: str, values: dict[str, str], generation: int
+    ) -> None:
+        if generation == self.generation:
+            self.resolved[(_location_key(ref), namespace)] = dict(values)
+
+    def apply_set_multiple(
+        self, ref: Reference, namespace: str, values: dict[str, str | None]
+    ) -> None:
+        key = (_location_key(ref), namespace)
+        current = self.stored.pop(key, None)
+        self._drop_namespace_for_write(key)
+        # lua stores a None as vim.NIL rather than deleting the key, so those are left to nvim
+        if current is None or None in values.values():
+            return
+
+        current.update({var: value for var, value in values.items() if value is not None})
+        self.stored[key] = current
+
+    def apply_clear_and_replace(
+        self, ref: Reference, namespace: str, values: dict[str, str]
+    ) -> None:
+        key = (_location_key(ref), namespace)
+        self._drop_namespace_for_write(key)
+        self.stored[key] = dict(values)
+
+    def _drop_namespace_for_write(self, key: CacheKey) -> None:
+        self.generation += 1
+        location, namespace = key
+        self.notify_listeners(namespace)
+        family = _scope_family(location)
+        aliased = _is_aliased(location)
+
+        self.resolved = {k: v for k, v in self.resolved.items() if k[1] != namespace}
+        self.stored = {
+            k: v
+            for k, v in self.stored.items()
+            if k == key
+            or k[1] != namespace
+            or _scope_family(k[0]) != family
+            or not (aliased or _is_aliased(k[0]))
+        }
+
+    def invalidate(
+        self,
+        event: InvalidationEvent,
+        location: str | None = None,
+        namespace: str | None = None,
+    ) -> None:
+        _LOGGER.debug(f"Invalidating for {event} at {location}")
+        self.generation += 1
+        match event:
+            case InvalidationEvent.VARS_CHANGED:
+                self.notify_listeners(namespace)
+            case InvalidationEvent.DEFAULTS_CHANGED:
+                # Defaults, such as a terminal's title, are only INFO values
+                self.notify_listeners("INFO")
+            case _:
+                self.notify_listeners(None)
+
+        # Every event can change what a location resolves to
+        self.resolved.clear()
+
+        match event:
+            case InvalidationEvent.FOCUS_CHANGED:
+                self._drop_stored(_is_aliased)
+            case InvalidationEvent.DEFAULTS_CHANGED:
+                pass
+            case InvalidationEvent.VARS_CHANGED:
+                if namespace is None:
+                    self.stored.clear()
+                else:
+                    self.stored = {k: v for k, v in self.stored.items() if k[1] != namespace}
+            case InvalidationEvent.BUFFER_WIPED:
+                self._drop_stored(
+                    lambda loc: loc == location or loc.startswith("pid:") or _is_aliased(loc)
+                )
+            case InvalidationEvent.WINDOW_CLOSED:
+                self._drop_stored(lambda loc: loc == location or _is_aliased(loc))
+            case InvalidationEvent.TAB_CLOSED:
+                # nvim only reports the tab number, not the handle
+                self._drop_stored(lambda loc: loc.startswith("t:") or _is_aliased(loc))
+
+    def _drop_stored(self, should_drop: Callable[[str], bool]) -> None:
+        self.stored = {k: v for k, v in self.stored.items() if not should_drop(k[0])}
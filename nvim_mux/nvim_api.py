@@ -1,9 +1,15 @@
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, field
+from typing import Any, TypeVar, cast
 
 from dataclasses_json import config
-from jrpc.data import JsonTryLoadMixin
+from jrpc.data import JsonTryLoadMixin, ParsedJson
 from marshmallow import fields
+from mux.api import LocationInfoResult
 from mux.errors import LocationDoesNotExist, MuxApiError, MuxErrorCode
+from result import Err, Ok, Result
+
+TLoaded = TypeVar("TLoaded", bound=JsonTryLoadMixin)
 
 
 @dataclass
@@ -11,6 +17,37 @@ class VariableValues(JsonTryLoadMixin):
     values: dict[str, str] | tuple[str] = field(metadata=config(mm_field=fields.Raw()))
 
 
+@dataclass
+class ResolvedBatch(JsonTryLoadMixin):
+    results: list[ParsedJson] = field(metadata=config(mm_field=fields.List(fields.Raw())))
+
+
+@dataclass
+class TreeDelta(JsonTryLoadMixin):
+    version: int
+    reset: bool
+    changed: list[ParsedJson] = field(metadata=config(mm_field=fields.List(fields.Raw())))
+    removed: list[ParsedJson] = field(metadata=config(mm_field=fields.List(fields.Raw())))
+
+
+@dataclass
+class RegisterMetadata(JsonTryLoadMixin):
+    type: str
+    size: int
+    sha256: str
+
+
+@dataclass
+class RegisterMetadataValues(JsonTryLoadMixin):
+    registers: dict[str, RegisterMetadata]
+
+
+@dataclass
+class DefaultsStats(JsonTryLoadMixin):
+    hits: int
+    recomputes: int
+
+
 @dataclass
 class LinkCounts(JsonTryLoadMixin):
     links: dict[str, dict[str, int]]
@@ -31,3 +68,130 @@ class LocationDne(JsonTryLoadMixin):
 
 
 ERROR_TYPES_BY_CODE = {MuxErrorCode.LOCATION_DOES_NOT_EXIST: LocationDne}
+
+
+# The shapes lua sends back are fixed, so they are checked by hand instead of building them
+# through dataclasses_json and marshmallow. Each decoder accepts what try_load accepts: a mapping
+# with the required keys (extra keys ignored), and returns None where try_load would fail.
+
+
+def _decode_variable_values(data: ParsedJson) -> VariableValues | None:
+    if not isinstance(data, Mapping):
+        return None
+    values = data.get("values")
+    if values is None:
+        return None
+    return VariableValues(values)
+
+
+def _decode_link_counts(data: ParsedJson) -> LinkCounts | None:
+    if not isinstance(data, Mapping):
+        return None
+    links = data.get("links")
+    if not isinstance(links, Mapping):
+        return None
+    for instance, registries in links.items():
+        if not isinstance(instance, str) or not isinstance(registries, Mapping):
+            return None
+        for registry, count in registries.items():
+            if not isinstance(registry, str) or not isinstance(count, int):
+                return None
+    return LinkCounts(links)
+
+
+def _decode_register_metadata(data: ParsedJson) -> RegisterMetadataValues | None:
+    if not isinstance(data, Mapping):
+        return None
+    raw_registers = data.get("registers")
+    # lua sends an empty table as a list
+    if raw_registers == []:
+        return RegisterMetadataValues({})
+    if not isinstance(raw_registers, Mapping):
+        return None
+
+    registers: dict[str, RegisterMetadata] = {}
+    for regname, metadata in raw_registers.items():
+        if not isinstance(metadata, Mapping):
+            return None
+        regtype = metadata.get("type")
+        size = metadata.get("size")
+        sha256 = metadata.get("sha256")
+        if not isinstance(regtype, str) or not isinstance(size, int) or not isinstance(sha256, str):
+            return None
+        registers[regname] = RegisterMetadata(regtype, size, sha256)
+    return RegisterMetadataValues(registers)
+
+
+def _decode_resolved_batch(data: ParsedJson) -> ResolvedBatch | None:
+    if not isinstance(data, Mapping):
+        return None
+    results = data.get("results")
+    if not isinstance(results, list):
+        return None
+    return ResolvedBatch(results)
+
+
+def _decode_tree_delta(data: ParsedJson) -> TreeDelta | None:
+    if not isinstance(data, Mapping):
+        return None
+    version = data.get("version")
+    reset = data.get("reset")
+    changed = data.get("changed")
+    removed = data.get("removed")
+    if (
+        not isinstance(version, int)
+        or not isinstance(reset, bool)
+        or not isinstance(changed, list)
+        or not isinstance(removed, list)
+    ):
+        return None
+    return TreeDelta(version, reset, changed, removed)
+
+
+def _decode_empty(data: ParsedJson) -> Empty | None:
+    if not isinstance(data, Mapping):
+        return None
+    return Empty()
+
+
+def _decode_location_info(data: ParsedJson) -> LocationInfoResult | None:
+    if not isinstance(data, Mapping):
+        return None
+    exists = data.get("exists")
+    id = data.get("id")
+    if not isinstance(exists, bool) or not (id is None or isinstance(id, str)):
+        return None
+    return LocationInfoResult(exists=exists, id=id)
+
+
+def _decode_location_dne(data: ParsedJson) -> LocationDne | None:
+    if not isinstance(data, Mapping):
+        return None
+    scope = data.get("scope")
+    id = data.get("id")
+    if not isinstance(scope, str) or not isinstance(id, int):
+        return None
+    return LocationDne(scope, id)
+
+
+DECODERS: dict[type, Callable[[ParsedJson], Any]] = {
+    VariableValues: _decode_variable_values,
+    LinkCounts: _decode_link_counts,
+    RegisterMetadataValues: _decode_register_metadata,
+    ResolvedBatch: _decode_resolved_batch,
+    TreeDelta: _decode_tree_delta,
+    Empty: _decode_empty,
+    LocationInfoResult: _decode_location_info,
+    LocationDne: _decode_location_dne,
+}
+
+
+def decode(output_type: type[TLoaded], data: ParsedJson) -> Result[TLoaded, None]:
+    decoder = DECODERS.get(output_type)
+    if decoder is None:
+        return output_type.try_load(data).map_err(lambda _: None)
+
+    decoded = decoder(data)
+    if decoded is None:
+        return Err(None)
+    return Ok(cast(TLoaded, decoded))
@@ -1,37 +1,114 @@
 import asyncio
 import logging
+import os
 from collections.abc import Mapping
-from concurrent import futures
-from dataclasses import dataclass
-from queue import SimpleQueue
+from dataclasses import dataclass, field
+from time import perf_counter
 from typing import Any, TypeVar
 
 from jrpc.data import JsonTryLoadMixin, ParsedJson
+from mux.errors import MuxErrorCode
 from result import Err, Ok, Result
 
-from . import nvim_thread
-from .errors import NvimLuaApiError, NvimLuaInvalidResponse
-from .nvim_api import ERROR_TYPES_BY_CODE, LocationDne
-from .nvim_thread import NvimWorkItem
+from . import nvim_worker
+from .errors import NvimErrorCode, NvimLuaApiError, NvimLuaInvalidResponse
+from .metrics import NvimApiStats
+from .nvim_api import ERROR_TYPES_BY_CODE, LocationDne, decode
+from .nvim_worker import NvimPriority, NvimWorker, NvimWorkItem
+from .recording import TrafficRecorder
 
 _LOGGER = logging.getLogger("nvim-client")
 
 
 TOutput = TypeVar("TOutput", bound=JsonTryLoadMixin)
 
+# Concurrent identical calls to these share one nvim request. The tree calls are left out, since
+# they start and update change tracking in nvim.
+READ_ONLY_APIS = frozenset(
+    [
+        "get_all_vars",
+        "resolve_all_vars",
+        "get_multiple_vars",
+        "resolve_multiple_vars",
+        "resolve_batch",
+        "get_location_info",
+        "get_defaults_stats",
+        "get_all_registers",
+        "get_multiple_registers",
+        "get_register_metadata",
+        "list_reg_links",
+    ]
+)
+
+# A blocked nvim (e.g. a hit-enter prompt) fails calls after these instead of hanging them.
+# Prompts give up quickly, while large register transfers get time to finish behind other work.
+DEFAULT_CALL_TIMEOUTS: dict[NvimPriority, float] = {
+    NvimPriority.INTERACTIVE: 2.0,
+    NvimPriority.WRITE: 10.0,
+    NvimPriority.BULK: 120.0,
+}
+
+# Anything not listed is a write
+API_PRIORITIES: dict[str, NvimPriority] = {
+    "get_all_vars": NvimPriority.INTERACTIVE,
+    "resolve_all_vars": NvimPriority.INTERACTIVE,
+    "get_multiple_vars": NvimPriority.INTERACTIVE,
+    "resolve_multiple_vars": NvimPriority.INTERACTIVE,
+    "resolve_batch": NvimPriority.INTERACTIVE,
+    "get_location_info": NvimPriority.INTERACTIVE,
+    "tree_snapshot": NvimPriority.INTERACTIVE,
+    "tree_changes_since": NvimPriority.INTERACTIVE,
+    "get_register_metadata": NvimPriority.INTERACTIVE,
+    "get_all_registers": NvimPriority.BULK,
+    "get_multiple_registers": NvimPriority.BULK,
+    "set_multiple_registers": NvimPriority.BULK,
+    "clear_and_replace_registers": NvimPriority.BULK,
+    "stage_register_chunk": NvimPriority.BULK,
+    "discard_staged": NvimPriority.BULK,
+}
+
 
 @dataclass
 class NvimClient:
-    vim_queue: SimpleQueue[NvimWorkItem]
+    worker: NvimWorker
     logging_level: int
-
-    async def exec_lua(self, lua: str, *args: ParsedJson) -> Result[Any, NvimLuaApiError]:
+    api_stats: NvimApiStats = field(default_factory=NvimApiStats)
+    recorder: TrafficRecorder | None = None
+    call_timeouts: dict[NvimPriority, float] = field(
+        default_factory=lambda: dict(DEFAULT_CALL_TIMEOUTS)
+    )
+    in_flight_reads: dict[tuple[str, type, str, float | None], asyncio.Task[Any]] = field(
+        default_factory=dict, repr=False
+    )
+
+    async def exec_lua(
+        self,
+        lua: str,
+        *args: ParsedJson,
+        priority: NvimPriority = NvimPriority.WRITE,
+        timeout_seconds: float | None = None,
+    ) -> Result[Any, NvimLuaApiError]:
         _LOGGER.debug(f"Queuing up lua with args: {lua} {args}")
-
-        future: futures.Future[Result[Any, Exception]] = futures.Future()
-        self.vim_queue.put(NvimWorkItem(lua, list(args), future))
-
-        result = await asyncio.wrap_future(future)
+        if self.recorder is not None:
+            self.recorder.record_lua(lua, list(args))
+
+        future: asyncio.Future[Result[Any, Exception]] = asyncio.get_running_loop().create_future()
+        try:
+            self.worker.work_items.put_nowait(
+                NvimWorkItem(lua, list(args), future, priority=priority)
+            )
+        except asyncio.QueueFull:
+            self.worker.queue_stats.rejected_full += 1
+            return Err(NvimLuaApiError(lua, list(args), "nvim work queue is full"))
+
+        # If the caller is cancelled, so is the future, and the worker skips the item
+        timeout = timeout_seconds if timeout_seconds is not None else self.call_timeouts[priority]
+        try:
+            async with asyncio.timeout(timeout):
+                result = await future
+        except TimeoutError:
+            self.worker.queue_stats.timed_out += 1
+            return Err(NvimLuaApiError(lua, list(args), f"Timed out after {timeout}s"))
         _LOGGER.debug(f"Received result {result}")
         match result:
             case Ok():
@@ -39,10 +116,71 @@ class NvimClient:
             case Err(nvim_error):
                 return Err(NvimLuaApiError(lua, list(args), repr(nvim_error)))
 
+    # timeout_seconds overrides the deadline of the api's priority class
     async def call_api(
-        self, api_func: str, output_type: type[TOutput], *args: ParsedJson
+        self,
+        api_func: str,
+        output_type: type[TOutput],
+        *args: ParsedJson,
+        timeout_seconds: float | None = None,
+    ) -> Result[TOutput, NvimLuaApiError | NvimLuaInvalidResponse | LocationDne]:
+        if api_func not in READ_ONLY_APIS:
+            # Reads started before a write may miss it, so later reads must not join them
+            self.forget_in_flight_reads()
+            return await self._timed_call_api(
+                api_func, output_type, *args, timeout_seconds=timeout_seconds
+            )
+
+        # Results are shared between waiters, so callers must not modify them
+        key = (api_func, output_type, repr(args), timeout_seconds)
+        shared = self.in_flight_reads.get(key)
+        if shared is not None:
+            self.api_stats.deduplicated[api_func] += 1
+        else:
+            shared = asyncio.create_task(
+                self._timed_call_api(api_func, output_type, *args, timeout_seconds=timeout_seconds)
+            )
+            self.in_flight_reads[key] = shared
+            shared.add_done_callback(lambda task: self._read_done(key, task))
+        # Shielded so one waiter going away doesn't cancel the call for the others
+        return await asyncio.shield(shared)
+
+    def _read_done(self, key: tuple[str, type, str, float | None], task: asyncio.Task[Any]) -> None:
+        if self.in_flight_reads.get(key) is task:
+            del self.in_flight_reads[key]
+
+    def forget_in_flight_reads(self) -> None:
+        self.in_flight_reads.clear()
+
+    async def _timed_call_api(
+        self,
+        api_func: str,
+        output_type: type[TOutput],
+        *args: ParsedJson,
+        timeout_seconds: float | None = None,
     ) -> Result[TOutput, NvimLuaApiError | NvimLuaInvalidResponse | LocationDne]:
-        result = await self.exec_lua(f"return require('mux.api.internal').{api_func}(...)", *args)
+        start = perf_counter()
+        result = await self._call_api(api_func, output_type, *args, timeout_seconds=timeout_seconds)
+        match result:
+            case Ok():
+                self.api_stats.record_call(api_func, perf_counter() - start, None)
+            case Err(e):
+                self.api_stats.record_call(api_func, perf_counter() - start, _error_code(e))
+        return result
+
+    async def _call_api(
+        self,
+        api_func: str,
+        output_type: type[TOutput],
+        *args: ParsedJson,
+        timeout_seconds: float | None = None,
+    ) -> Result[TOutput, NvimLuaApiError | NvimLuaInvalidResponse | LocationDne]:
+        result = await self.exec_lua(
+            f"return require('mux.api.internal').{api_func}(...)",
+            *args,
+            priority=API_PRIORITIES.get(api_func, NvimPriority.WRITE),
+            timeout_seconds=timeout_seconds,
+        )
 
         match result:
             case Ok(lua_output):
@@ -54,7 +192,7 @@ class NvimClient:
             return Err(NvimLuaInvalidResponse(api_func, repr(lua_output)))
 
         if "result" in lua_output:
-            match output_type.try_load(lua_output["result"]):
+            match decode(output_type, lua_output["result"]):
                 case Ok(loaded_result):
                     return Ok(loaded_result)
                 case Err():
@@ -69,7 +207,7 @@ class NvimClient:
             if code not in ERROR_TYPES_BY_CODE:
                 return Err(NvimLuaInvalidResponse(api_func, repr(lua_output)))
 
-            match ERROR_TYPES_BY_CODE[code].try_load(error["data"]):
+            match decode(ERROR_TYPES_BY_CODE[code], error["data"]):
                 case Ok(typed_error):
                     return Err(typed_error)
                 case Err():
@@ -78,9 +216,13 @@ class NvimClient:
         return Err(NvimLuaInvalidResponse(api_func, repr(lua_output)))
 
     async def call_no_error(
-        self, api_func: str, output_type: type[TOutput], *args: ParsedJson
+        self,
+        api_func: str,
+        output_type: type[TOutput],
+        *args: ParsedJson,
+        timeout_seconds: float | None = None,
     ) -> Result[TOutput, NvimLuaApiError | NvimLuaInvalidResponse]:
-        match await self.call_api(api_func, output_type, *args):
+        match await self.call_api(api_func, output_type, *args, timeout_seconds=timeout_seconds):
             case Ok(value):
                 return Ok(value)
             case Err(e):
@@ -89,13 +231,19 @@ class NvimClient:
                 return Err(e)
 
 
-async def connect_to_nvim() -> Result[NvimClient, NvimLuaApiError]:
-    queue = nvim_thread.start_thread()
-    client = NvimClient(queue, logging.DEBUG)
+def _error_code(error: NvimLuaApiError | NvimLuaInvalidResponse | LocationDne) -> str:
+    match error:
+        case NvimLuaApiError():
+            return NvimErrorCode.NVIM_LUA_API_ERROR.name
+        case NvimLuaInvalidResponse():
+            return NvimErrorCode.NVIM_LUA_INVALID_RESPONSE.name
+        case LocationDne():
+            return MuxErrorCode.LOCATION_DOES_NOT_EXIST.name
+
 
-    result = await client.exec_lua("require('mux.api.internal')")
-    match result:
-        case Ok():
-            return Ok(client)
-        case Err() as err:
-            return err
+async def connect_to_nvim(socket_path: str | None = None) -> Result[NvimClient, NvimLuaApiError]:
+    match await nvim_worker.connect_worker(socket_path or os.environ["NVIM"]):
+        case Ok(worker):
+            return Ok(NvimClient(worker, logging.DEBUG))
+        case Err(e):
+            return Err(NvimLuaApiError(nvim_worker.LOAD_API_LUA, [], repr(e)))
@@ -1,68 +1,70 @@
 #!/usr/bin/env python3
 
 import asyncio
+import importlib
+import inspect
 import logging
 import os
 import pathlib
 import signal
-from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+from asyncio import StreamReader, StreamWriter
 from functools import partial
 from sys import argv, stderr
+from typing import Any
 
-import jrpc
-from jrpc.client import ClientManager
-from jrpc_router.client_factory import connect_to_router
-from reg.api import AddLinkParams, RegLink, RegMethod, RemoveLinkParams
 from result import Err, Ok, Result
 
-from nvim_mux.nvim_api import Empty
-
-from .data import ParentInfo, ParentMux, ParentReg
-from .errors import NvimLuaApiError
-from .ext.api import SyncRegistersDownParams
-from .ext.impl import NvimExtensionApiImpl
-from .mux.impl import NvimMuxApiImpl
-from .nvim_client import connect_to_nvim
-from .reg.impl import NvimRegApiImpl
+from . import nvim_worker
+from .data import DEFAULT_REG_CHUNK_SIZE, ParentInfo, ParentMux, ParentReg
+from .metrics import ConnectionCallback, StartupTimings
 
 _LOGGER = logging.getLogger("nvim-mux-server")
 
+# jrpc, dataclasses_json, marshmallow, mux and reg take most of startup to import, so they are
+# loaded on a thread while nvim and the router are being connected to
+_SERVER_MODULES = ["jrpc", "nvim_mux.server_impls"]
 
-@asynccontextmanager
-async def link_to_reg_parent(
-    this_instance: str,
-    reg_clients: ClientManager,
-    parent_reg: ParentReg | None,
-) -> AsyncIterator[None]:
-    if not parent_reg:
-        yield
-        return
 
-    async with reg_clients.client(parent_reg.instance) as client:
-        try:
-            await client.notify(
-                RegMethod.ADD_LINK,
-                AddLinkParams(
-                    registry=parent_reg.registry,
-                    link=RegLink(
-                        instance=this_instance,
-                        registry="0",
-                    ),
-                ),
-            )
-            yield
-        finally:
-            await client.notify(
-                RegMethod.REMOVE_LINK,
-                RemoveLinkParams(
-                    registry=parent_reg.registry,
-                    link=RegLink(
-                        instance=this_instance,
-                        registry="0",
-                    ),
-                ),
-            )
+def _import_server_modules() -> None:
+    for module in _SERVER_MODULES:
+        importlib.import_module(module)
+
+
+async def _connect_to_router(router_socket: str) -> Result[Any, Exception]:
+    client_factory = await asyncio.to_thread(importlib.import_module, "jrpc_router.client_factory")
+    return await client_factory.connect_to_router(router_socket)
+
+
+async def _close_router(router: Any) -> None:
+    # The router is closed by exiting its context, which serve() would otherwise have entered
+    async with router:
+        pass
+
+
+async def _close_connected(
+    worker_task: asyncio.Task[Result[nvim_worker.NvimWorker, Exception]],
+    router_task: asyncio.Task[Result[Any, Exception]],
+) -> None:
+    if worker_task.done() and not worker_task.cancelled() and worker_task.exception() is None:
+        match worker_task.result():
+            case Ok(worker):
+                await worker.close()
+    if router_task.done() and not router_task.cancelled() and router_task.exception() is None:
+        match router_task.result():
+            case Ok(router):
+                await _close_router(router)
+
+
+def _deferred_connection_callback(
+    ready: asyncio.Future[ConnectionCallback],
+) -> ConnectionCallback:
+    async def on_connected(reader: StreamReader, writer: StreamWriter) -> None:
+        callback = await ready
+        result = callback(reader, writer)
+        if inspect.isawaitable(result):
+            await result
+
+    return on_connected
 
 
 async def run_mux_server(
@@ -72,78 +74,79 @@ async def run_mux_server(
     term_future: asyncio.Future[int],
     router_socket: str,
     parent_info: ParentInfo,
-) -> Result[int, NvimLuaApiError]:
-    match await connect_to_nvim():
-        case Ok(vim):
-            pass
-        case Err() as err:
-            return err
+    record_path: pathlib.Path | None = None,
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE,
+) -> Result[int, Exception]:
+    timings = StartupTimings()
 
-    _LOGGER.info("Connected to nvim in daemon thread")
+    # Bound first, so lua can connect right away and wait for the server to be ready
+    ready: asyncio.Future[ConnectionCallback] = asyncio.get_running_loop().create_future()
+    server = await asyncio.start_unix_server(_deferred_connection_callback(ready), path=socket_path)
+    timings.mark("bound")
 
-    match await connect_to_router(router_socket):
-        case Ok(router):
-            pass
-        case Err(e):
-            msg = f"Failed to connect to router at {router_socket}: {e}"
-            _LOGGER.error(msg)
-            stderr.write(msg)
-            return Ok(1)
+    try:
+        nvim_socket = os.environ["NVIM"]
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(timings.timed("imports", asyncio.to_thread(_import_server_modules)))
+                worker_task = tg.create_task(
+                    timings.timed("nvim", nvim_worker.connect_worker(nvim_socket))
+                )
+                router_task = tg.create_task(
+                    timings.timed("router", _connect_to_router(router_socket))
+                )
+        except BaseExceptionGroup as group:
+            # Callers get the error itself, as they did when these ran one after another
+            await _close_connected(worker_task, router_task)
+            raise group.exceptions[0]
+        except BaseException:
+            await _close_connected(worker_task, router_task)
+            raise
+        timings.mark("connected")
 
-    mux_clients = ClientManager(router.service_oneoff_factory)
-    reg_clients = ClientManager(router.service_oneoff_factory)
+        match worker_task.result():
+            case Ok(worker):
+                pass
+            case Err() as err:
+                await _close_connected(worker_task, router_task)
+                return err
 
-    mux_impl = NvimMuxApiImpl(
-        vim=vim,
-        clients=mux_clients,
-        parent_mux=parent_info.parent_mux,
-    )
-    reg_impl = NvimRegApiImpl(
-        vim=vim,
-        this_instance=reg_service_name,
-        clients=reg_clients,
-    )
-    ext_impl = NvimExtensionApiImpl(
-        vim=vim,
-        this_reg_instance=reg_service_name,
-        mux_clients=mux_clients,
-        reg_clients=reg_clients,
-        parent_info=parent_info,
-    )
+        _LOGGER.info("Connected to nvim")
 
-    connection_callback = jrpc.connection.client_connected_callback(
-        mux_impl.method_set(),
-        reg_impl.method_set(),
-        ext_impl.method_set(),
-    )
+        match router_task.result():
+            case Ok(router):
+                pass
+            case Err(e):
+                await worker.close()
+                msg = f"Failed to connect to router at {router_socket}: {e}"
+                _LOGGER.error(msg)
+                stderr.write(msg)
+                return Ok(1)
 
-    server = await asyncio.start_unix_server(connection_callback, path=socket_path)
-    try:
-        async with (
-            router,
-            mux_clients,
-            reg_clients,
-            router.active_service(mux_service_name, str(socket_path)),
-            router.active_service(reg_service_name, str(socket_path)),
-            link_to_reg_parent(reg_service_name, reg_clients, parent_info.parent_reg),
-        ):
-            # TODO less hacky way of initial publish / sync
-            async with asyncio.TaskGroup() as tg:
-                tg.create_task(mux_impl.publish())
-                tg.create_task(ext_impl.sync_registers_down(SyncRegistersDownParams()))
-                tg.create_task(vim.call_no_error("mark_loaded", Empty))
-
-            _LOGGER.info("Server started")
-            try:
-                await term_future
-            finally:
-                _LOGGER.info("Server shutting down")
-                server.close()
-
-            if term_future.done():
-                return Ok(term_future.result())
-            return Ok(0)
+        from .server_impls import serve
+
+        try:
+            return Ok(
+                await serve(
+                    worker=worker,
+                    router=router,
+                    ready=ready,
+                    socket_path=socket_path,
+                    mux_service_name=mux_service_name,
+                    reg_service_name=reg_service_name,
+                    term_future=term_future,
+                    parent_info=parent_info,
+                    record_path=record_path,
+                    timings=timings,
+                    reg_chunk_size=reg_chunk_size,
+                )
+            )
+        finally:
+            _LOGGER.info("Server shutting down")
     finally:
+        server.close()
+        if not ready.done():
+            ready.cancel()
         try:
             os.unlink(socket_path)
         except Exception:
@@ -174,8 +177,12 @@ async def main(
     parent_mux_location: str,
     parent_reg_instance: str,
     parent_reg_registry: str,
+    record_path: pathlib.Path | None = None,
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE,
 ) -> int:
-    logging.basicConfig(filename=log_file, level=logging.WARNING)
+    logging.basicConfig(
+        filename=log_file, level=os.environ.get("NVIM_MUX_LOG_LEVEL", "WARNING").upper()
+    )
 
     term_future: asyncio.Future[int] = asyncio.Future()
     for term_signal in _TERMINATING_SIGNALS:
@@ -202,12 +209,14 @@ async def main(
         term_future=term_future,
         router_socket=router_socket,
         parent_info=ParentInfo(parent_mux, parent_reg),
+        record_path=record_path,
+        reg_chunk_size=reg_chunk_size,
     ):
         case Ok(term_value):
             _LOGGER.info(f"Exiting safely with status {term_value}")
             return term_value
-        case Err(lua_error):
-            msg = f"Failed to start nvim mux server! nvim connect failed with error {lua_error}"
+        case Err(nvim_error):
+            msg = f"Failed to start nvim mux server! nvim connect failed with error {nvim_error!r}"
             stderr.write(msg)
             _LOGGER.error(msg)
             return 1
@@ -239,6 +248,14 @@ if __name__ == "__main__":
                 parent_mux_location=parent_mux_location,
                 parent_reg_instance=parent_reg_instance,
                 parent_reg_registry=parent_reg_registry,
+                record_path=(
+                    pathlib.Path(os.environ["NVIM_MUX_RECORD"])
+                    if os.environ.get("NVIM_MUX_RECORD")
+                    else None
+                ),
+                reg_chunk_size=int(
+                    os.environ.get("NVIM_MUX_REG_CHUNK_SIZE", DEFAULT_REG_CHUNK_SIZE)
+                ),
             )
         )
     )
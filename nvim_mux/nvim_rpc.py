@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+import msgpack
+from result import Err, Ok, Result
+
+_LOGGER = logging.getLogger("nvim-rpc")
+
+_REQUEST = 0
+_RESPONSE = 1
+
+_READ_SIZE = 64 * 1024
+
+
+class NvimRpcError(Exception):
+    pass
+
+
+class NvimSession(Protocol):
+    def send_request(self, method: str, *args: Any) -> asyncio.Future[Result[Any, Exception]]: ...
+
+    async def drain(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+@dataclass
+class NvimRpcSession:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+
+    next_msgid: int = 0
+    pending: dict[int, asyncio.Future[Result[Any, Exception]]] = field(default_factory=dict)
+    closed_error: Exception | None = None
+
+    def __post_init__(self) -> None:
+        self.packer = msgpack.Packer()
+        self.read_task = asyncio.create_task(self.read_forever())
+
+    def send_request(self, method: str, *args: Any) -> asyncio.Future[Result[Any, Exception]]:
+        future: asyncio.Future[Result[Any, Exception]] = asyncio.get_running_loop().create_future()
+        if self.closed_error is not None:
+            future.set_result(Err(self.closed_error))
+            return future
+
+        msgid = self.next_msgid
+        self.next_msgid = (self.next_msgid + 1) % (1 << 32)
+        self.pending[msgid] = future
+        self.writer.write(self.packer.pack([_REQUEST, msgid, method, list(args)]))
+        return future
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            self.fail_pending(e)
+
+    async def read_forever(self) -> None:
+        unpacker = msgpack.Unpacker(raw=False)
+        try:
+            while data := await self.reader.read(_READ_SIZE):
+                unpacker.feed(data)
+                for message in unpacker:
+                    self.handle_message(message)
+            self.fail_pending(NvimRpcError("nvim closed the connection"))
+        except Exception as e:
+            _LOGGER.error(f"Failed reading from nvim: {e!r}")
+            self.fail_pending(e)
+
+    def handle_message(self, message: Any) -> None:
+        # [1, msgid, error, result] | [0, msgid, method, params] | [2, method, params]
+        match message:
+            case [1, int(msgid), error, value]:
+                if msgid not in self.pending:
+                    _LOGGER.warning(f"Received response for unknown msgid {msgid}")
+                    return
+                future = self.pending.pop(msgid)
+                if future.done():
+                    return
+                if error is None:
+                    future.set_result(Ok(value))
+                else:
+                    future.set_result(Err(NvimRpcError(_error_message(error))))
+            case [0, int(msgid), str(method), _]:
+                _LOGGER.warning(f"Rejecting request {method} from nvim")
+                self.writer.write(
+                    self.packer.pack([_RESPONSE, msgid, f"Unsupported method {method}", None])
+                )
+            case [2, str(method), _]:
+                _LOGGER.debug(f"Ignoring notification {method} from nvim")
+            case _:
+                _LOGGER.warning(f"Received invalid message from nvim: {message!r}")
+
+    def fail_pending(self, error: Exception) -> None:
+        self.closed_error = error
+        pending = self.pending
+        self.pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_result(Err(error))
+
+    async def close(self) -> None:
+        self.read_task.cancel()
+        self.fail_pending(NvimRpcError("session closed"))
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def _error_message(error: Any) -> str:
+    # nvim sends errors as [error_type, message]
+    match error:
+        case [_, str(message)]:
+            return message
+        case _:
+            return repr(error)
+
+
+async def connect(socket_path: str) -> Result[NvimRpcSession, Exception]:
+    try:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    except OSError as e:
+        return Err(e)
+    return Ok(NvimRpcSession(reader, writer))
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from result import Err, Ok, Result
+
+from . import nvim_rpc
+from .metrics import LatencyHistogram
+from .nvim_rpc import NvimSession
+
+_LOGGER = logging.getLogger("nvim-worker")
+
+_EXEC_BATCH_LUA = "return require('mux.api.internal.batch').exec_batch(...)"
+
+LOAD_API_LUA = "require('mux.api.internal')"
+
+# Callers are failed fast past this, instead of piling up behind a blocked nvim
+DEFAULT_MAX_QUEUE_DEPTH = 1024
+
+
+class NvimBatchError(Exception):
+    pass
+
+
+class NvimPriority(IntEnum):
+    # Reads a prompt or tabline is waiting on
+    INTERACTIVE = 0
+    WRITE = 1
+    # Register syncs and other large transfers
+    BULK = 2
+
+
+@dataclass
+class NvimWorkItem:
+    lua: str
+    args: list[Any]
+    future: asyncio.Future[Result[Any, Exception]]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    priority: NvimPriority = NvimPriority.WRITE
+
+
+@dataclass
+class PriorityWaitStats:
+    served: int = 0
+    # Served ahead of higher priorities because it had waited too long
+    promoted: int = 0
+    wait: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class _PriorityDeques:
+    def __init__(self) -> None:
+        self.deques: list[deque[NvimWorkItem]] = [deque() for _ in NvimPriority]
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.deques)
+
+    def __iter__(self) -> Iterator[NvimWorkItem]:
+        for items in self.deques:
+            yield from items
+
+
+class NvimWorkQueue(asyncio.Queue[NvimWorkItem]):
+    # Items that have waited this long are served before higher priorities, oldest first
+    starvation_seconds = 0.1
+
+    # asyncio.Queue subclasses are expected to override these and keep items in _queue
+    def _init(self, maxsize: int) -> None:
+        self._queue = _PriorityDeques()
+        self._only: NvimPriority | None = None
+        self.wait_stats = {priority: PriorityWaitStats() for priority in NvimPriority}
+
+    def _put(self, item: NvimWorkItem) -> None:
+        self._queue.deques[item.priority].append(item)
+
+    def _get(self) -> NvimWorkItem:
+        now = time.monotonic()
+        chosen: deque[NvimWorkItem] | None = None
+        promoted = False
+        if self._only is not None:
+            chosen = self._queue.deques[self._only]
+        else:
+            for items in self._queue.deques:
+                if not items:
+                    continue
+                if chosen is None:
+                    chosen = items
+                elif now - items[0].enqueued_at > self.starvation_seconds and (
+                    items[0].enqueued_at < chosen[0].enqueued_at
+                ):
+                    chosen = items
+                    promoted = True
+        assert chosen is not None
+
+        item = chosen.popleft()
+        stats = self.wait_stats[item.priority]
+        stats.served += 1
+        stats.promoted += promoted
+        stats.wait.record(now - item.enqueued_at)
+        return item
+
+    def get_nowait_from(self, priority: NvimPriority) -> NvimWorkItem:
+        if not self._queue.deques[priority]:
+            raise asyncio.QueueEmpty
+        # Goes through get_nowait so waiting putters are still woken up
+        self._only = priority
+        try:
+            return self.get_nowait()
+        finally:
+            self._only = None
+
+    def oldest(self) -> NvimWorkItem | None:
+        heads = [items[0] for items in self._queue.deques if items]
+        return min(heads, key=lambda item: item.enqueued_at) if heads else None
+
+    def depth_by_priority(self) -> dict[str, int]:
+        return {priority.name: len(self._queue.deques[priority]) for priority in NvimPriority}
+
+
+@dataclass
+class NvimQueueStats:
+    rejected_full: int = 0
+    timed_out: int = 0
+    # Items whose caller timed out or went away before they were sent
+    skipped_cancelled: int = 0
+
+
+@dataclass
+class NvimBatchStats:
+    batches: int = 0
+    items: int = 0
+    max_batch_size: int = 0
+    last_batch_size: int = 0
+    batch_sizes: Counter[int] = field(default_factory=Counter)
+
+    def record(self, batch_size: int) -> None:
+        self.batches += 1
+        self.items += batch_size
+        self.last_batch_size = batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.batch_sizes[batch_size] += 1
+
+
+@dataclass
+class NvimWorker:
+    session: NvimSession
+    batching: bool
+    work_items: NvimWorkQueue = field(
+        default_factory=lambda: NvimWorkQueue(DEFAULT_MAX_QUEUE_DEPTH)
+    )
+    batch_stats: NvimBatchStats = field(default_factory=NvimBatchStats)
+    queue_stats: NvimQueueStats = field(default_factory=NvimQueueStats)
+    max_batch_size: int = 64
+    # Large transfers go out on their own, so they don't hold up other work in the same call
+    max_bulk_batch_size: int = 1
+
+    def __post_init__(self) -> None:
+        self.in_flight: set[asyncio.Task[None]] = set()
+
+    def queue_depth(self) -> int:
+        return self.work_items.qsize()
+
+    def oldest_item_age(self) -> float:
+        oldest = self.work_items.oldest()
+        return time.monotonic() - oldest.enqueued_at if oldest else 0.0
+
+    def start(self) -> None:
+        self.loop_task = asyncio.create_task(self.loop_forever())
+
+    async def close(self) -> None:
+        self.loop_task.cancel()
+        await self.session.close()
+
+    async def loop_forever(self) -> None:
+        while True:
+            work_item = await self.work_items.get()
+            if self.is_cancelled(work_item):
+                continue
+            batch = [work_item]
+            # A batch is one nvim call, so mixing classes would make reads wait on bulk work
+            max_batch_size = (
+                self.max_bulk_batch_size
+                if work_item.priority == NvimPriority.BULK
+                else self.max_batch_size
+            )
+            while self.batching and len(batch) < max_batch_size:
+                try:
+                    next_item = self.work_items.get_nowait_from(work_item.priority)
+                except asyncio.QueueEmpty:
+                    break
+                if not self.is_cancelled(next_item):
+                    batch.append(next_item)
+
+            self.batch_stats.record(len(batch))
+            if len(batch) == 1:
+                response = self.session.send_request("nvim_exec_lua", work_item.lua, work_item.args)
+                task = asyncio.create_task(self.complete_work_item(work_item, response))
+            else:
+                response = self.session.send_request(
+                    "nvim_exec_lua",
+                    _EXEC_BATCH_LUA,
+                    [
+                        [
+                            {"lua": item.lua, "args": item.args, "nargs": len(item.args)}
+                            for item in batch
+                        ]
+                    ],
+                )
+                task = asyncio.create_task(self.complete_batch(batch, response))
+
+            # Requests are pipelined: only wait for the write, never for nvim's response
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+            await self.session.drain()
+
+    def is_cancelled(self, work_item: NvimWorkItem) -> bool:
+        # Nothing is waiting on the result, so nvim doesn't need to do the work
+        if work_item.future.done():
+            self.queue_stats.skipped_cancelled += 1
+            return True
+        return False
+
+    async def complete_work_item(
+        self,
+        work_item: NvimWorkItem,
+        response: asyncio.Future[Result[Any, Exception]],
+    ) -> None:
+        result = await response
+        _set_result(work_item, result)
+        _LOGGER.debug(f"Set result {result}")
+
+    async def complete_batch(
+        self,
+        batch: list[NvimWorkItem],
+        response: asyncio.Future[Result[Any, Exception]],
+    ) -> None:
+        match await response:
+            case Ok(outputs):
+                pass
+            case Err() as err:
+                for work_item in batch:
+                    _set_result(work_item, err)
+                return
+
+        if not isinstance(outputs, list) or len(outputs) != len(batch):
+            for work_item in batch:
+                _set_result(work_item, Err(NvimBatchError(f"Invalid batch response: {outputs!r}")))
+            return
+
+        for work_item, output in zip(batch, outputs):
+            _set_result(work_item, _batch_output_to_result(output))
+        _LOGGER.debug(f"Set results for batch of {len(batch)}")
+
+
+def _set_result(work_item: NvimWorkItem, result: Result[Any, Exception]) -> None:
+    # The caller may have given up on the item while it was in flight
+    if not work_item.future.done():
+        work_item.future.set_result(result)
+
+
+def _batch_output_to_result(output: Any) -> Result[Any, Exception]:
+    if not isinstance(output, list) or len(output) == 0:
+        return Err(NvimBatchError(f"Invalid batch item output: {output!r}"))
+
+    # lua drops trailing nils, so a successful nil return is just [true]
+    value = output[1] if len(output) > 1 else None
+    if output[0] is True:
+        return Ok(value)
+    return Err(NvimBatchError(value))
+
+
+def start_worker(session: NvimSession, batching: bool = True) -> NvimWorker:
+    worker = NvimWorker(session, batching)
+    worker.start()
+    return worker
+
+
+async def connect_worker(socket_path: str, batching: bool = True) -> Result[NvimWorker, Exception]:
+    match await nvim_rpc.connect(socket_path):
+        case Ok(session):
+            pass
+        case Err() as err:
+            return err
+
+    worker = start_worker(session, batching)
+    # Loading the api up front keeps the first real call from paying for the require
+    future: asyncio.Future[Result[Any, Exception]] = asyncio.get_running_loop().create_future()
+    worker.work_items.put_nowait(
+        NvimWorkItem(LOAD_API_LUA, [], future, priority=NvimPriority.INTERACTIVE)
+    )
+    match await future:
+        case Ok():
+            return Ok(worker)
+        case Err() as err:
+            await worker.close()
+            return err
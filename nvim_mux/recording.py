@@ -0,0 +1,152 @@
+import asyncio
+import inspect
+import json
+import logging
+import pathlib
+import time
+from asyncio import StreamReader, StreamWriter
+from collections.abc import Iterator
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+from .metrics import ConnectionCallback
+
+_LOGGER = logging.getLogger("recording")
+
+_READ_CHUNK_BYTES = 64 * 1024
+
+
+class RecordKind(StrEnum):
+    START = "start"
+    REQUEST_IN = "in"
+    RESPONSE_OUT = "out"
+    LUA = "lua"
+
+
+@dataclass
+class RecordedEvent:
+    run: int
+    seconds: float
+    kind: str
+    connection: int
+    line: str
+    args: list[Any]
+
+
+@dataclass
+class TrafficRecorder:
+    path: pathlib.Path
+
+    def __post_init__(self) -> None:
+        self.file = self.path.open("a", encoding="utf-8")
+        self.started_at = time.monotonic()
+        self.connections = 0
+        self.events = 0
+        # The file is append-only, so each server run starts with a marker
+        self.record(RecordKind.START, 0, "")
+
+    def record(self, kind: str, connection: int, line: str, args: list[Any] | None = None) -> None:
+        entry: dict[str, Any] = {
+            "t": round(time.monotonic() - self.started_at, 6),
+            "k": kind,
+            "c": connection,
+            "l": line,
+        }
+        if args is not None:
+            entry["a"] = args
+        try:
+            self.file.write(json.dumps(entry, separators=(",", ":"), default=repr) + "\n")
+            self.events += 1
+        except Exception as e:
+            _LOGGER.warning(f"Failed to record {kind} event: {e!r}")
+
+    def record_lua(self, lua: str, args: list[Any]) -> None:
+        self.record(RecordKind.LUA, 0, lua, args)
+
+    def next_connection(self) -> int:
+        self.connections += 1
+        return self.connections
+
+    def close(self) -> None:
+        _LOGGER.info(f"Recorded {self.events} events to {self.path}")
+        self.file.close()
+
+
+class _RecordingWriter:
+    # Only write() is intercepted, everything else goes to the real writer
+    def __init__(self, writer: StreamWriter, recorder: TrafficRecorder, connection: int) -> None:
+        self._writer = writer
+        self._recorder = recorder
+        self._connection = connection
+        self._partial = b""
+
+    def write(self, data: bytes) -> None:
+        self._writer.write(data)
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._recorder.record(
+                RecordKind.RESPONSE_OUT, self._connection, line.decode(errors="replace")
+            )
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._writer, name)
+
+
+def recording_connection_callback(
+    callback: ConnectionCallback, recorder: TrafficRecorder
+) -> ConnectionCallback:
+    async def on_connected(reader: StreamReader, writer: StreamWriter) -> None:
+        connection = recorder.next_connection()
+        # jrpc frames messages by newline, so lines are teed on their way to the real reader
+        teed_reader = StreamReader()
+
+        async def pump() -> None:
+            partial = b""
+            try:
+                while chunk := await reader.read(_READ_CHUNK_BYTES):
+                    lines = (partial + chunk).split(b"\n")
+                    partial = lines.pop()
+                    for line in lines:
+                        recorder.record(
+                            RecordKind.REQUEST_IN, connection, line.decode(errors="replace")
+                        )
+                    teed_reader.feed_data(chunk)
+            finally:
+                teed_reader.feed_eof()
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            recording_writer: Any = _RecordingWriter(writer, recorder, connection)
+            result = callback(teed_reader, recording_writer)
+            if inspect.isawaitable(result):
+                await result
+        finally:
+            pump_task.cancel()
+
+    return on_connected
+
+
+def read_recording(path: pathlib.Path) -> Iterator[RecordedEvent]:
+    # Runs are laid end to end, so timestamps keep increasing across the whole file
+    run = 0
+    run_offset = 0.0
+    last_seconds = 0.0
+    with path.open(encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry["k"] == RecordKind.START:
+                run += 1
+                run_offset = last_seconds
+            last_seconds = run_offset + entry["t"]
+            yield RecordedEvent(
+                run=run,
+                seconds=last_seconds,
+                kind=entry["k"],
+                connection=entry["c"],
+                line=entry["l"],
+                args=entry.get("a", []),
+            )
@@ -1,5 +1,7 @@
+import asyncio
+import hashlib
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from jrpc.client import ClientManager
 from reg.api import (
@@ -30,7 +32,12 @@ from reg.syncer import RegSyncer
 from result import Err, Ok, Result
 from typing_extensions import TypeVar, override
 
+from nvim_mux.data import DEFAULT_REG_CHUNK_SIZE
+from nvim_mux.metrics import SyncStats
+from nvim_mux.nvim_api import RegisterMetadata
 from nvim_mux.nvim_client import NvimClient
+from nvim_mux.reg.link_table import RegLinkTable
+from nvim_mux.reg.recent import RecentRegisters
 from nvim_mux.reg.reg_client import RegClient
 
 _LOGGER = logging.getLogger("reg-impl")
@@ -49,15 +56,55 @@ def regname_key_coerce(values: dict[str, TValue]) -> dict[Regname, TValue]:
     return coerced
 
 
+def _all_registers(values: dict[Regname, str]) -> dict[Regname, str | None]:
+    # Registers missing from a clear and replace are deleted
+    return {regname: values.get(regname) for regname in Regname}
+
+
+def _holds(metadata: RegisterMetadata | None, value: str | None) -> bool:
+    # nvim reports empty registers as missing
+    if not value:
+        return metadata is None
+    return (
+        metadata is not None
+        and metadata.sha256 == hashlib.sha256(value.encode(errors="surrogatepass")).hexdigest()
+    )
+
+
 @dataclass
 class NvimRegApiImpl(RegApi):
     vim: NvimClient
     clients: ClientManager
     this_instance: str
+    sync_stats: SyncStats = field(default_factory=SyncStats)
+    recent_registers: RecentRegisters = field(default_factory=RecentRegisters)
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE
 
     def __post_init__(self) -> None:
-        self.registers = RegClient(self.vim)
+        self.registers = RegClient(self.vim, self.reg_chunk_size)
         self.syncer = RegSyncer(self.clients, self.this_instance)
+        self.link_table = RegLinkTable(self.registers)
+
+    async def drop_already_held(
+        self, values: dict[Regname, str | None]
+    ) -> dict[Regname, str | None]:
+        kept, echoed = self.recent_registers.split_echoes(values)
+        if not echoed:
+            return kept
+
+        # nvim can change a register without a publish (e.g. :let @a=), so a recent value is only
+        # dropped while nvim still holds it
+        match await self.registers.get_register_metadata(echoed):
+            case Ok(held):
+                pass
+            case Err(e):
+                _LOGGER.warning(f"Failed to check registers, applying the sync anyway: {e}")
+                return kept | {regname: values[regname] for regname in echoed}
+
+        for regname in echoed:
+            if not _holds(held.get(regname.value), values[regname]):
+                kept[regname] = values[regname]
+        return kept
 
     @override
     async def get_registry_info(
@@ -71,23 +118,12 @@ class NvimRegApiImpl(RegApi):
     async def get_multiple(
         self, params: GetMultipleParams
     ) -> Result[GetMultipleResult, RegApiError]:
-        match (
-            (await self.registers.get_all_registers())
-            .map(regname_key_coerce)
-            .map_err(lambda e: e.to_reg_error())
-        ):
-            case Ok(all_values):
-                pass
-            case Err() as err:
-                return err
-
-        values: dict[Regname, str | None] = {}
-        for key in params.keys:
-            if key in all_values:
-                values[key] = all_values[key]
-            else:
-                values[key] = None
-        return Ok(GetMultipleResult(values))
+        # Only the requested registers are read out of nvim
+        match await self.registers.get_multiple_registers(params.keys):
+            case Ok(found):
+                return Ok(GetMultipleResult({key: found.get(key.value) for key in params.keys}))
+            case Err(e):
+                return Err(e.to_reg_error())
 
     @override
     async def get_all(self, params: GetAllParams) -> Result[GetAllResult, RegApiError]:
@@ -102,24 +138,32 @@ class NvimRegApiImpl(RegApi):
     async def set_multiple(
         self, params: SetMultipleParams
     ) -> Result[SetMultipleResult, RegApiError]:
-        match (
-            (await self.registers.set_multiple_registers(params.values)).map_err(
-                lambda e: e.to_reg_error()
-            )
-        ):
-            case Ok():
+        match await self.link_table.links():
+            case Ok(links):
                 pass
-            case Err() as err:
-                return err
+            case Err(e):
+                return Err(e.to_reg_error())
+
+        async def write() -> Result[None, RegApiError]:
+            match await self.registers.set_multiple_registers(params.values):
+                case Ok():
+                    self.recent_registers.record(params.values)
+                    return Ok(None)
+                case Err(e):
+                    return Err(e.to_reg_error())
 
-        await (await self.registers.list_links()).map_async(
-            lambda links: self.syncer.forward_sync_multiple(
+        # The links don't depend on the write, so forwarding overlaps it
+        written, _ = await asyncio.gather(
+            write(),
+            self.syncer.forward_sync_multiple(
                 registry=params.registry,
                 visited_registries=[],
                 links=links,
                 values=params.values,
-            )
+            ),
         )
+        if isinstance(written, Err):
+            return written
 
         return Ok(SetMultipleResult())
 
@@ -127,27 +171,38 @@ class NvimRegApiImpl(RegApi):
     async def clear_and_replace(
         self, params: ClearAndReplaceParams
     ) -> Result[ClearAndReplaceResult, RegApiError]:
-        match await self.registers.clear_and_replace_registers(params.values):
-            case Ok():
+        match await self.link_table.links():
+            case Ok(links):
                 pass
             case Err(e):
                 return Err(e.to_reg_error())
 
-        await (await self.registers.list_links()).map_async(
-            lambda links: self.syncer.forward_sync_all(
+        async def write() -> Result[None, RegApiError]:
+            match await self.registers.clear_and_replace_registers(params.values):
+                case Ok():
+                    self.recent_registers.record(_all_registers(params.values))
+                    return Ok(None)
+                case Err(e):
+                    return Err(e.to_reg_error())
+
+        written, _ = await asyncio.gather(
+            write(),
+            self.syncer.forward_sync_all(
                 registry=params.registry,
                 visited_registries=[],
                 links=links,
                 values=params.values,
-            )
+            ),
         )
+        if isinstance(written, Err):
+            return written
 
         return Ok(ClearAndReplaceResult())
 
     @override
     async def add_link(self, params: AddLinkParams) -> Result[AddLinkResult, RegApiError]:
         return (
-            (await self.registers.add_link(params.link))
+            (await self.link_table.add(params.link))
             .map(lambda _: AddLinkResult())
             .map_err(lambda e: e.to_reg_error())
         )
@@ -155,7 +210,7 @@ class NvimRegApiImpl(RegApi):
     @override
     async def remove_link(self, params: RemoveLinkParams) -> Result[RemoveLinkResult, RegApiError]:
         return (
-            (await self.registers.remove_link(params.link))
+            (await self.link_table.remove(params.link))
             .map(lambda _: RemoveLinkResult())
             .map_err(lambda e: e.to_reg_error())
         )
@@ -164,52 +219,80 @@ class NvimRegApiImpl(RegApi):
     async def sync_multiple(
         self, params: SyncMultipleParams
     ) -> Result[SyncMultipleResult, RegApiError]:
-        match await self.registers.list_links():
+        self.sync_stats.received_multiple += 1
+        match await self.link_table.links():
             case Ok(links):
                 pass
             case Err(e):
                 return Err(e.to_reg_error())
 
         if params.source_link not in links:
+            self.sync_stats.rejected_unlinked += 1
             return Err(RegApiError.from_data(RejectedUnlinkedSync()))
 
-        match await self.registers.set_multiple_registers(params.values):
-            case Ok():
-                pass
-            case Err(e):
-                return Err(e.to_reg_error())
+        # Values this instance already holds were forwarded when they were first applied
+        values = await self.drop_already_held(params.values)
+        if not values:
+            self.sync_stats.dropped_redundant += 1
+            return Ok(SyncMultipleResult())
+        self.sync_stats.dropped_registers += len(params.values) - len(values)
+
+        async def write() -> Result[None, RegApiError]:
+            match await self.registers.set_multiple_registers(values):
+                case Ok():
+                    self.recent_registers.record(values)
+                    return Ok(None)
+                case Err(e):
+                    return Err(e.to_reg_error())
 
-        return Ok(
-            await self.syncer.forward_sync_multiple(
+        written, forwarded = await asyncio.gather(
+            write(),
+            self.syncer.forward_sync_multiple(
                 registry=params.registry,
                 visited_registries=params.visited_registries,
                 links=links,
-                values=params.values,
-            )
+                values=values,
+            ),
         )
+        if isinstance(written, Err):
+            return written
+        return Ok(forwarded)
 
     @override
     async def sync_all(self, params: SyncAllParams) -> Result[SyncAllResult, RegApiError]:
-        match await self.registers.list_links():
+        self.sync_stats.received_all += 1
+        match await self.link_table.links():
             case Ok(links):
                 pass
             case Err(e):
                 return Err(e.to_reg_error())
 
         if params.source_link not in links:
+            self.sync_stats.rejected_unlinked += 1
             return Err(RegApiError.from_data(RejectedUnlinkedSync()))
 
-        match await self.registers.clear_and_replace_registers(params.values):
-            case Ok():
-                pass
-            case Err(e):
-                return Err(e.to_reg_error())
+        all_values = _all_registers(params.values)
+        if not await self.drop_already_held(all_values):
+            self.sync_stats.dropped_redundant += 1
+            return Ok(SyncAllResult())
+
+        async def write() -> Result[None, RegApiError]:
+            match await self.registers.clear_and_replace_registers(params.values):
+                case Ok():
+                    self.recent_registers.record(all_values)
+                    return Ok(None)
+                case Err(e):
+                    return Err(e.to_reg_error())
 
-        return Ok(
-            await self.syncer.forward_sync_all(
+        written, forwarded = await asyncio.gather(
+            write(),
+            self.syncer.forward_sync_all(
                 registry=params.registry,
                 visited_registries=params.visited_registries,
                 links=links,
                 values=params.values,
-            )
+            ),
         )
+        if isinstance(written, Err):
+            return written
+        return Ok(forwarded)
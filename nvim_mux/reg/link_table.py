@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from reg.api import RegLink
+from result import Err, Ok, Result
+
+from nvim_mux.errors import NvimLuaApiError, NvimLuaInvalidResponse
+from nvim_mux.reg.reg_client import RegClient
+
+_LOGGER = logging.getLogger("reg-link-table")
+
+LinkKey = tuple[str, str]
+
+
+# Every link change goes through this server, so after one load from lua the links can be
+# answered in process. Changes are still written to lua, which outlives server restarts.
+@dataclass
+class RegLinkTable:
+    registers: RegClient
+
+    def __post_init__(self) -> None:
+        self.counts: dict[LinkKey, int] | None = None
+        self.lock = asyncio.Lock()
+
+    async def load(
+        self,
+    ) -> Result[dict[LinkKey, int], NvimLuaApiError | NvimLuaInvalidResponse]:
+        if self.counts is not None:
+            return Ok(self.counts)
+
+        async with self.lock:
+            if self.counts is not None:
+                return Ok(self.counts)
+
+            # lua counts the parent reg as a link, so it is included here too
+            match await self.registers.list_link_counts():
+                case Ok(link_counts):
+                    pass
+                case Err() as err:
+                    return err
+
+            counts = {
+                (instance, registry): count
+                for instance, registries in link_counts.items()
+                for registry, count in registries.items()
+            }
+            _LOGGER.debug(f"Loaded {len(counts)} links from lua")
+            self.counts = counts
+            return Ok(counts)
+
+    async def links(self) -> Result[list[RegLink], NvimLuaApiError | NvimLuaInvalidResponse]:
+        return (await self.load()).map(
+            lambda counts: [RegLink(instance, registry) for instance, registry in counts.keys()]
+        )
+
+    async def add(self, link: RegLink) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
+        match await self.load():
+            case Ok(counts):
+                pass
+            case Err() as err:
+                return err
+
+        match await self.registers.add_link(link):
+            case Ok():
+                key = (link.instance, link.registry)
+                counts[key] = counts.get(key, 0) + 1
+                return Ok(None)
+            case Err() as err:
+                return err
+
+    async def remove(self, link: RegLink) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
+        match await self.load():
+            case Ok(counts):
+                pass
+            case Err() as err:
+                return err
+
+        match await self.registers.remove_link(link):
+            case Ok():
+                key = (link.instance, link.registry)
+                if counts.get(key, 0) > 1:
+                    counts[key] -= 1
+                else:
+                    counts.pop(key, None)
+                return Ok(None)
+            case Err() as err:
+                return err
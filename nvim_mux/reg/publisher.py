@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from reg.api import Regname
+from reg.errors import RegApiError
+from reg.syncer import RegSyncer
+from result import Err, Ok, Result
+
+from nvim_mux.background import BackgroundTasks
+from nvim_mux.reg.link_table import RegLinkTable
+from nvim_mux.reg.recent import RecentRegisters
+from nvim_mux.reg.reg_client import RegClient
+
+_LOGGER = logging.getLogger("reg-publisher")
+
+
+@dataclass
+class RegPublisherStats:
+    requested: int = 0
+    coalesced: int = 0
+    published: int = 0
+    failed: int = 0
+
+
+@dataclass
+class RegPublisher:
+    registers: RegClient
+    link_table: RegLinkTable
+    syncer: RegSyncer
+    recent_registers: RecentRegisters
+    debounce_seconds: float = 0.01
+    stats: RegPublisherStats = field(default_factory=RegPublisherStats)
+
+    def __post_init__(self) -> None:
+        self.pending_keys: set[Regname] = set()
+        self.pending: asyncio.Task[Result[None, RegApiError]] | None = None
+        self.background = BackgroundTasks("reg publish")
+        self.lock = asyncio.Lock()
+
+    def request_publish(self, key: Regname) -> None:
+        self.stats.requested += 1
+        self.pending_keys.add(key)
+        if self.pending is None or self.pending.done():
+            self.pending = self.background.spawn(self.publish_after_debounce())
+        else:
+            self.stats.coalesced += 1
+
+    async def publish_after_debounce(self) -> Result[None, RegApiError]:
+        await asyncio.sleep(self.debounce_seconds)
+        keys = self.pending_keys
+        self.pending_keys = set()
+        self.pending = None
+        return await self.publish(keys)
+
+    async def publish(self, keys: set[Regname]) -> Result[None, RegApiError]:
+        if not keys:
+            return Ok(None)
+
+        # Serialized so an older read is never forwarded after a newer one
+        async with self.lock:
+            # Registers are read at send time, so a burst of yanks sends the latest value of each
+            async with asyncio.TaskGroup() as tg:
+                links_task = tg.create_task(self.link_table.links())
+                values_task = tg.create_task(self.registers.get_multiple_registers(list(keys)))
+
+            match links_task.result():
+                case Ok(links):
+                    pass
+                case Err(e):
+                    self.stats.failed += 1
+                    return Err(e.to_reg_error())
+            match values_task.result():
+                case Ok(values):
+                    pass
+                case Err(e):
+                    self.stats.failed += 1
+                    return Err(e.to_reg_error())
+
+            _LOGGER.debug(
+                f"Publishing {len(keys)} registers, "
+                f"{self.stats.coalesced} publishes coalesced so far"
+            )
+            published = {key: values.get(key.value) for key in keys}
+            # Peers echoing this back are recognized and not applied again
+            self.recent_registers.record(published)
+            await self.syncer.forward_sync_multiple(
+                registry="0",
+                visited_registries=[],
+                values=published,
+                links=links,
+            )
+            self.stats.published += 1
+            return Ok(None)
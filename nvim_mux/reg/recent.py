@@ -0,0 +1,69 @@
+import hashlib
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+from reg.api import Regname
+
+TValue = TypeVar("TValue", bound=str | None)
+
+
+def register_digest(value: str | None) -> bytes:
+    if value is None:
+        return b""
+    return hashlib.blake2b(value.encode(errors="surrogatepass"), digest_size=16).digest()
+
+
+# Digests of what each register was last set to or published as, so echoes of a sync that
+# come back around the link graph can be recognized, and only those are checked against nvim
+@dataclass
+class RecentRegisters:
+    window_seconds: float = 5.0
+    digests: dict[Regname, tuple[bytes, float]] = field(default_factory=dict)
+    # Values each register held before its latest one, by when they were replaced
+    superseded: dict[Regname, dict[bytes, float]] = field(default_factory=dict)
+
+    def record(self, values: Mapping[Regname, str | None]) -> None:
+        now = time.monotonic()
+        for regname, value in values.items():
+            digest = register_digest(value)
+            latest = self.digests.get(regname)
+            if latest is not None and latest[0] != digest:
+                older = {
+                    old_digest: replaced_at
+                    for old_digest, replaced_at in self.superseded.get(regname, {}).items()
+                    if now - replaced_at <= self.window_seconds and old_digest != digest
+                }
+                older[latest[0]] = now
+                self.superseded[regname] = older
+            self.digests[regname] = (digest, now)
+
+    def is_recent(self, regname: Regname, value: str | None, now: float) -> bool:
+        recent = self.digests.get(regname)
+        if recent is None:
+            return False
+        digest, recorded_at = recent
+        # nvim can change registers without telling us, so a match only counts for a while
+        return now - recorded_at <= self.window_seconds and digest == register_digest(value)
+
+    def is_superseded(self, regname: Regname, value: str | None, now: float) -> bool:
+        replaced_at = self.superseded.get(regname, {}).get(register_digest(value))
+        return replaced_at is not None and now - replaced_at <= self.window_seconds
+
+    def split_echoes(
+        self, values: Mapping[Regname, TValue]
+    ) -> tuple[dict[Regname, TValue], list[Regname]]:
+        # Echoes of values that have since been replaced are dropped. Echoes of the latest value
+        # are returned separately, since only nvim knows if it still holds them.
+        now = time.monotonic()
+        fresh: dict[Regname, TValue] = {}
+        echoed: list[Regname] = []
+        for regname, value in values.items():
+            if self.is_superseded(regname, value, now):
+                continue
+            if self.is_recent(regname, value, now):
+                echoed.append(regname)
+            else:
+                fresh[regname] = value
+        return fresh, echoed
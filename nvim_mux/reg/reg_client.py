@@ -1,17 +1,61 @@
 from dataclasses import dataclass
+from itertools import count
 
 from reg.api import RegLink, Regname
 from reg.errors import RegApiError
 from result import Err, Ok, Result
 
+from nvim_mux.data import DEFAULT_REG_CHUNK_SIZE
 from nvim_mux.errors import NvimLuaApiError, NvimLuaInvalidResponse
-from nvim_mux.nvim_api import Empty, LinkCounts, VariableValues
+from nvim_mux.nvim_api import (
+    Empty,
+    LinkCounts,
+    RegisterMetadata,
+    RegisterMetadataValues,
+    VariableValues,
+)
 from nvim_mux.nvim_client import NvimClient
 
+# Shared by every client, so concurrent transfers never share a staging slot in lua
+_TRANSFER_IDS = count(1)
+
 
 @dataclass
 class RegClient:
     vim: NvimClient
+    chunk_size: int = DEFAULT_REG_CHUNK_SIZE
+
+    async def stage_large_values(
+        self, values: dict[str, str | list[str]]
+    ) -> Result[dict[str, int], NvimLuaApiError | NvimLuaInvalidResponse]:
+        # Large values go over as separate calls, so other work is interleaved instead of
+        # waiting behind one huge message. They are removed from values and sent by transfer id.
+        staged: dict[str, int] = {}
+        for regname, value in list(values.items()):
+            if not isinstance(value, str) or len(value) <= self.chunk_size:
+                continue
+
+            transfer = next(_TRANSFER_IDS)
+            for offset in range(0, len(value), self.chunk_size):
+                match await self.vim.call_no_error(
+                    "stage_register_chunk",
+                    Empty,
+                    transfer,
+                    value[offset : offset + self.chunk_size],
+                ):
+                    case Ok():
+                        pass
+                    case Err() as err:
+                        await self.discard_staged([transfer, *staged.values()])
+                        return err
+
+            staged[regname] = transfer
+            del values[regname]
+        return Ok(staged)
+
+    async def discard_staged(self, transfers: list[int]) -> None:
+        for transfer in transfers:
+            await self.vim.call_no_error("discard_staged", Empty, transfer)
 
     async def get_all_registers(
         self,
@@ -20,29 +64,58 @@ class RegClient:
             lambda result: result.values if isinstance(result.values, dict) else {}
         )
 
-    async def clear_and_replace_registers(
-        self, values: dict[Regname, str]
-    ) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
-        values_str_keys = {k.value: v for k, v in values.items()}
+    async def get_multiple_registers(
+        self, keys: list[Regname]
+    ) -> Result[dict[str, str], NvimLuaApiError | NvimLuaInvalidResponse]:
         return (
             await self.vim.call_no_error(
-                "clear_and_replace_registers",
-                Empty,
-                values_str_keys,
+                "get_multiple_registers",
+                VariableValues,
+                [key.value for key in keys],
             )
-        ).map(lambda _: None)
+        ).map(lambda result: result.values if isinstance(result.values, dict) else {})
+
+    async def get_register_metadata(
+        self, keys: list[Regname] | None = None
+    ) -> Result[dict[str, RegisterMetadata], NvimLuaApiError | NvimLuaInvalidResponse]:
+        args = [] if keys is None else [[key.value for key in keys]]
+        return (
+            await self.vim.call_no_error("get_register_metadata", RegisterMetadataValues, *args)
+        ).map(lambda result: result.registers)
+
+    async def clear_and_replace_registers(
+        self, values: dict[Regname, str]
+    ) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
+        values_str_keys: dict[str, str | list[str]] = {k.value: v for k, v in values.items()}
+        return await self.set_with_staging("clear_and_replace_registers", values_str_keys)
 
     async def set_multiple_registers(
         self, values: dict[Regname, str | None]
     ) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
-        values_str_keys = {k.value: v if v is not None else [] for k, v in values.items()}
-        return (
-            await self.vim.call_no_error(
-                "set_multiple_registers",
-                Empty,
-                values_str_keys,
-            )
-        ).map(lambda _: None)
+        values_str_keys: dict[str, str | list[str]] = {
+            k.value: v if v is not None else [] for k, v in values.items()
+        }
+        return await self.set_with_staging("set_multiple_registers", values_str_keys)
+
+    async def set_with_staging(
+        self, lua_function: str, values: dict[str, str | list[str]]
+    ) -> Result[None, NvimLuaApiError | NvimLuaInvalidResponse]:
+        match await self.stage_large_values(values):
+            case Ok(staged):
+                pass
+            case Err() as err:
+                return err
+
+        if not staged:
+            return (await self.vim.call_no_error(lua_function, Empty, values)).map(lambda _: None)
+
+        match await self.vim.call_no_error(lua_function, Empty, values, staged):
+            case Ok():
+                return Ok(None)
+            case Err() as err:
+                # lua may have failed before taking the staged values
+                await self.discard_staged(list(staged.values()))
+                return err
 
     async def add_link(
         self, link: RegLink
@@ -68,18 +141,22 @@ class RegClient:
             )
         ).map(lambda _: None)
 
+    async def list_link_counts(
+        self,
+    ) -> Result[dict[str, dict[str, int]], NvimLuaApiError | NvimLuaInvalidResponse]:
+        return (await self.vim.call_no_error("list_reg_links", LinkCounts)).map(
+            lambda result: result.links
+        )
+
     async def list_links(self) -> Result[list[RegLink], NvimLuaApiError | NvimLuaInvalidResponse]:
-        match await self.vim.call_no_error(
-            "list_reg_links",
-            LinkCounts,
-        ):
-            case Ok(result):
+        match await self.list_link_counts():
+            case Ok(link_counts):
                 pass
             case Err() as err:
                 return err
 
         links: list[RegLink] = []
-        for instance, registries in result.links.items():
+        for instance, registries in link_counts.items():
             for registry in registries.keys():
                 links.append(RegLink(instance, registry))
         return Ok(links)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import pathlib
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+
+import jrpc
+from jrpc.client import ClientManager
+from jrpc.service import MethodSet
+from reg.api import AddLinkParams, RegLink, RegMethod, RemoveLinkParams
+
+from .client_pool import PooledClientManager
+from .data import DEFAULT_REG_CHUNK_SIZE, ParentInfo, ParentReg
+from .ext.api import SyncRegistersDownParams
+from .ext.impl import NvimExtensionApiImpl
+from .metrics import (
+    ConnectionCallback,
+    ConnectionStats,
+    StartupTimings,
+    SyncStats,
+    counting_connection_callback,
+)
+from .mux.impl import NvimMuxApiImpl
+from .mux.var_cache import VarCache
+from .nvim_api import Empty
+from .nvim_client import NvimClient
+from .nvim_worker import NvimWorker
+from .recording import TrafficRecorder, recording_connection_callback
+from .reg.impl import NvimRegApiImpl
+
+_LOGGER = logging.getLogger("nvim-mux-server")
+
+# How long shutdown waits for debounced publishes and pushes before cancelling them
+PUBLISH_DRAIN_SECONDS = 1.0
+
+
+@asynccontextmanager
+async def link_to_reg_parent(
+    this_instance: str,
+    reg_clients: ClientManager,
+    parent_reg: ParentReg | None,
+) -> AsyncIterator[None]:
+    if not parent_reg:
+        yield
+        return
+
+    link = RegLink(
+        instance=this_instance,
+        registry="0",
+    )
+
+    # Separate calls, so the pooled connection isn't held for the lifetime of the server
+    async with reg_clients.client(parent_reg.instance) as client:
+        await client.notify(
+            RegMethod.ADD_LINK,
+            AddLinkParams(registry=parent_reg.registry, link=link),
+        )
+    try:
+        yield
+    finally:
+        async with reg_clients.client(parent_reg.instance) as client:
+            await client.notify(
+                RegMethod.REMOVE_LINK,
+                RemoveLinkParams(registry=parent_reg.registry, link=link),
+            )
+
+
+@dataclass
+class MuxServerImpls:
+    mux: NvimMuxApiImpl
+    reg: NvimRegApiImpl
+    ext: NvimExtensionApiImpl
+    var_cache: VarCache
+    connection_stats: ConnectionStats
+    sync_stats: SyncStats
+
+    def method_sets(self) -> list[MethodSet]:
+        return [self.mux.method_set(), self.reg.method_set(), self.ext.method_set()]
+
+
+def make_impls(
+    vim: NvimClient,
+    mux_clients: ClientManager,
+    reg_clients: ClientManager,
+    reg_service_name: str,
+    parent_info: ParentInfo,
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE,
+) -> MuxServerImpls:
+    var_cache = VarCache()
+    connection_stats = ConnectionStats()
+    sync_stats = SyncStats()
+
+    mux_impl = NvimMuxApiImpl(
+        vim=vim,
+        clients=mux_clients,
+        parent_mux=parent_info.parent_mux,
+        var_cache=var_cache,
+    )
+    reg_impl = NvimRegApiImpl(
+        vim=vim,
+        this_instance=reg_service_name,
+        clients=reg_clients,
+        sync_stats=sync_stats,
+        reg_chunk_size=reg_chunk_size,
+    )
+    ext_impl = NvimExtensionApiImpl(
+        vim=vim,
+        this_reg_instance=reg_service_name,
+        mux_clients=mux_clients,
+        reg_clients=reg_clients,
+        parent_info=parent_info,
+        var_cache=var_cache,
+        mux_publisher=mux_impl.publisher,
+        connection_stats=connection_stats,
+        sync_stats=sync_stats,
+        recent_registers=reg_impl.recent_registers,
+        link_table=reg_impl.link_table,
+        reg_chunk_size=reg_chunk_size,
+    )
+
+    return MuxServerImpls(
+        mux=mux_impl,
+        reg=reg_impl,
+        ext=ext_impl,
+        var_cache=var_cache,
+        connection_stats=connection_stats,
+        sync_stats=sync_stats,
+    )
+
+
+async def serve(
+    worker: NvimWorker,
+    router: Any,
+    ready: asyncio.Future[ConnectionCallback],
+    socket_path: pathlib.Path,
+    mux_service_name: str,
+    reg_service_name: str,
+    term_future: asyncio.Future[int],
+    parent_info: ParentInfo,
+    record_path: pathlib.Path | None,
+    timings: StartupTimings,
+    reg_chunk_size: int = DEFAULT_REG_CHUNK_SIZE,
+) -> int:
+    vim = NvimClient(worker, logging.DEBUG)
+
+    recorder: TrafficRecorder | None = None
+    if record_path is not None:
+        _LOGGER.warning(f"Recording traffic to {record_path}")
+        recorder = TrafficRecorder(record_path)
+        vim.recorder = recorder
+
+    # Connections to the parent mux, parent reg and linked registries are kept open and reused
+    mux_clients = PooledClientManager(router.service_oneoff_factory)
+    reg_clients = PooledClientManager(router.service_oneoff_factory)
+
+    impls = make_impls(
+        vim=vim,
+        mux_clients=mux_clients,
+        reg_clients=reg_clients,
+        reg_service_name=reg_service_name,
+        parent_info=parent_info,
+        reg_chunk_size=reg_chunk_size,
+    )
+    mux_impl, ext_impl = impls.mux, impls.ext
+
+    connection_callback = counting_connection_callback(
+        jrpc.connection.client_connected_callback(*impls.method_sets()),
+        impls.connection_stats,
+    )
+    if recorder is not None:
+        connection_callback = recording_connection_callback(connection_callback, recorder)
+
+    # Connections accepted while starting up have been waiting on this
+    ready.set_result(connection_callback)
+    timings.mark("accepting")
+
+    try:
+        async with (
+            router,
+            mux_clients,
+            reg_clients,
+            router.active_service(mux_service_name, str(socket_path)),
+            router.active_service(reg_service_name, str(socket_path)),
+            link_to_reg_parent(reg_service_name, reg_clients, parent_info.parent_reg),
+        ):
+            # TODO less hacky way of initial publish / sync
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(mux_impl.publish())
+                    tg.create_task(ext_impl.sync_registers_down(SyncRegistersDownParams()))
+                    tg.create_task(
+                        timings.timed("mark_loaded", vim.call_no_error("mark_loaded", Empty))
+                    )
+            except BaseExceptionGroup as group:
+                # Callers get the error itself, as they did when these ran one after another
+                raise group.exceptions[0]
+            timings.mark("loaded")
+
+            _LOGGER.info(f"Server started, {timings.summary()}")
+            try:
+                await term_future
+            finally:
+                # The last debounced publishes and pushes still need the clients, which close below
+                await asyncio.gather(
+                    mux_impl.publisher.background.drain(PUBLISH_DRAIN_SECONDS),
+                    ext_impl.reg_publisher.background.drain(PUBLISH_DRAIN_SECONDS),
+                    ext_impl.subscriptions.background.drain(PUBLISH_DRAIN_SECONDS),
+                )
+            return term_future.result()
+    finally:
+        if recorder is not None:
+            recorder.close()